@@ -6,155 +6,86 @@ import streamlit as st
 from streamlit_autorefresh import st_autorefresh
 import pandas as pd
 
-# Read stocks
-import yfinance as yf
-
 # For plotting
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-# To calculate TAs
-import talib as ta
+# Range breaks, bar colours and downsampling
+import chart_prep
 
-from datetime import datetime
+# Dashboard DB
+from repository import Repository, create_engine, DB
 
-from sqlalchemy import create_engine
-from sqlalchemy.sql import text
+# History table and cache
+from history_store import HistoryStore
+# Refreshes stale data when the refresh worker isn't running
+from refresher import Refresher
+# Info, history and earnings
+from data_access import DataAccess, TICKERS, REFRESH_INTERVAL
 
 # End of imports ----------------------------------------------------
 
 # Constants ---------------------------------------------------------
 
 MARGIN = dict(l=0,r=10,b=10,t=25)
-TICKERS = ['MSFT', 'AAPL', 'GOOG']
+# Max points plotted; longer ranges are downsampled (LTTB)
+MAX_POINTS = 1000
+# Seconds after which the page refreshes the data itself, i.e. the refresh worker isn't running
+STALE_AGE = 3 * REFRESH_INTERVAL
 
 # End of Constants ---------------------------------------------------------
 
 st.set_page_config(layout='wide', page_title='Stock Dashboard', page_icon=':dollar:')
 
 # update every 5 mins
-st_autorefresh(interval=5 * 60 * 1000, key="dataframerefresh")
+st_autorefresh(interval=REFRESH_INTERVAL * 1000, key="dataframerefresh")
+
+@st.cache_resource
+def get_repository():
+    """
+    Repository shared by all the sessions; the DB is migrated when it's created
+    :return Repository object
+    """
+    return Repository(create_engine(DB))
+
+@st.cache_resource
+def get_history_store():
+    """
+    History store shared by all the sessions; caches the history of each ticker in memory
+    :return HistoryStore object
+    """
+    return HistoryStore(get_repository())
+
+@st.cache_resource
+def get_data_access():
+    """
+    Data access shared by all the sessions; caches the info and earnings
+    :return DataAccess object
+    """
+    return DataAccess(get_repository())
+
+@st.cache_resource
+def get_refresher():
+    """
+    Refresher for the data the refresh worker (refresher.py) didn't refresh
+    :return Refresher object
+    """
+    return Refresher(get_repository())
 
 # Store the DB in a session
-db = 'sqlite:///db/stock_data.db'
-engine = create_engine(db, echo=False)
-st.session_state.engine = engine
-
-def read_yf(yf_data, start_date):
-    # print('Start date: {}'.format(start_date))
-    df = pd.DataFrame()
-    try:
-        df = yf_data.history(start=start_date)[['Open', 'Close', 'Volume']]
-    except Exception as e:
-        print("The error is: ", e)
-    if not df.empty:
-        # Create a Date column
-        df['Date'] = df.index.date
-        # Drop the Date as index
-        df.reset_index(drop=True, inplace=True)
-        # Added extra columns
-        df['Ticker'] = st.session_state.ticker
-        df['Refreshed Date'] = datetime.now()
-    return df
-
-def full_history_load():
-    with engine.connect() as conn:
-        df = pd.read_sql('SELECT * FROM history WHERE Ticker=(:tk)',
-                         params=dict(tk=st.session_state.ticker),
-                         con=conn, parse_dates={"Date"})
-        return df
-
-def load_history_data(yf_data):
+st.session_state.engine = get_repository().engine
+
+# Store the data access in the session for the other pages
+data = get_data_access()
+st.session_state.data = data
+
+def load_history_data(ticker):
     """
-    Loads hostory data
-    :param yf_data: YF object to read history data
-    :return history data as a DataFrame for the current ticker
+    Loads history data with the MAs; only the new bars are read from the DB
+    :param ticker: ticker symbol
+    :return history data as a DataFrame for the ticker
     """
-    # Any existing recrods in the DB for the ticker?
-    with engine.connect() as conn:
-        res = conn.execute(text('SELECT MAX(Date) FROM history WHERE Ticker = :tk'),
-                           {'tk' : ticker}).fetchone()
-
-    # print('Start date: {}'.format(res))
-    # print(type(res))
-    start_date = res[0]
-
-    if start_date == None:
-        # No history data found; set the start date to two years ago
-        print('no history found; reading full 2 years of data')
-        start_date = datetime.now() + pd.DateOffset(years=-2)
-        # Read YF data
-        df_full = read_yf(yf_data, start_date)
-        if not df_full.empty:
-            with engine.connect() as conn:
-                # Save YF data to the sql table
-                df_full.to_sql("history", conn, if_exists="append", index=False)
-                
-        # Load agin from the DB to ensure that dates are parsed correctly
-        df = full_history_load()
-        print('Size of df full is {}'.format(len(df)))
-    else:
-        # Found in the history; set the start to the latest date to get the delta
-        print('Start date for delete is: {}'.format(start_date))
-        # Read YF data stating from the latest date in the db
-        df_delta = read_yf(yf_data, start_date)
-        if not df_delta.empty:
-            # We also need to delete the latest existing record as delta has the most recent info
-            sql = '''
-                DELETE FROM history WHERE Date=(:dt) AND Ticker=(:tk)
-            '''
-            with engine.connect() as conn:
-                rc = conn.execute(text(sql), {'dt' : start_date, 'tk' : ticker}).rowcount
-                # print("deleted {}".format(rc))
-                conn.commit()
-
-            with engine.connect() as conn:
-                # Save the delta to the table
-                df_delta.to_sql("history", conn, if_exists="append", index=False)
-
-        # Check the history in the cache
-        if "history" in st.session_state:
-            # Cache copy exists but may not have records for the selected ticker
-            df = st.session_state.history
-            df = df[df.Ticker == st.session_state.ticker]
-            if df.empty:
-                print('Cache is empty, full load from the database')
-                # Load from the DB as there are no existing records for the selected ticker
-                df = full_history_load()
-            else:
-                print("Using the cache")
-            # Remove the latest entry from the df
-            df = df[:-1]
-
-            # Read delta records from the DB; this will ensure that dates are parsed correctly
-            sql = '''
-                SELECT * FROM history WHERE Ticker = (:tk) AND Date = (:dt)
-            '''
-            with engine.connect() as conn:
-                df_delta = pd.read_sql(text(sql), params=dict(tk=st.session_state.ticker, dt=start_date),
-                                 con = conn, parse_dates={"Date"})
-
-            print('Using delta records')
-
-            # Concatenate the df in memory with delta df
-            df = pd.concat([df, df_delta], axis=0)
-            df.reset_index(drop=True, inplace=True)
-        else:
-            print('No cache found, full load from the database')
-            df = full_history_load()
-
-    # Calculate the MAs for graphs
-    df['SMA-50'] = ta.SMA(df['Close'],timeperiod=50)
-    df['SMA-200'] = ta.SMA(df['Close'], timeperiod =200)
-    st.session_state.history = df
-
-def date_breaks():
-    # build complete timeline from start date to end date
-    dt_all = pd.date_range(start=df.iloc[0]['Date'], end=df.iloc[-1]['Date'])
-    # retrieve the dates that are in the original datset
-    dt_obs = [d.strftime("%Y-%m-%d") for d in pd.to_datetime(df['Date'])]
-    # define dates with missing values
-    return [d for d in dt_all.strftime("%Y-%m-%d").tolist() if not d in dt_obs]
+    return get_history_store().load(ticker)
 
 def format_number(number):
     """
@@ -178,13 +109,17 @@ selected_range = st.sidebar.selectbox(
     'Select Period', options=['1m', '6m', 'YTD', '1y', 'all']
 )
 
-# YF object to read financial data
-yf_data = yf.Ticker(ticker)
+# The pages only read; the data is refreshed by the refresh worker. When it's not running, the stale data is
+# refreshed here - claimed like the worker's refreshes, so it's never refreshed twice at a time.
+refresher = get_refresher()
+refresher.refresh_info(max_age=STALE_AGE)
+refresher.refresh_history(ticker, max_age=STALE_AGE)
 
-# Load the histori data into 'history' session object
-load_history_data(yf_data)
+# Info of the ticker; cached for a minute
+info = data.info(ticker)
 
-df_history = st.session_state.history
+# Load the history data
+df_history = load_history_data(ticker)
 
 min_date = df_history.iloc[0]['Date']
 max_date = df_history.iloc[-1]['Date']
@@ -214,70 +149,74 @@ match selected_range:
 df = df_history[(df_history['Date'] >= start_date) & (df_history['Date'] <= end_date)]
 
 # Subheader with company name and symbol
-st.session_state.page_subheader = '{0} ({1})'.format(yf_data.info['shortName'], yf_data.info['symbol'])
+st.session_state.page_subheader = '{0} ({1})'.format(info['shortName'], info['symbol'])
 st.subheader(st.session_state.page_subheader)
+refreshed = get_repository().read_status(ticker, 'history')
+if refreshed is not None:
+    st.caption('Refreshed at {}'.format(refreshed.strftime('%d %b %Y %H:%M')))
 st.divider()
 
-price_change = yf_data.info['currentPrice'] - yf_data.info['previousClose']
-price_change_ratio = (abs(price_change) / yf_data.info['previousClose'] * 100)
+price_change = info['currentPrice'] - info['previousClose']
+price_change_ratio = (abs(price_change) / info['previousClose'] * 100)
 price_change_direction = lambda i: ("+" if i > 0 else "-")
 
-st.metric(label='Current', value=round(yf_data.info['currentPrice'], 2), delta="{:.2f} ({}{:.2f}%)".format(
+st.metric(label='Current', value=round(info['currentPrice'], 2), delta="{:.2f} ({}{:.2f}%)".format(
     price_change, price_change_direction(price_change), price_change_ratio))
 col1, col2, col3, col4, col5, col6 = st.columns([1,1,1,1,1,4.5])
 with col1:
     st.text('Previous Close')
-    st.text(yf_data.info['previousClose'])
+    st.text(info['previousClose'])
     st.divider()
     st.text('EPS (TTM)')
-    st.text(yf_data.info['trailingEps'])
+    st.text(info['trailingEps'])
     st.divider()
     st.text('Bid')
-    st.text('{0:.2f} x {1}'.format(yf_data.info['bid'], yf_data.info['bidSize']))
+    st.text('{0:.2f} x {1}'.format(info['bid'], info['bidSize']))
     st.divider()
     st.text('Beta')
-    st.text('{:.2f}'.format(yf_data.info['beta']))
+    st.text('{:.2f}'.format(info['beta']))
 with col2:
     st.text('Open')
-    st.text(yf_data.info['open'])
+    st.text(info['open'])
     st.divider()
     st.text('Fwd Div & Yield')
-    if 'dividendRate' in yf_data.info:
-        st.text('{0} ({1:.2f})%'.format(yf_data.info['dividendRate'], yf_data.info['dividendYield'] * 100))
+    if 'dividendRate' in info:
+        st.text('{0} ({1:.2f})%'.format(info['dividendRate'], info['dividendYield'] * 100))
     else:
         st.text('NA')
     st.divider()
     st.text('Ask')
-    st.text('{0:.2f} x {1}'.format(yf_data.info['ask'], yf_data.info['askSize']))
+    st.text('{0:.2f} x {1}'.format(info['ask'], info['askSize']))
     st.divider()
     st.text('Market Cap')
-    st.text(format_number(yf_data.info['marketCap']))
+    st.text(format_number(info['marketCap']))
 with col3:
     st.text('Day\'s Range')
-    st.text('{0} - {1}'.format(yf_data.info['dayLow'], yf_data.info['dayHigh']))
+    st.text('{0} - {1}'.format(info['dayLow'], info['dayHigh']))
     st.divider()
     st.text('PE Ratio (TTM)')
-    st.text('{0:.2f}'.format(yf_data.info['trailingPE']))
+    st.text('{0:.2f}'.format(info['trailingPE']))
     st.divider()
     st.text('Average Volume')
-    st.text('{:,}'.format(yf_data.info['averageVolume']))
+    st.text('{:,}'.format(info['averageVolume']))
     st.divider()
     st.text('200-Day Average')
-    st.text('{0:.2f}'.format(yf_data.info['twoHundredDayAverage']))
+    st.text('{0:.2f}'.format(info['twoHundredDayAverage']))
 with col4:
     st.text('52-Week Range')
-    st.text('{0:.2f} - {1:.2f}'.format(yf_data.info['fiftyTwoWeekLow'], yf_data.info['fiftyTwoWeekHigh']))
+    st.text('{0:.2f} - {1:.2f}'.format(info['fiftyTwoWeekLow'], info['fiftyTwoWeekHigh']))
     st.divider()
     st.text('Volume')
-    st.text('{:,}'.format(yf_data.info['volume']))
+    st.text('{:,}'.format(info['volume']))
     st.divider()
     st.text('50-Day Average')
-    st.text('{0:.2f}'.format(yf_data.info['fiftyDayAverage']))
+    st.text('{0:.2f}'.format(info['fiftyDayAverage']))
 with col6:
     # Construct a 2 x 1 Plotly figure for MA and Volume charts
     fig = make_subplots(rows=2, cols=1, vertical_spacing=0.01, shared_xaxes=True)
-    # Remove dates without values
-    fig.update_xaxes(rangebreaks=[dict(values=date_breaks())])
+    # Remove dates without values; from all the dates in the range, before downsampling
+    fig.update_xaxes(rangebreaks=chart_prep.range_breaks(df['Date']))
+    df = chart_prep.downsample(df, MAX_POINTS)
 
     # Plot the Price chart
     fig.add_trace(go.Scatter(x=df['Date'], y=df['Close'], name='Price', marker_color='#C39BD3'),
@@ -292,8 +231,7 @@ with col6:
         fig.add_trace(go.Scatter(x=df['Date'], y=df[ma], name=ma, marker_color=col))
 
     # Colours for the Bar chart
-    colors = ['#B03A2E' if row['Open'] - row['Close'] >= 0 
-        else '#27AE60' for index, row in df.iterrows()]
+    colors = chart_prep.bar_colors(df)
     
     # Adds the volume as a bar chart
     fig.add_trace(go.Bar(x=df['Date'], y=df['Volume'], showlegend=False, marker_color=colors), row=2, col=1)
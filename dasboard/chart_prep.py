@@ -0,0 +1,119 @@
+"""
+Chart preparation shared by the dashboard and the TA notebooks (yf_ta_part2.ipynb) - range breaks for the
+dates without bars, volume bar colours, MA overlays and LTTB downsampling. All of them are array operations,
+no loops over the rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+# Colours for the volume bars; down when Open >= Close
+DOWN_COLOR = '#B03A2E'
+UP_COLOR = '#27AE60'
+
+# End of Constants ---------------------------------------------------------
+
+def _dates(dates):
+    """
+    Returns the dates as a DatetimeIndex without the time and timezone
+    """
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates.normalize()
+
+def date_breaks(dates):
+    """
+    Returns the dates without values between the first and last dates
+    :param dates: dates of the bars, e.g. df['Date']
+    :return list of dates formatted as YYYY-MM-DD
+    """
+    dates = _dates(dates)
+    if dates.empty:
+        return []
+    # build complete timeline from start date to end date and remove the dates in the dataset
+    dt_all = pd.date_range(start=dates.min(), end=dates.max())
+    return dt_all.difference(dates).strftime('%Y-%m-%d').tolist()
+
+def range_breaks(dates):
+    """
+    Returns the Plotly range breaks to remove the dates without values; the weekends are a single bound so
+    only the holidays are listed
+    :param dates: dates of the bars, e.g. df['Date']
+    :return list of range breaks for fig.update_xaxes(rangebreaks=...)
+    """
+    dates = _dates(dates)
+    if dates.empty:
+        return []
+    if (dates.dayofweek >= 5).any():
+        # Weekend bars, e.g. crypto; list all the missing dates
+        return [dict(values=date_breaks(dates))]
+    dt_all = pd.date_range(start=dates.min(), end=dates.max(), freq='B')
+    return [dict(bounds=['sat', 'mon']), dict(values=dt_all.difference(dates).strftime('%Y-%m-%d').tolist())]
+
+def bar_colors(df, down_color=DOWN_COLOR, up_color=UP_COLOR):
+    """
+    Returns the colours for the volume bars
+    :param df: bars with the Open and Close columns
+    :param down_color: colour when Open >= Close
+    :param up_color: colour when Open < Close
+    :return array of colours
+    """
+    return np.where(df['Open'].to_numpy() - df['Close'].to_numpy() >= 0, down_color, up_color)
+
+def moving_averages(close, periods=(50, 200)):
+    """
+    Returns the simple moving averages; NaN until there are enough values, same as ta.SMA
+    :param close: close prices as a Series
+    :param periods: MA periods
+    :return dictionary of name (e.g. SMA-50) -> MA as a Series
+    """
+    return {'SMA-{}'.format(period): close.rolling(period).mean() for period in periods}
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling; keeps the points that preserve the shape of the series
+    :param x: x values as numbers, e.g. dates as int64
+    :param y: y values
+    :param threshold: number of points to keep
+    :return indices of the points to keep
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold is None or threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # The first and last points are always kept; the rest are split into buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket; the last point for the last bucket
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # Point of the bucket with the largest triangle with the previous point and the next average
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+def downsample(df, threshold, x='Date', y='Close'):
+    """
+    Downsamples the rows of a DF with LTTB on a column; the other columns (MAs, volume) use the same rows
+    :param df: bars in date order
+    :param threshold: number of rows to keep; no downsampling if None
+    :param x: date column
+    :param y: column to preserve the shape of
+    :return DF with at most threshold rows
+    """
+    if threshold is None or len(df) <= threshold:
+        return df
+    x_values = pd.DatetimeIndex(df[x]).asi8
+    return df.iloc[lttb(x_values, df[y].to_numpy(), threshold)]
@@ -0,0 +1,193 @@
+"""
+Data access for the dashboard - the providers of the info and history (YF or local fixtures) used by the
+refresh worker, and the info and earnings read from the DB by the pages. The info of all the tickers is read
+in one batch and cached; the earnings are cached per ticker.
+
+To save fixtures for offline use (set DASHBOARD_FIXTURES to the folder to use them):
+python data_access.py --save fixtures
+"""
+
+import os
+import json
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# TTL caches
+from cachetools import TTLCache
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+TICKERS = ['MSFT', 'AAPL', 'GOOG']
+# Dashboard refresh interval in seconds; the refresh worker fetches the info and history at this interval
+REFRESH_INTERVAL = 5 * 60
+# Seconds to cache the info read from the DB
+INFO_TTL = 60
+# Earnings only change when utils/insert_earnings.py is run
+EARNINGS_TTL = 60 * 60
+# The earnings are read into Arrow-backed DFs
+DTYPE_BACKEND = 'pyarrow'
+# Folder with the fixtures; the YF provider is used if not set
+FIXTURES = os.environ.get('DASHBOARD_FIXTURES')
+
+# End of Constants ---------------------------------------------------------
+
+class YFProvider:
+    """
+    Reads the info and history from YF
+    """
+    def info(self, tickers):
+        """
+        Reads the info of the tickers concurrently
+        :param tickers: list of ticker symbols
+        :return dictionary of ticker -> info
+        """
+        # Only needed for the YF provider
+        import yfinance as yf
+
+        yf_tickers = yf.Tickers(' '.join(tickers)).tickers
+        with ThreadPoolExecutor(max_workers=len(tickers)) as executor:
+            infos = executor.map(lambda ticker: yf_tickers[ticker].info, tickers)
+            return dict(zip(tickers, infos))
+
+    def history(self, ticker, start_date):
+        """
+        Reads the bars of a ticker
+        :param ticker: ticker symbol
+        :param start_date: date of the first bar
+        :return bars as a DataFrame; empty if the read fails
+        """
+        import yfinance as yf
+
+        # print('Start date: {}'.format(start_date))
+        df = pd.DataFrame()
+        try:
+            df = yf.Ticker(ticker).history(start=start_date)[['Open', 'Close', 'Volume']]
+        except Exception as e:
+            print("The error is: ", e)
+        if not df.empty:
+            # Create a Date column
+            df['Date'] = df.index.date
+            # Drop the Date as index
+            df.reset_index(drop=True, inplace=True)
+            # Added extra columns
+            df['Ticker'] = ticker
+            df['Refreshed Date'] = datetime.now()
+        return df
+
+class FixtureProvider:
+    """
+    Reads the info and history from local files - info.json (ticker -> info) and history/<ticker>.csv
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def info(self, tickers):
+        with open(self.path / 'info.json') as fp:
+            infos = json.load(fp)
+        return {ticker: infos[ticker] for ticker in tickers}
+
+    def history(self, ticker, start_date):
+        file = self.path / 'history' / '{}.csv'.format(ticker)
+        if not file.exists():
+            return pd.DataFrame()
+        df = pd.read_csv(file, parse_dates=['Date'])
+        df = df[df['Date'] >= pd.Timestamp(start_date).normalize()].reset_index(drop=True)
+        df = df[['Open', 'Close', 'Volume', 'Date']]
+        df['Date'] = df['Date'].dt.date
+        df['Ticker'] = ticker
+        df['Refreshed Date'] = datetime.now()
+        return df
+
+    def save(self, provider, tickers, start_date):
+        """
+        Saves the info and history read from another provider as fixtures
+        :param provider: provider to read from, e.g. YFProvider
+        :param tickers: list of ticker symbols
+        :param start_date: date of the first bar
+        """
+        (self.path / 'history').mkdir(parents=True, exist_ok=True)
+        with open(self.path / 'info.json', 'w') as fp:
+            json.dump(provider.info(tickers), fp, indent=2, default=str)
+        for ticker in tickers:
+            df = provider.history(ticker, start_date)
+            df[['Date', 'Open', 'Close', 'Volume']].to_csv(self.path / 'history' / '{}.csv'.format(ticker),
+                                                           index=False)
+
+def get_provider():
+    """
+    Returns the provider; fixtures if DASHBOARD_FIXTURES is set, YF otherwise
+    """
+    return FixtureProvider(FIXTURES) if FIXTURES else YFProvider()
+
+class DataAccess:
+    def __init__(self, repository, tickers=TICKERS, info_ttl=INFO_TTL, earnings_ttl=EARNINGS_TTL):
+        """
+        Data access shared by the pages and sessions; the pages only read, the data is refreshed by the
+        refresh worker (see refresher.py)
+        :param repository: Repository for the dashboard DB
+        :param tickers: tickers read together
+        :param info_ttl: seconds to cache the info
+        :param earnings_ttl: seconds to cache the earnings of a ticker
+        """
+        self.repository = repository
+        self.tickers = list(tickers)
+        self.infos = TTLCache(maxsize=1, ttl=info_ttl)
+        self.earnings_cache = TTLCache(maxsize=len(self.tickers) * 4, ttl=earnings_ttl)
+        self.lock = threading.Lock()
+
+    def info(self, ticker):
+        """
+        Returns the info of a ticker; the info of all the tickers are read together when it expires
+        :param ticker: ticker symbol
+        :return info as a dictionary; None if the info was never refreshed
+        """
+        with self.lock:
+            infos = self.infos.get('all')
+            if infos is None or ticker not in infos:
+                tickers = self.tickers if ticker in self.tickers else self.tickers + [ticker]
+                infos = self.infos['all'] = self.repository.read_info(tickers)
+        return infos.get(ticker)
+
+    def earnings(self, ticker):
+        """
+        Returns the annual and quarterly earnings of a ticker; cached per ticker. The columns are Arrow-backed
+        and the DFs are shared by the sessions, so use assign, drop etc rather than changing them.
+        :param ticker: ticker symbol
+        :return tuple of annual and quarterly earnings DFs
+        """
+        with self.lock:
+            cached = self.earnings_cache.get(ticker)
+        if cached is None:
+            cached = self.repository.read_earnings(ticker, dtype_backend=DTYPE_BACKEND)
+            with self.lock:
+                self.earnings_cache[ticker] = cached
+        return cached
+
+    def clear(self):
+        """
+        Clears the cached info and earnings
+        """
+        with self.lock:
+            self.infos.clear()
+            self.earnings_cache.clear()
+
+if __name__ == "__main__":
+    # Initialize parser
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--save', '-s', type=str, required=True, help='Folder to save the fixtures')
+    parser.add_argument('--ticker', '-t', type=str, nargs='*', default=TICKERS, help='Tickers')
+    parser.add_argument('--years', '-y', type=int, default=2, help='Years of history')
+
+    # Read arguments from command line
+    args = parser.parse_args()
+    FixtureProvider(args.save).save(YFProvider(), args.ticker,
+                                    datetime.now() + pd.DateOffset(years=-args.years))
+    print('Saved fixtures to {0}'.format(args.save))
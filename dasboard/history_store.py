@@ -0,0 +1,57 @@
+"""
+Price history cache for the dashboard - the history of each ticker is read from the DB (see repository.py)
+once and cached in-process, shared by all the sessions; a load only reads the bars added by the refresh
+worker (see refresher.py) since the last load. The indicators (see indicators.py) are read with the history.
+"""
+
+import threading
+
+import pandas as pd
+
+# End of imports ----------------------------------------------------
+
+class HistoryStore:
+    def __init__(self, repository, with_indicators=True):
+        """
+        :param repository: Repository for the dashboard DB
+        :param with_indicators: true to read the indicators with the history
+        """
+        self.repository = repository
+        self.with_indicators = with_indicators
+        # ticker -> history DF
+        self.frames = {}
+        # ticker -> lock, so only one session reads a ticker at a time
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def read(self, ticker, since=None):
+        """
+        Reads the history of a ticker with the indicators
+        :param ticker: ticker symbol
+        :param since: only the bars on or after this date; all the bars if None
+        :return history as a DF in date order
+        """
+        return self.repository.read_history(ticker, since=since, with_indicators=self.with_indicators)
+
+    def _ticker_lock(self, ticker):
+        with self.lock:
+            return self.locks.setdefault(ticker, threading.Lock())
+
+    def load(self, ticker):
+        """
+        Returns the history of a ticker; only the bars from the latest cached date are read from the DB, the
+        rest comes from the cache. The returned DF is shared, don't change it.
+        :param ticker: ticker symbol
+        :return history as a DF in date order
+        """
+        with self._ticker_lock(ticker):
+            cached = self.frames.get(ticker)
+            if cached is None or cached.empty:
+                df = self.read(ticker)
+            else:
+                # The latest bar may have been updated; replace it and append the new bars
+                last_date = cached['Date'].iloc[-1]
+                df_delta = self.read(ticker, since=last_date)
+                df = pd.concat([cached[cached['Date'] < last_date], df_delta], ignore_index=True)
+            self.frames[ticker] = df
+            return df
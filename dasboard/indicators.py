@@ -0,0 +1,265 @@
+"""
+Technical indicators saved alongside the price history - SMA, EMA, RSI (Wilder), Bollinger Bands and MACD.
+The state of each indicator (rolling windows with their running sums, EMA values and RSI averages) is saved
+with the indicators, so a new bar is an O(1) update instead of a recompute over the full history.
+"""
+
+import json
+import math
+from collections import deque
+
+import pandas as pd
+
+from sqlalchemy.sql import text
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+SMA_PERIODS = (50, 200)
+EMA_PERIODS = (20,)
+RSI_PERIOD = 14
+# Period and number of standard deviations for the Bollinger Bands
+BB_PERIOD = 20
+BB_DEV = 2
+# Fast, slow and signal periods for MACD
+MACD_PERIODS = (12, 26, 9)
+
+# Indicator columns
+COLUMNS = (['SMA-{}'.format(period) for period in SMA_PERIODS] + ['EMA-{}'.format(period) for period in EMA_PERIODS]
+           + ['RSI-{}'.format(RSI_PERIOD), 'BB Upper', 'BB Middle', 'BB Lower', 'MACD', 'MACD Signal', 'MACD Hist'])
+
+UPSERT_INDICATORS = '''
+    INSERT INTO indicators ("Ticker", "Date", {0})
+    VALUES (:Ticker, :Date, {1})
+    ON CONFLICT ("Ticker", "Date") DO UPDATE SET {2}
+'''.format(', '.join('"{}"'.format(column) for column in COLUMNS),
+           ', '.join(':p{}'.format(i) for i in range(len(COLUMNS))),
+           ', '.join('"{0}" = excluded."{0}"'.format(column) for column in COLUMNS))
+
+UPSERT_STATE = '''
+    INSERT INTO indicator_state ("Ticker", "Date", "State") VALUES (:Ticker, :Date, :State)
+    ON CONFLICT ("Ticker") DO UPDATE SET "Date" = excluded."Date", "State" = excluded."State"
+'''
+
+# End of Constants ---------------------------------------------------------
+
+class Rolling:
+    def __init__(self, period, values=()):
+        """
+        Rolling window with the running sum and sum of squares
+        :param period: window size
+        :param values: values in the window, oldest first
+        """
+        self.period = period
+        self.values = deque(values, maxlen=period)
+        # Summed again when loaded, so any rounding errors don't carry over
+        self.total = math.fsum(self.values)
+        self.squares = math.fsum(value * value for value in self.values)
+
+    def add(self, value):
+        if len(self.values) == self.period:
+            old = self.values[0]
+            self.total -= old
+            self.squares -= old * old
+        self.values.append(value)
+        self.total += value
+        self.squares += value * value
+
+    def mean(self):
+        return self.total / self.period if len(self.values) == self.period else math.nan
+
+    def std(self):
+        """
+        Population standard deviation, same as ta.BBANDS
+        """
+        if len(self.values) < self.period:
+            return math.nan
+        mean = self.total / self.period
+        return math.sqrt(max(self.squares / self.period - mean * mean, 0.0))
+
+    def to_dict(self):
+        return {'period': self.period, 'values': list(self.values)}
+
+class EMA:
+    def __init__(self, period, value=None, seed=()):
+        """
+        Exponential moving average; seeded with the SMA of the first values, same as ta.EMA
+        :param period: EMA period
+        :param value: current EMA or None until there are enough values
+        :param seed: values for the seed
+        """
+        self.period = period
+        self.alpha = 2 / (period + 1)
+        self.value = value
+        self.seed = list(seed)
+
+    def add(self, value):
+        if self.value is None:
+            self.seed.append(value)
+            if len(self.seed) == self.period:
+                self.value = math.fsum(self.seed) / self.period
+                self.seed = []
+        else:
+            self.value += self.alpha * (value - self.value)
+        return math.nan if self.value is None else self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'value': self.value, 'seed': self.seed}
+
+class RSI:
+    def __init__(self, period, prev=None, count=0, avg_gain=0.0, avg_loss=0.0):
+        """
+        Wilder's RSI; the averages are simple averages until there are enough changes, same as ta.RSI
+        :param period: RSI period
+        :param prev: previous close
+        :param count: number of changes so far
+        :param avg_gain: average gain (the sum of the gains until there are enough changes)
+        :param avg_loss: average loss (the sum of the losses until there are enough changes)
+        """
+        self.period = period
+        self.prev = prev
+        self.count = count
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+
+    def add(self, close):
+        prev, self.prev = self.prev, close
+        if prev is None:
+            return math.nan
+        change = close - prev
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        self.count += 1
+        if self.count < self.period:
+            self.avg_gain += gain
+            self.avg_loss += loss
+            return math.nan
+        if self.count == self.period:
+            self.avg_gain = (self.avg_gain + gain) / self.period
+            self.avg_loss = (self.avg_loss + loss) / self.period
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        if self.avg_loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+    def to_dict(self):
+        return {'period': self.period, 'prev': self.prev, 'count': self.count, 'avg_gain': self.avg_gain,
+                'avg_loss': self.avg_loss}
+
+class Indicators:
+    def __init__(self, state=None):
+        """
+        All the indicators of a ticker
+        :param state: state saved by to_dict; new indicators if None
+        """
+        self.smas = [Rolling(**sma) for sma in state['smas']] if state else [Rolling(p) for p in SMA_PERIODS]
+        self.emas = [EMA(**ema) for ema in state['emas']] if state else [EMA(p) for p in EMA_PERIODS]
+        self.rsi = RSI(**state['rsi']) if state else RSI(RSI_PERIOD)
+        self.bbands = Rolling(**state['bbands']) if state else Rolling(BB_PERIOD)
+        fast, slow, signal = MACD_PERIODS
+        self.macd = [EMA(**ema) for ema in state['macd']] if state else [EMA(fast), EMA(slow), EMA(signal)]
+
+    def add(self, close):
+        """
+        Adds a bar
+        :param close: close price
+        :return list of the indicator values in the order of COLUMNS
+        """
+        row = []
+        for sma in self.smas:
+            sma.add(close)
+            row.append(sma.mean())
+        row.extend(ema.add(close) for ema in self.emas)
+        row.append(self.rsi.add(close))
+
+        self.bbands.add(close)
+        middle, std = self.bbands.mean(), self.bbands.std()
+        row.extend([middle + BB_DEV * std, middle, middle - BB_DEV * std])
+
+        fast, slow, signal = self.macd
+        fast_ema, slow_ema = fast.add(close), slow.add(close)
+        macd = fast_ema - slow_ema
+        # The signal starts once there is a MACD value
+        macd_signal = math.nan if math.isnan(macd) else signal.add(macd)
+        row.extend([macd, macd_signal, macd - macd_signal])
+        return row
+
+    def to_dict(self):
+        return {'smas': [sma.to_dict() for sma in self.smas], 'emas': [ema.to_dict() for ema in self.emas],
+                'rsi': self.rsi.to_dict(), 'bbands': self.bbands.to_dict(),
+                'macd': [ema.to_dict() for ema in self.macd]}
+
+def _value(value):
+    # NaN is saved as NULL
+    return None if math.isnan(value) else value
+
+class IndicatorStore:
+    def __init__(self, engine):
+        """
+        Indicators table and the state of the indicators for each ticker; the tables are created by
+        repository.py with the history table
+        :param engine: SQLAlchemy engine for the dashboard DB
+        """
+        self.engine = engine
+
+    def update(self, ticker, conn=None):
+        """
+        Updates the indicators with the bars added since the last update. The state is saved as of the
+        bar before the latest bar, as the latest bar is updated until the day closes.
+        :param ticker: ticker symbol
+        :param conn: connection of a transaction to write in, e.g. the one that saved the bars, so the bars
+            are never read without their indicators; a new transaction if None
+        :return number of bars added
+        """
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.update(ticker, conn)
+        res = conn.execute(text('SELECT "Date", "State" FROM indicator_state WHERE "Ticker" = :tk'),
+                           {'tk': ticker}).fetchone()
+        state_date, state = (res[0], json.loads(res[1])) if res else ('', None)
+        bars = conn.execute(text('SELECT "Date", "Close" FROM history WHERE "Ticker" = :tk AND "Date" > :dt '
+                                 'ORDER BY "Date"'), {'tk': ticker, 'dt': state_date}).fetchall()
+        if not bars:
+            return 0
+
+        indicators = Indicators(state)
+        rows = []
+        for i, (date, close) in enumerate(bars):
+            if i == len(bars) - 1:
+                # State before the latest bar
+                state = indicators.to_dict()
+                if i > 0:
+                    state_date = bars[i - 1][0]
+            values = indicators.add(close)
+            row = {'p{}'.format(j): _value(value) for j, value in enumerate(values)}
+            row.update(Ticker=ticker, Date=date)
+            rows.append(row)
+
+        conn.execute(text(UPSERT_INDICATORS), rows)
+        if state_date:
+            conn.execute(text(UPSERT_STATE), {'Ticker': ticker, 'Date': state_date, 'State': json.dumps(state)})
+        return len(rows)
+
+    def rebuild(self, ticker):
+        """
+        Recomputes the indicators from the full history, e.g. after older bars are changed
+        :param ticker: ticker symbol
+        :return number of bars added
+        """
+        # In one transaction, so the history is never read without the indicators
+        with self.engine.begin() as conn:
+            conn.execute(text('DELETE FROM indicators WHERE "Ticker" = :tk'), {'tk': ticker})
+            conn.execute(text('DELETE FROM indicator_state WHERE "Ticker" = :tk'), {'tk': ticker})
+            return self.update(ticker, conn)
+
+    def read(self, ticker):
+        """
+        Reads the indicators of a ticker
+        :param ticker: ticker symbol
+        :return indicators as a DF in date order
+        """
+        with self.engine.connect() as conn:
+            return pd.read_sql(text('SELECT * FROM indicators WHERE "Ticker" = :tk ORDER BY "Date"'),
+                               params={'tk': ticker}, con=conn, parse_dates={'Date'})
@@ -1,5 +1,11 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+
+# For the timings of the stages
+import os
+import time
+from contextlib import contextmanager
 
 import plotly.graph_objects as go
 import plotly.express as px
@@ -7,14 +13,19 @@ import plotly.express as px
 from st_aggrid import GridOptionsBuilder, AgGrid, ColumnsAutoSizeMode
 from st_aggrid.shared import JsCode
 
-from sqlalchemy import create_engine
-from sqlalchemy.sql import text
-
 # End of imports ----------------------------------------------------
 
 # Margins for graphs
 MARGIN = dict(l=0,r=10,b=10,t=25)
 
+# Surprise categories; a missing surprise is Positive, as before
+CATEGORIES = ["Negative", "Expected", "Positive"]
+
+# Set DASHBOARD_TIMINGS to show the timings of the stages in the sidebar and the server log
+SHOW_TIMINGS = bool(os.environ.get('DASHBOARD_TIMINGS'))
+# Stage -> milliseconds for the current run
+timings = {}
+
 # JsCode to highlight cells when surprise < 0
 cellsytle_jscode = JsCode(
     """
@@ -29,34 +40,41 @@ cellsytle_jscode = JsCode(
     """
 )
 
-def categorize_number(number):
-    if number < 0:
-        return "Negative"
-    elif number == 0:
-        return "Expected"
-    else:
-        return "Positive"
-
-def get_data(): 
-    engine = st.session_state.engine
+@contextmanager
+def timed(stage):
+    """
+    Records the time of a stage of the page in timings
+    :param stage: stage name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
 
-    with engine.connect() as conn:
-        df_annual = pd.read_sql('SELECT * FROM annual_earnings WHERE Ticker=(:tk)',
-                         params=dict(tk=st.session_state.ticker),
-                         con=conn, parse_dates=["Fiscal Date"])
-        df_quarterly = pd.read_sql('SELECT * FROM quarterly_earnings WHERE Ticker=(:tk)',
-                         params=dict(tk=st.session_state.ticker),
-                         con=conn, parse_dates={"Fiscal Date", "Reported Date"})
+def categorize(surprise):
+    """
+    Categorises surprises into Negative, Expected and Positive
+    :param surprise: surprise percent as a Series
+    :return categories as an array
+    """
+    values = surprise.to_numpy(dtype="float64", na_value=np.nan)
+    return np.select([values < 0, values == 0], CATEGORIES[:2], default=CATEGORIES[2])
 
-    # Drop the ticker column
-    df_annual = df_annual.drop("Ticker", axis=1)
-    df_quarterly = df_quarterly.drop("Ticker", axis=1)
+def get_data(): 
+    # Earnings are cached per ticker by the data access (see 01_Home.py); Arrow-backed and shared, so the DFs
+    # are not changed in place
+    with timed("read"):
+        df_annual, df_quarterly = st.session_state.data.earnings(st.session_state.ticker)
 
-    # Round to 2 decimal places
-    df_quarterly["Surprise Percent"] = df_quarterly["Surprise Percent"].round(2)
+    with timed("prepare"):
+        # Drop the ticker column
+        df_annual = df_annual.drop("Ticker", axis=1)
+        df_quarterly = df_quarterly.drop("Ticker", axis=1)
 
-    # Categorise surprises into three groups
-    df_quarterly["Category"] = df_quarterly["Surprise Percent"].apply(categorize_number)
+        # Round to 2 decimal places and categorise surprises into three groups
+        surprise = df_quarterly["Surprise Percent"].round(2)
+        df_quarterly = df_quarterly.assign(**{"Surprise Percent": surprise, "Category": categorize(surprise)})
 
     return (df_annual, df_quarterly)
 
@@ -75,9 +93,9 @@ def annual_page(ticker, df):
     )
     gridOptions = gb.build()
     col1, col2 = st.columns([1, 2])
-    with col1:
+    with col1, timed("grid"):
         AgGrid(df, gridOptions=gridOptions, theme="balham")
-    with col2:
+    with col2, timed("charts"):
         fig = px.scatter(df, x="Fiscal Date", y="Reported EPS")
         fig.update_traces(marker_size=10, marker=dict(color='#A93226'))
         fig.update_layout(xaxis_title=None, legend_title=None, yaxis_title=None)
@@ -127,13 +145,17 @@ def quarterly_page(ticker, df):
     gridOptions = gb.build()
 
     col1, col2 = st.columns([1.5, 1])
-    with col1:
+    with col1, timed("grid"):
         AgGrid(df, gridOptions=gridOptions, theme="balham", 
             # columns_auto_size_mode=ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW,
             allow_unsafe_jscode=True)
     with col2:
         st.write("")
     
+    with timed("charts"):
+        quarterly_charts(df)
+
+def quarterly_charts(df):
     fig = go.Figure()
     fig.add_trace(go.Scatter(
         x=df["Fiscal Date"], y=df["Reported EPS"],
@@ -177,6 +199,12 @@ def sidebar_page():
 st.subheader(st.session_state.page_subheader)
 st.divider()
 
-# Get annual and quarterly earnings data
-df_annual, df_quarterly = get_data()
-sidebar_page()
\ No newline at end of file
+with timed("total"):
+    # Get annual and quarterly earnings data
+    df_annual, df_quarterly = get_data()
+    sidebar_page()
+
+timings_text = ", ".join("{0} {1:.1f}".format(stage, ms) for stage, ms in timings.items())
+if SHOW_TIMINGS:
+    print("Earnings page timings (ms): " + timings_text)
+    st.sidebar.caption("Timings (ms): " + timings_text)
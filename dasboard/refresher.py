@@ -0,0 +1,142 @@
+"""
+Refresh worker for the dashboard - refreshes the history, indicators and info of the tickers on a schedule and
+saves them to the DB, so the pages only read. Each refresh is claimed in the refresh_status table first
+(see Repository.claim_refresh), so the same refresh is never run twice at a time, even with several workers
+or a page refreshing missing data.
+
+To run the worker:
+python refresher.py --interval 300
+"""
+
+import argparse
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from repository import Repository, create_engine, DB
+from indicators import IndicatorStore
+from data_access import get_provider, TICKERS, REFRESH_INTERVAL
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+# Years of history to read for a new ticker
+HISTORY_YEARS = 2
+# Tickers refreshed at a time
+WORKERS = 4
+# Key of the info in refresh_status; the info of all the tickers are refreshed together
+ALL_TICKERS = '*'
+
+# End of Constants ---------------------------------------------------------
+
+class Refresher:
+    def __init__(self, repository, provider=None, tickers=TICKERS, interval=REFRESH_INTERVAL):
+        """
+        :param repository: Repository for the dashboard DB
+        :param provider: info and history provider; see data_access.get_provider
+        :param tickers: tickers to refresh
+        :param interval: seconds between the refreshes
+        """
+        self.repository = repository
+        self.provider = provider or get_provider()
+        self.indicators = IndicatorStore(repository.engine)
+        self.tickers = list(tickers)
+        self.interval = interval
+
+    def _refresh(self, ticker, kind, max_age, refresh):
+        """
+        Runs a refresh if it's claimed
+        :return true if refreshed
+        """
+        # Read first, so the pages don't write when the data is fresh
+        refreshed = self.repository.read_status(ticker, kind)
+        if refreshed is not None and (datetime.now() - refreshed).total_seconds() < max_age:
+            return False
+        if not self.repository.claim_refresh(ticker, kind, max_age):
+            return False
+        try:
+            refresh()
+        except Exception as e:
+            print('Failed to refresh {0} of {1}: {2}'.format(kind, ticker, e))
+            self.repository.finish_refresh(ticker, kind, error=str(e))
+            return False
+        self.repository.finish_refresh(ticker, kind)
+        return True
+
+    def _history(self, ticker):
+        last_date = self.repository.last_date(ticker)
+        if last_date is None:
+            print('no history found for {0}; reading full {1} years of data'.format(ticker, HISTORY_YEARS))
+            start_date = datetime.now() + pd.DateOffset(years=-HISTORY_YEARS)
+        else:
+            # The latest bar is fetched again as it may have changed
+            start_date = last_date
+        df = self.provider.history(ticker, start_date)
+        # The bars and their indicators are saved in one transaction; a page reading in between would cache
+        # the new bars without the indicators (see HistoryStore.load)
+        with self.repository.engine.begin() as conn:
+            self.repository.upsert_history(df, conn=conn)
+            self.indicators.update(ticker, conn=conn)
+
+    def refresh_history(self, ticker, max_age=None):
+        """
+        Refreshes the history and indicators of a ticker
+        :param ticker: ticker symbol
+        :param max_age: seconds after which the history is refreshed; half the interval if None
+        :return true if refreshed
+        """
+        max_age = self.interval / 2 if max_age is None else max_age
+        return self._refresh(ticker, 'history', max_age, lambda: self._history(ticker))
+
+    def refresh_info(self, tickers=None, max_age=None):
+        """
+        Refreshes the info of the tickers in one batch
+        :param tickers: tickers to refresh; all the tickers if None
+        :param max_age: seconds after which the info is refreshed; half the interval if None
+        :return true if refreshed
+        """
+        tickers = tickers or self.tickers
+        max_age = self.interval / 2 if max_age is None else max_age
+        key = ALL_TICKERS if tickers == self.tickers else ','.join(tickers)
+        return self._refresh(key, 'info', max_age,
+                             lambda: self.repository.save_info(self.provider.info(tickers)))
+
+    def run_once(self):
+        """
+        Refreshes the info and the history of all the tickers
+        :return number of refreshes run
+        """
+        count = int(self.refresh_info())
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            count += sum(executor.map(self.refresh_history, self.tickers))
+        return count
+
+    def run(self):
+        """
+        Refreshes the tickers every interval until stopped
+        """
+        while True:
+            start = time.monotonic()
+            count = self.run_once()
+            print('{0}: {1} refreshes in {2:.1f}s'.format(datetime.now(), count, time.monotonic() - start))
+            time.sleep(max(self.interval - (time.monotonic() - start), 0))
+
+if __name__ == "__main__":
+    # Initialize parser
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--ticker', '-t', type=str, nargs='*', default=TICKERS, help='Tickers')
+    parser.add_argument('--interval', '-i', type=int, default=REFRESH_INTERVAL, help='Seconds between refreshes')
+    parser.add_argument('--db', type=str, default=DB, help='DB URL')
+    parser.add_argument('--once', action='store_true', help='Refresh once and exit')
+
+    # Read arguments from command line
+    args = parser.parse_args()
+    refresher = Refresher(Repository(create_engine(args.db)), tickers=args.ticker, interval=args.interval)
+    if args.once:
+        refresher.run_once()
+    else:
+        refresher.run()
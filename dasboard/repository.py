@@ -0,0 +1,366 @@
+"""
+Dashboard DB (db/stock_data.db) - the schema with its migrations and the queries used by the pages and
+utils/insert_earnings.py. The tables are keyed on (Ticker, Date) or (Ticker, Fiscal Date) and created
+WITHOUT ROWID, so the primary key is a clustered index and the reads of a ticker don't scan the table.
+The DB is in WAL mode, so the Streamlit sessions can read while the history or earnings are written.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.sql import text
+
+import indicators
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+DB = 'sqlite:///db/stock_data.db'
+# Milliseconds to wait for a writer's lock
+BUSY_TIMEOUT = 5000
+# Seconds after which a refresh that didn't finish (e.g. the worker died) can be claimed again
+REFRESH_LEASE = 10 * 60
+# Format of the TIMESTAMP columns
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Column types of the tables; the keys are the first columns
+SCHEMA = {
+    'history': {
+        'key': ['Ticker', 'Date'],
+        'columns': {'Ticker': 'TEXT', 'Date': 'DATE', 'Open': 'REAL', 'Close': 'REAL', 'Volume': 'INTEGER',
+                    'Refreshed Date': 'TIMESTAMP'}
+    },
+    'annual_earnings': {
+        'key': ['Ticker', 'Fiscal Date'],
+        'columns': {'Ticker': 'TEXT', 'Fiscal Date': 'TIMESTAMP', 'Reported EPS': 'REAL'}
+    },
+    'quarterly_earnings': {
+        'key': ['Ticker', 'Fiscal Date'],
+        'columns': {'Ticker': 'TEXT', 'Fiscal Date': 'TIMESTAMP', 'Reported Date': 'TIMESTAMP',
+                    'Reported EPS': 'REAL', 'Estimated EPS': 'REAL', 'Surprise': 'REAL', 'Surprise Percent': 'REAL'}
+    },
+    'indicators': {
+        'key': ['Ticker', 'Date'],
+        'columns': dict({'Ticker': 'TEXT', 'Date': 'DATE'}, **{column: 'REAL' for column in indicators.COLUMNS})
+    },
+    # State of the indicators after the bar on the date
+    'indicator_state': {
+        'key': ['Ticker'],
+        'columns': {'Ticker': 'TEXT', 'Date': 'DATE', 'State': 'TEXT'}
+    },
+    # Info (quote, summary etc) as JSON, published by the refresh worker
+    'info': {
+        'key': ['Ticker'],
+        'columns': {'Ticker': 'TEXT', 'Info': 'TEXT', 'Refreshed': 'TIMESTAMP'}
+    },
+    # Freshness of each kind of data (history, info) of a ticker; Started is set while a refresh runs
+    'refresh_status': {
+        'key': ['Ticker', 'Kind'],
+        'columns': {'Ticker': 'TEXT', 'Kind': 'TEXT', 'Refreshed': 'TIMESTAMP', 'Started': 'TIMESTAMP',
+                    'Error': 'TEXT'}
+    }
+}
+
+# Columns of the DFs read from the tables
+HISTORY_COLUMNS = ['Open', 'Close', 'Volume', 'Date', 'Ticker', 'Refreshed Date']
+ANNUAL_COLUMNS = ['Fiscal Date', 'Reported EPS', 'Ticker']
+QUARTERLY_COLUMNS = ['Fiscal Date', 'Reported Date', 'Reported EPS', 'Estimated EPS', 'Surprise',
+                     'Surprise Percent', 'Ticker']
+
+# End of Constants ---------------------------------------------------------
+
+def _quote(columns):
+    return ', '.join('"{}"'.format(column) for column in columns)
+
+def create_table_sql(table):
+    """
+    Returns the CREATE TABLE statement of a table in the SCHEMA
+    :param table: table name
+    :return SQL
+    """
+    schema = SCHEMA[table]
+    columns = ['"{0}" {1}{2}'.format(column, type_, ' NOT NULL' if column in schema['key'] else '')
+               for column, type_ in schema['columns'].items()]
+    return 'CREATE TABLE {0} (\n    {1},\n    PRIMARY KEY ({2})\n) WITHOUT ROWID'.format(
+        table, ',\n    '.join(columns), _quote(schema['key']))
+
+def upsert_sql(table, columns):
+    """
+    Returns the INSERT ... ON CONFLICT statement of a table; the parameters are named p0, p1 etc
+    :param table: table name
+    :param columns: columns to insert
+    :return SQL
+    """
+    key = SCHEMA[table]['key']
+    updates = ', '.join('"{0}" = excluded."{0}"'.format(column) for column in columns if column not in key)
+    return 'INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO {4}'.format(
+        table, _quote(columns), ', '.join(':p{}'.format(i) for i in range(len(columns))), _quote(key),
+        'UPDATE SET ' + updates if updates else 'NOTHING')
+
+def rebuild_table(conn, table):
+    """
+    Creates a table in the SCHEMA; an existing table (e.g. created by DataFrame.to_sql) is copied to the
+    new table, the last row is kept for any duplicate key
+    :param conn: SQLAlchemy connection
+    :param table: table name
+    """
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:name"),
+                       {'name': table}).scalar()
+    if sql is None:
+        conn.execute(text(create_table_sql(table)))
+        return
+
+    old_columns = [row[1] for row in conn.execute(text('PRAGMA table_info("{}")'.format(table)))]
+    columns = [column for column in SCHEMA[table]['columns'] if column in old_columns]
+    values = ['DATE("Date")' if column == 'Date' and SCHEMA[table]['columns'][column] == 'DATE'
+              else '"{}"'.format(column) for column in columns]
+    order = ' ORDER BY rowid' if 'WITHOUT ROWID' not in sql.upper() else ''
+    conn.execute(text('ALTER TABLE {0} RENAME TO {0}_old'.format(table)))
+    conn.execute(text(create_table_sql(table)))
+    conn.execute(text('INSERT OR REPLACE INTO {0} ({1}) SELECT {2} FROM {0}_old{3}'.format(
+        table, _quote(columns), ', '.join(values), order)))
+    conn.execute(text('DROP TABLE {}_old'.format(table)))
+
+def _version_1(conn):
+    # Keyed and typed tables instead of the tables created by DataFrame.to_sql
+    for table in ['history', 'annual_earnings', 'quarterly_earnings', 'indicators', 'indicator_state']:
+        rebuild_table(conn, table)
+
+def _version_2(conn):
+    # Tables for the refresh worker
+    for table in ['info', 'refresh_status']:
+        rebuild_table(conn, table)
+
+# Migrations in order; PRAGMA user_version is the number of migrations applied
+MIGRATIONS = [_version_1, _version_2]
+
+def migrate(engine):
+    """
+    Applies the migrations not applied to the DB yet; each migration is a transaction
+    :param engine: SQLAlchemy engine
+    :return DB version
+    """
+    with engine.connect() as conn:
+        version = conn.execute(text('PRAGMA user_version')).scalar()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with engine.begin() as conn:
+            # sqlite3 doesn't start a transaction for DDL; the lock also stops two processes migrating at once
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            if conn.execute(text('PRAGMA user_version')).scalar() < number:
+                migration(conn)
+                conn.execute(text('PRAGMA user_version = {}'.format(number)))
+    return len(MIGRATIONS)
+
+def create_engine(db=DB):
+    """
+    Creates a SQLAlchemy engine in WAL mode
+    :param db: DB URL
+    :return engine
+    """
+    engine = sqlalchemy.create_engine(db, echo=False)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout={}'.format(BUSY_TIMEOUT))
+        cursor.close()
+
+    return engine
+
+def _records(df, columns):
+    """
+    Returns the parameters for upsert_sql; the dates as strings and NaN as NULL
+    """
+    records = []
+    for row in df[columns].astype(object).itertuples(index=False, name=None):
+        records.append({'p{}'.format(i): None if pd.isna(value) else value for i, value in enumerate(row)})
+    return records
+
+def _format_dates(df, columns, date_format):
+    df = df.copy()
+    for column in columns:
+        if column in df:
+            df[column] = pd.to_datetime(df[column]).dt.strftime(date_format)
+    return df
+
+class Repository:
+    def __init__(self, engine):
+        """
+        Queries of the dashboard DB; the DB is migrated to the latest version
+        :param engine: SQLAlchemy engine; see create_engine
+        """
+        self.engine = engine
+        migrate(engine)
+
+    # History ---------------------------------------------------------
+
+    def last_date(self, ticker):
+        """
+        Returns the latest date in the history of a ticker
+        :param ticker: ticker symbol
+        :return the latest date as a Timestamp or None if there is no history
+        """
+        with self.engine.connect() as conn:
+            res = conn.execute(text('SELECT MAX("Date") FROM history WHERE "Ticker" = :tk'),
+                               {'tk': ticker}).scalar()
+        return None if res is None else pd.Timestamp(res)
+
+    def read_history(self, ticker, since=None, with_indicators=False):
+        """
+        Reads the history of a ticker
+        :param ticker: ticker symbol
+        :param since: only the bars on or after this date; all the bars if None
+        :param with_indicators: true to add the indicator columns
+        :return history as a DF in date order
+        """
+        columns = HISTORY_COLUMNS
+        sql = 'SELECT * FROM history'
+        if with_indicators:
+            columns = HISTORY_COLUMNS + indicators.COLUMNS
+            sql += ' LEFT JOIN indicators USING ("Ticker", "Date")'
+        sql += ' WHERE "Ticker" = :tk'
+        params = {'tk': ticker}
+        if since is not None:
+            sql += ' AND "Date" >= :dt'
+            params['dt'] = since.strftime('%Y-%m-%d')
+        with self.engine.connect() as conn:
+            df = pd.read_sql(text(sql + ' ORDER BY "Date"'), params=params, con=conn,
+                             parse_dates={'Date', 'Refreshed Date'})
+        return df[columns]
+
+    def upsert_history(self, df, conn=None):
+        """
+        Inserts or updates the bars of a DF; the latest bar is usually updated during the trading day
+        :param df: bars with the HISTORY_COLUMNS
+        :param conn: connection of a transaction to write in, e.g. with the indicators; a new transaction if None
+        :return number of bars saved
+        """
+        if df.empty:
+            return 0
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.upsert_history(df, conn)
+        df = _format_dates(df, ['Date'], '%Y-%m-%d')
+        df = _format_dates(df, ['Refreshed Date'], TIMESTAMP_FORMAT)
+        conn.execute(text(upsert_sql('history', HISTORY_COLUMNS)), _records(df, HISTORY_COLUMNS))
+        return len(df)
+
+    # Earnings --------------------------------------------------------
+
+    def read_earnings(self, ticker, dtype_backend=None):
+        """
+        Reads the earnings of a ticker
+        :param ticker: ticker symbol
+        :param dtype_backend: pyarrow for Arrow-backed columns; the NumPy dtypes if None
+        :return tuple of annual and quarterly earnings DFs in fiscal date order
+        """
+        kwargs = {'dtype_backend': dtype_backend} if dtype_backend else {}
+        with self.engine.connect() as conn:
+            df_annual = pd.read_sql(text('SELECT * FROM annual_earnings WHERE "Ticker" = :tk ORDER BY "Fiscal Date"'),
+                                    params=dict(tk=ticker), con=conn, parse_dates=['Fiscal Date'], **kwargs)
+            df_quarterly = pd.read_sql(
+                text('SELECT * FROM quarterly_earnings WHERE "Ticker" = :tk ORDER BY "Fiscal Date"'),
+                params=dict(tk=ticker), con=conn, parse_dates={'Fiscal Date', 'Reported Date'}, **kwargs)
+        return (df_annual[ANNUAL_COLUMNS], df_quarterly[QUARTERLY_COLUMNS])
+
+    def upsert_earnings(self, df_annual, df_quarterly):
+        """
+        Inserts or updates the earnings of any number of tickers in one transaction
+        :param df_annual: annual earnings with the ANNUAL_COLUMNS
+        :param df_quarterly: quarterly earnings with the QUARTERLY_COLUMNS
+        :return tuple of the number of annual and quarterly earnings saved
+        """
+        date_format = '%Y-%m-%d %H:%M:%S'
+        with self.engine.begin() as conn:
+            for table, df, columns in [('annual_earnings', df_annual, ANNUAL_COLUMNS),
+                                       ('quarterly_earnings', df_quarterly, QUARTERLY_COLUMNS)]:
+                if not df.empty:
+                    df = _format_dates(df, ['Fiscal Date', 'Reported Date'], date_format)
+                    conn.execute(text(upsert_sql(table, columns)), _records(df, columns))
+        return (len(df_annual), len(df_quarterly))
+
+    # Info ------------------------------------------------------------
+
+    def read_info(self, tickers):
+        """
+        Reads the info of the tickers
+        :param tickers: list of ticker symbols
+        :return dictionary of ticker -> info; tickers without info are not included
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text('SELECT "Ticker", "Info" FROM info WHERE "Ticker" IN :tks')
+                                .bindparams(sqlalchemy.bindparam('tks', expanding=True)),
+                                {'tks': list(tickers)}).fetchall()
+        return {ticker: json.loads(info) for ticker, info in rows}
+
+    def save_info(self, infos):
+        """
+        Inserts or updates the info of the tickers
+        :param infos: dictionary of ticker -> info
+        """
+        now = datetime.now().strftime(TIMESTAMP_FORMAT)
+        records = [{'p0': ticker, 'p1': json.dumps(info, default=str), 'p2': now} for ticker, info in infos.items()]
+        if records:
+            with self.engine.begin() as conn:
+                conn.execute(text(upsert_sql('info', ['Ticker', 'Info', 'Refreshed'])), records)
+
+    # Refresh status --------------------------------------------------
+
+    def claim_refresh(self, ticker, kind, max_age, lease=REFRESH_LEASE):
+        """
+        Claims the refresh of a ticker's data, so the same refresh is never run twice at a time. It's only
+        claimed if the data is older than max_age and no other refresh is running.
+        :param ticker: ticker symbol
+        :param kind: kind of data, e.g. history or info
+        :param max_age: seconds after which the data is refreshed
+        :param lease: seconds after which a running refresh is considered dead
+        :return true if claimed; call finish_refresh after the refresh
+        """
+        now = datetime.now()
+        params = {'tk': ticker, 'kind': kind, 'now': now.strftime(TIMESTAMP_FORMAT),
+                  'lease': (now - timedelta(seconds=lease)).strftime(TIMESTAMP_FORMAT),
+                  'age': (now - timedelta(seconds=max_age)).strftime(TIMESTAMP_FORMAT)}
+        with self.engine.begin() as conn:
+            conn.execute(text('INSERT INTO refresh_status ("Ticker", "Kind") VALUES (:tk, :kind) '
+                              'ON CONFLICT ("Ticker", "Kind") DO NOTHING'), params)
+            # A single statement, so only one of the callers can claim it
+            res = conn.execute(text('''
+                UPDATE refresh_status SET "Started" = :now
+                WHERE "Ticker" = :tk AND "Kind" = :kind
+                AND ("Started" IS NULL OR "Started" < :lease) AND ("Refreshed" IS NULL OR "Refreshed" < :age)
+            '''), params)
+        return res.rowcount == 1
+
+    def finish_refresh(self, ticker, kind, error=None):
+        """
+        Releases a claimed refresh
+        :param ticker: ticker symbol
+        :param kind: kind of data, e.g. history or info
+        :param error: error message if the refresh failed; the data is not marked as refreshed
+        """
+        now = datetime.now().strftime(TIMESTAMP_FORMAT)
+        with self.engine.begin() as conn:
+            conn.execute(text('''
+                UPDATE refresh_status SET "Started" = NULL, "Error" = :error,
+                "Refreshed" = CASE WHEN :error IS NULL THEN :now ELSE "Refreshed" END
+                WHERE "Ticker" = :tk AND "Kind" = :kind
+            '''), {'tk': ticker, 'kind': kind, 'now': now, 'error': error})
+
+    def read_status(self, ticker, kind):
+        """
+        Returns when a ticker's data was last refreshed
+        :param ticker: ticker symbol
+        :param kind: kind of data, e.g. history or info
+        :return refreshed time as a Timestamp or None if never refreshed
+        """
+        with self.engine.connect() as conn:
+            res = conn.execute(text('SELECT "Refreshed" FROM refresh_status WHERE "Ticker" = :tk AND "Kind" = :kind'),
+                               {'tk': ticker, 'kind': kind}).scalar()
+        return None if res is None else pd.Timestamp(res)
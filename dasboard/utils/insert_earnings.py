@@ -1,15 +1,24 @@
 # Requests to AV
 import requests
+from requests.adapters import HTTPAdapter
 
 # DataFrame
 import pandas as pd
 
-# Access to sqlite DB
-import sqlite3
 import argparse
 
 # To access home dir
 import os
+import sys
+
+# For the concurrent requests and the rate limiter
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Dashboard DB; the repository is in the dashboard folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository import Repository, create_engine
 
 # ------------------------------------------------------------------------
 # Constants
@@ -17,25 +26,85 @@ import os
 # Function to call at Av
 FUNCTION = 'EARNINGS'
 
-# Base URL for the AV end point
-BASE_URL = 'https://www.alphavantage.co/query?'
+# Base URL for the AV end point; set AV_BASE_URL to use another server, e.g. a local stub
+BASE_URL = os.environ.get('AV_BASE_URL', 'https://www.alphavantage.co/query?')
 DB = os.path.expanduser('~') + '/poc/dashboard/db/stock_data.db'
 
+# AV quota for the free keys is 5 requests per minute
+RATE = 5
+# Number of requests in progress at a time
+WORKERS = 4
+
 # List of fields we need to convert from string to float
 FIELDS_TO_FLOAT = [
      'reportedEPS','estimatedEPS','surprise','surprisePercentage'
 ]
+
+# AV fields -> sqlite columns
+ANNUAL_COLUMNS = {'fiscalDateEnding': 'Fiscal Date', 'reportedEPS': 'Reported EPS'}
+QUARTERLY_COLUMNS = {'fiscalDateEnding' : 'Fiscal Date', 'reportedDate' : 'Reported Date',
+                     'reportedEPS' : 'Reported EPS', 'estimatedEPS' : 'Estimated EPS',
+                     'surprise' : 'Surprise', 'surprisePercentage' : 'Surprise Percent'}
+
 # ------------------------------------------------------------------------
 
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by the threads
+    :param rate: number of requests per period
+    :param period: period in seconds
+    """
+    def __init__(self, rate, period=60):
+        self.capacity = rate
+        self.tokens = rate
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits for a token
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+def create_session(workers):
+    """
+    Creates a session with a connection pool for the threads
+    :param workers: number of requests in progress at a time
+    :return: requests Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 """
 Calls AV endpoint for earnings for given ticker
+:param session: requests Session
 :param ticker: ticker symbol
 :param key: API key to access AV
+:param base_url: AV end point
 :return: earnings as a Json response; includes both annual and quarterly earnings
 """
-def get_income_statements(ticker, key):
-    response = requests.get(f'{BASE_URL}function={FUNCTION}&symbol={ticker}&apikey={key}')
-    return response.json()
+def get_income_statements(session, ticker, key, base_url=BASE_URL):
+    response = session.get(f'{base_url}function={FUNCTION}&symbol={ticker}&apikey={key}', timeout=30)
+    response.raise_for_status()
+    earnings = response.json()
+    # AV returns a note instead of the earnings when the quota is exceeded or the ticker is unknown
+    if 'annualEarnings' not in earnings:
+        raise Exception(earnings.get('Note') or earnings.get('Information') or earnings.get('Error Message')
+                        or 'No earnings found')
+    return earnings
 
 """
 This method returns a DF earning which can be Annual or Quarterly
@@ -45,15 +114,15 @@ This method returns a DF earning which can be Annual or Quarterly
 """
 def create_earnings_df(earnings, report_type):
     if report_type.upper() == 'Q':
-        df_earnings = pd.DataFrame(earnings['quarterlyEarnings'])
+        df_earnings = pd.DataFrame(earnings['quarterlyEarnings'], columns=list(QUARTERLY_COLUMNS))
         # Convert reported date which is only applicable to quarterly earnings from string
         df_earnings['reportedDate'] = pd.to_datetime(df_earnings['reportedDate'])
-    
+
         for field in FIELDS_TO_FLOAT:
             # non numeric are converted to NaN
             df_earnings[field] = pd.to_numeric(df_earnings[field], errors='coerce')
     elif report_type.upper() == 'A':
-        df_earnings = pd.DataFrame(earnings['annualEarnings'])
+        df_earnings = pd.DataFrame(earnings['annualEarnings'], columns=list(ANNUAL_COLUMNS))
         # Only reportedEPS is present for Annual
         df_earnings['reportedEPS'] = pd.to_numeric(df_earnings['reportedEPS'], errors='coerce')
     else:
@@ -64,64 +133,84 @@ def create_earnings_df(earnings, report_type):
 
     return df_earnings
 
-def delete_earnings(conn, table, ticker):
+def fetch_earnings(session, limiter, ticker, key, base_url=BASE_URL):
     """
-    Delete an earnings by ticker
-    :param conn:  Connection to the SQLite database
-    :param table: name of DB table
+    Fetches the earnings of a ticker, waiting for the rate limiter
+    :param session: requests Session
+    :param limiter: TokenBucket
     :param ticker: ticker symbol
-    :return: none
+    :param key: API key to access AV
+    :param base_url: AV end point
+    :return: tuple of annual and quarterly earnings DFs with the sqlite columns
     """
-    sql = 'DELETE FROM ' + table + ' WHERE ticker=?'
-    cur = conn.cursor()
-    cur.execute(sql, (ticker,))
-    conn.commit()
-
-def main(args):
-    ticker = args.ticker
-    # Get the earnings data from AV
-    earnings = get_income_statements(ticker, args.api)
-
-    # DFs to collect all the annual and quarterly earnings for tickers
-    df_annual = pd.DataFrame()
-    df_quarterly = pd.DataFrame()
+    limiter.acquire()
+    earnings = get_income_statements(session, ticker, key, base_url)
 
-    df_annual = pd.concat([df_annual, create_earnings_df(earnings, 'A')])
-    df_quarterly = pd.concat([df_quarterly, create_earnings_df(earnings, 'Q')])
+    df_annual = create_earnings_df(earnings, 'A').rename(columns=ANNUAL_COLUMNS)
+    df_quarterly = create_earnings_df(earnings, 'Q').rename(columns=QUARTERLY_COLUMNS)
 
     # Add ticker columns to both DFs
     df_annual['Ticker'] = ticker
     df_quarterly['Ticker'] = ticker
+    return (df_annual, df_quarterly)
 
-    # Rename columns to align with the sqlite columns
-    df_annual.rename(columns={'fiscalDateEnding': 'Fiscal Date', 'reportedEPS': 'Reported EPS'}, inplace=True)
-    df_quarterly.rename(columns={'fiscalDateEnding' : 'Fiscal Date', 'reportedDate' : 'Reported Date',
-                             'reportedEPS' : 'Reported EPS',	'estimatedEPS' : 'Estimated EPS',
-                             'surprise' : 'Surprise', 'surprisePercentage' : 'Surprise Percent'}, inplace=True)
+def read_tickers(args):
+    """
+    Returns the tickers from the command line and the tickers file (one per line, # for comments)
+    :param args: command line arguments
+    :return: list of unique tickers in the given order
+    """
+    tickers = list(args.ticker or [])
+    if args.file:
+        with open(args.file) as fp:
+            tickers += [line.split('#')[0].strip() for line in fp]
+    return list(dict.fromkeys(ticker.upper() for ticker in tickers if ticker))
 
-    # print(df_annual.head())
-    # create a database connection
-    conn = conn = sqlite3.connect(DB)
+def main(args):
+    tickers = read_tickers(args)
+    if not tickers:
+        raise Exception('No tickers given, use --ticker or --file')
+
+    # Get the earnings data from AV; the session and the limiter are shared by the threads
+    session = create_session(args.workers)
+    limiter = TokenBucket(args.rate)
+    results, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {ticker: executor.submit(fetch_earnings, session, limiter, ticker, args.api, args.base_url)
+                   for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                results[ticker] = future.result()
+            except Exception as e:
+                failed[ticker] = e
+                print('Failed to read {0}: {1}'.format(ticker, e))
+
+    # DFs to collect all the annual and quarterly earnings for tickers
+    df_annual = pd.concat([annual for annual, _ in results.values()], ignore_index=True) \
+        if results else pd.DataFrame()
+    df_quarterly = pd.concat([quarterly for _, quarterly in results.values()], ignore_index=True) \
+        if results else pd.DataFrame()
 
-    with conn:
-        table = 'annual_earnings'
-        # Delete all earnings for the ticker before inserting
-        delete_earnings(conn, table, ticker)
-        df_annual.to_sql(table, conn, if_exists='append', index=False)
+    # All the tickers are saved in one transaction; the earnings are upserted on (Ticker, Fiscal Date)
+    repository = Repository(create_engine('sqlite:///' + args.db))
+    if results:
+        repository.upsert_earnings(df_annual, df_quarterly)
 
-        table = 'quarterly_earnings'
-        delete_earnings(conn, table, ticker)
-        df_quarterly.to_sql(table, conn, if_exists='append', index=False)
-    
-    print('Updated Earnings DB at {0}'.format(DB))
+    print('Updated Earnings DB at {0} for {1} tickers; {2} failed'.format(args.db, len(results), len(failed)))
+    return failed
 
 if __name__ == "__main__":
     # Initialize parser
     parser = argparse.ArgumentParser()
 
     # Adding optional argument
-    parser.add_argument('--ticker', '-t', type=str, help='Ticker')
+    parser.add_argument('--ticker', '-t', type=str, nargs='*', help='Tickers')
+    parser.add_argument('--file', '-f', type=str, help='File with the tickers, one per line')
     parser.add_argument('--api', '-a', type=str, help='Alpha Vantage API Key')
+    parser.add_argument('--rate', '-r', type=int, default=RATE, help='AV requests per minute')
+    parser.add_argument('--workers', '-w', type=int, default=WORKERS, help='Requests in progress at a time')
+    parser.add_argument('--db', type=str, default=DB, help='SQLite DB')
+    parser.add_argument('--base-url', type=str, default=BASE_URL, help='AV end point, e.g. a local stub')
 
     # Read arguments from command line
     args = parser.parse_args()
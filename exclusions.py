@@ -0,0 +1,102 @@
+"""
+Exclusions of the screeners - a symbol left out of a metric, with the type of the reason (missing, negative,
+...) and the offending field or value. The exclusions are appended to columns of lists and turned into a DF
+once, rather than a DF copied for every exclusion.
+
+Shared by the screener notebooks (yf_stock_picker_p2, asx/dividend_scanner) and universe.py, and written to the
+Excel output of the dividend scanner.
+
+from exclusions import Exclusions, Reason
+fundamentals, fetch_ex_df = fetch_universe(SYMBOLS)
+exclusions = Exclusions(fetch_ex_df)
+exclusions.add('NVDA', 'PEG ratio', Reason.MISSING, 'pegRatio')
+key_metrics_ex_df = exclusions.to_frame()
+"""
+
+from enum import Enum
+
+import pandas as pd
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+COLUMNS = ['Symbol', 'Metric', 'Reason', 'Detail']
+SHEET_NAME = 'Exclusions'
+
+# End of Constants ---------------------------------------------------------
+
+class Reason(Enum):
+    FETCH = 'Fetch failed'
+    MISSING = 'Missing'
+    NEGATIVE = 'Negative'
+    NOT_CALCULATED = 'Not calculated'
+
+class Exclusions:
+    def __init__(self, df=None):
+        """
+        Append-only exclusions
+        :param df: exclusions DF to start with, e.g. the symbols that couldn't be fetched by fetch_universe
+        """
+        self.columns = {column: [] for column in COLUMNS}
+        self.df = None
+        if df is not None:
+            self.extend(df)
+
+    def add(self, symbol, metric, reason, detail=None):
+        """
+        Adds an exclusion
+        :param symbol: ticker symbol
+        :param metric: metric the symbol is left out of
+        :param reason: Reason
+        :param detail: offending field, e.g. 'pegRatio', or field and value, e.g. 'forwardPE = -3.2'
+        """
+        # Raises ValueError for a reason that is not a Reason, before any column is changed
+        row = [symbol, metric, Reason(reason).value, None if detail is None else str(detail)]
+        for column, value in zip(COLUMNS, row):
+            self.columns[column].append(value)
+        self.df = None
+
+    def extend(self, df):
+        """
+        Adds the exclusions of a DF with the COLUMNS, or of another Exclusions
+        """
+        if isinstance(df, Exclusions):
+            df = df.to_frame()
+        rows = {}
+        for column in COLUMNS:
+            values = [None if pd.isna(value) else value
+                      for value in (df[column].astype(object) if column in df else [None] * len(df))]
+            # Raises ValueError for a reason that is not a Reason, before any column is changed
+            rows[column] = [Reason(value).value for value in values] if column == 'Reason' else values
+        for column in COLUMNS:
+            self.columns[column].extend(rows[column])
+        self.df = None
+
+    def __len__(self):
+        return len(self.columns['Symbol'])
+
+    def to_frame(self):
+        """
+        Returns the exclusions as a DF with the COLUMNS; Reason is a categorical of the Reason values
+        """
+        if self.df is None:
+            df = pd.DataFrame(self.columns, columns=COLUMNS, dtype=object)
+            df['Reason'] = pd.Categorical(df['Reason'], categories=[reason.value for reason in Reason])
+            self.df = df
+        return self.df.copy()
+
+    def to_excel(self, writer, sheet_name=SHEET_NAME, header_format=None):
+        """
+        Writes the exclusions to a sheet; the headers on row 1 and the exclusions from row 2, same as the other
+        sheets of the dividend scanner
+        :param writer: pd.ExcelWriter with the xlsxwriter engine
+        :param sheet_name: sheet name
+        :param header_format: format of the headers
+        """
+        worksheet = writer.book.add_worksheet(sheet_name)
+        for idx, value in enumerate(COLUMNS):
+            worksheet.write(1, idx + 1, value, header_format)
+        # Without the index, starting at column 1 below the headers
+        self.to_frame().to_excel(writer, sheet_name=sheet_name, startrow=2, startcol=1, header=False, index=False)
+        worksheet.autofit()
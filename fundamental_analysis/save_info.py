@@ -1,13 +1,34 @@
-from yfinance3 import YFinance3
+from yfinance3 import fetch_info, WORKERS
+from snapshot_store import save_snapshot, SNAPSHOT_PATH
+import argparse
 import json
+import os
 
 SYMBOLS = ['INTU','CDNS','WDAY','ROP','TEAM','ADSK','DDOG','ANSS','ZM','PTC',\
            'BSY','GRAB','SSNC','APP','AZPN','MANH','ZI','NICE']
 
-for symbol in SYMBOLS:
-    data = YFinance3(symbol)
-    file_name = f'out/info/{symbol}.json'
-    # Use a context manager to open the file and write the JSON data to it
-    with open(file_name, 'w') as file:
-        json.dump(data.info, file)
-    print('saved to {}'.format(file_name))
\ No newline at end of file
+JSON_DIR = 'out/info'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticker', '-t', type=str, nargs='*', default=SYMBOLS, help='Tickers')
+    parser.add_argument('--workers', '-w', type=int, default=WORKERS, help='Requests in progress at a time')
+    parser.add_argument('--out', '-o', type=str, default=SNAPSHOT_PATH, help='Snapshot folder')
+    parser.add_argument('--json', '-j', type=str, nargs='?', const=JSON_DIR,
+                        help='Also save a JSON file for each ticker to this folder')
+    args = parser.parse_args()
+
+    # All the tickers are fetched with one session and one cookie/crumb
+    infos, failed = fetch_info(args.ticker, workers=args.workers)
+    # Today's snapshot of all the tickers
+    print('saved to {}'.format(save_snapshot(infos, path=args.out)))
+    if args.json:
+        os.makedirs(args.json, exist_ok=True)
+        for symbol, info in infos.items():
+            file_name = f'{args.json}/{symbol}.json'
+            # Use a context manager to open the file and write the JSON data to it
+            with open(file_name, 'w') as file:
+                json.dump(info, file)
+            print('saved to {}'.format(file_name))
+    for symbol, error in failed.items():
+        print('failed to read {}: {}'.format(symbol, error))
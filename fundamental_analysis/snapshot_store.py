@@ -0,0 +1,178 @@
+"""
+Dated snapshots of the info of the universe - the flattened quoteSummary fields of all the tickers of a day are
+saved to one compressed Parquet file (out/snapshots/info_YYYY-MM-DD.parquet) with the schema below, and the
+snapshots are read back as one table with only the requested columns.
+
+To convert the JSON files saved by the earlier save_info.py:
+python snapshot_store.py --json out/info --date 2024-01-31
+"""
+
+import argparse
+import glob
+import json
+import os
+from datetime import date as dt_date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SNAPSHOT_PATH = 'out/snapshots'
+FILE_PREFIX = 'info_'
+COMPRESSION = 'zstd'
+
+# Flattened quoteSummary fields saved in the snapshots; the other fields are dropped so every snapshot has the
+# same columns. New fields are added at the end and read as nulls from the older snapshots.
+STRING_FIELDS = ['longName', 'shortName', 'quoteType', 'exchange', 'currency', 'financialCurrency', 'sector',
+                 'industry', 'country', 'recommendationKey']
+NUMERIC_FIELDS = [
+    # financialData
+    'currentPrice', 'targetMeanPrice', 'recommendationMean', 'totalCash', 'totalDebt', 'totalRevenue', 'ebitda',
+    'grossProfits', 'freeCashflow', 'operatingCashflow', 'revenueGrowth', 'earningsGrowth', 'grossMargins',
+    'operatingMargins', 'profitMargins', 'returnOnAssets', 'returnOnEquity', 'currentRatio', 'quickRatio',
+    'debtToEquity',
+    # defaultKeyStatistics
+    'enterpriseValue', 'forwardEps', 'trailingEps', 'pegRatio', 'priceToBook', 'bookValue', 'sharesOutstanding',
+    'floatShares', 'enterpriseToRevenue', 'enterpriseToEbitda',
+    # summaryDetail
+    'marketCap', 'forwardPE', 'trailingPE', 'priceToSalesTrailing12Months', 'payoutRatio', 'dividendYield',
+    'dividendRate', 'beta', 'fiftyTwoWeekLow', 'fiftyTwoWeekHigh', 'fiftyDayAverage', 'twoHundredDayAverage',
+    'volume', 'averageVolume',
+    # assetProfile
+    'fullTimeEmployees',
+]
+
+SCHEMA = pa.schema([('Date', pa.date32()), ('symbol', pa.string())]
+                   + [(field, pa.string()) for field in STRING_FIELDS]
+                   + [(field, pa.float64()) for field in NUMERIC_FIELDS])
+
+
+def _to_date(value):
+    if value is None:
+        return dt_date.today()
+    return pd.Timestamp(value).date()
+
+
+def snapshot_file(date=None, path=SNAPSHOT_PATH):
+    """
+    Returns the file of the snapshot of a day
+    :param date: snapshot date; today if None
+    :param path: snapshot folder
+    """
+    return os.path.join(path, f'{FILE_PREFIX}{_to_date(date):%Y-%m-%d}.parquet')
+
+
+def snapshot_dates(path=SNAPSHOT_PATH):
+    """
+    Returns the dates of the saved snapshots, oldest first; read from the file names, so no file is opened
+    """
+    files = glob.glob(os.path.join(path, f'{FILE_PREFIX}*.parquet'))
+    return sorted(datetime.strptime(os.path.basename(file)[len(FILE_PREFIX):-len('.parquet')], '%Y-%m-%d').date()
+                  for file in files)
+
+
+def to_table(infos, date=None):
+    """
+    Converts the info of the tickers to a table with the snapshot schema
+    :param infos: dictionary of ticker -> info as returned by YFinance3.info
+    :param date: snapshot date; today if None
+    :return: pyarrow Table
+    """
+    symbols = list(infos)
+    columns = {'Date': [_to_date(date)] * len(symbols), 'symbol': symbols}
+    for field in STRING_FIELDS:
+        columns[field] = [None if infos[s].get(field) is None else str(infos[s][field]) for s in symbols]
+    for field in NUMERIC_FIELDS:
+        # Values that aren't numbers, e.g. {}, are saved as nulls
+        columns[field] = pd.to_numeric(pd.Series([infos[s].get(field) for s in symbols], dtype=object),
+                                       errors='coerce').astype('float64')
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+
+def save_snapshot(infos, date=None, path=SNAPSHOT_PATH):
+    """
+    Saves the info of the tickers as the snapshot of a day; the tickers already in the snapshot of the day
+    are replaced and the others are kept
+    :param infos: dictionary of ticker -> info
+    :param date: snapshot date; today if None
+    :param path: snapshot folder
+    :return: snapshot file
+    """
+    os.makedirs(path, exist_ok=True)
+    file_name = snapshot_file(date, path)
+    table = to_table(infos, date)
+    if os.path.exists(file_name):
+        old = pq.read_table(file_name, schema=SCHEMA)
+        old = old.filter(pc.invert(pc.is_in(old['symbol'], value_set=table['symbol'])))
+        table = pa.concat_tables([old, table])
+    # Written to a temporary file first, so the readers never see a partial snapshot
+    pq.write_table(table.sort_by('symbol'), file_name + '.tmp', compression=COMPRESSION)
+    os.replace(file_name + '.tmp', file_name)
+    return file_name
+
+
+def load_snapshots(columns=None, tickers=None, start=None, end=None, path=SNAPSHOT_PATH):
+    """
+    Reads the snapshots as one DF; only the requested columns are read from the files
+    :param columns: fields to read; all the fields if None. Date and symbol are always read.
+    :param tickers: tickers to read; all the tickers if None
+    :param start: first snapshot date; the oldest if None
+    :param end: last snapshot date; the latest if None
+    :param path: snapshot folder
+    :return: DF with a row for each ticker and date, sorted by date and symbol
+    """
+    dates = [d for d in snapshot_dates(path)
+             if (start is None or d >= _to_date(start)) and (end is None or d <= _to_date(end))]
+    if columns is not None:
+        columns = ['Date', 'symbol'] + [column for column in columns if column not in ('Date', 'symbol')]
+    if not dates:
+        return SCHEMA.empty_table().select(columns or SCHEMA.names).to_pandas(date_as_object=False)
+
+    # The schema is given, so the fields added later are read as nulls from the older snapshots
+    dataset = ds.dataset([snapshot_file(d, path) for d in dates], schema=SCHEMA, format='parquet')
+    table = dataset.to_table(columns=columns,
+                             filter=None if tickers is None else ds.field('symbol').isin(list(tickers)))
+    return table.sort_by([('Date', 'ascending'), ('symbol', 'ascending')]).to_pandas(date_as_object=False)
+
+
+def load_snapshot(date=None, columns=None, tickers=None, path=SNAPSHOT_PATH):
+    """
+    Reads the snapshot of a day
+    :param date: snapshot date; the latest if None
+    :param columns: fields to read; all the fields if None
+    :param tickers: tickers to read; all the tickers if None
+    :param path: snapshot folder
+    :return: DF with a row for each ticker, indexed by symbol
+    """
+    if date is None:
+        dates = snapshot_dates(path)
+        if not dates:
+            raise FileNotFoundError(f'No snapshots found in {path}')
+        date = dates[-1]
+    df = load_snapshots(columns, tickers, start=date, end=date, path=path)
+    return df.drop(columns='Date').set_index('symbol')
+
+
+def read_json(path):
+    """
+    Reads the JSON files saved by the earlier save_info.py, one file per ticker
+    :param path: folder with the JSON files
+    :return: dictionary of ticker -> info
+    """
+    infos = {}
+    for file_name in sorted(glob.glob(os.path.join(path, '*.json'))):
+        with open(file_name, 'r') as file:
+            infos[os.path.basename(file_name)[:-len('.json')]] = json.load(file)
+    return infos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', '-j', type=str, required=True, help='Folder with the JSON files')
+    parser.add_argument('--date', '-d', type=str, help='Snapshot date, YYYY-MM-DD; today if not given')
+    parser.add_argument('--out', '-o', type=str, default=SNAPSHOT_PATH, help='Snapshot folder')
+    args = parser.parse_args()
+
+    print('saved to {}'.format(save_snapshot(read_json(args.json), args.date, args.out)))
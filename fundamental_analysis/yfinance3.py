@@ -1,78 +1,170 @@
-import requests, urllib
-
-class YFinance3:
-    user_agent_key = "User-Agent"
-    user_agent_value = ("Mozilla/5.0 (Windows NT 6.1; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/58.0.3029.110 Safari/537.36")
-
-    def __init__(self, ticker):
-        self.yahoo_ticker = ticker
-
-    def __str__(self):
-        return self.yahoo_ticker
+import os, random, threading, time, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Yahoo end points; set YF_COOKIE_URL and YF_BASE_URL to use another server, e.g. a local stand-in
+COOKIE_URL = os.environ.get("YF_COOKIE_URL", "https://fc.yahoo.com")
+BASE_URL = os.environ.get("YF_BASE_URL", "https://query1.finance.yahoo.com")
+
+# Seconds the cookie/crumb pair is reused for when the cookie has no expiry
+CRUMB_TTL = 3600
+# Number of requests in progress at a time
+WORKERS = 4
+# Retries for the throttled or failed requests, with exponential backoff from BACKOFF seconds
+RETRIES = 3
+BACKOFF = 1.0
+TIMEOUT = 30
+
+
+def create_session(workers=WORKERS):
+    """
+    Creates a session with a connection pool shared by the threads
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers[YFinance3.user_agent_key] = YFinance3.user_agent_value
+    return session
+
+
+class YahooAuth:
+    """
+    Cookie and crumb shared by the requests; fetched once and reused until the cookie expires
+    or Yahoo rejects the crumb
+    """
+
+    def __init__(self, session, cookie_url=COOKIE_URL, base_url=BASE_URL, ttl=CRUMB_TTL):
+        self.session = session
+        self.cookie_url = cookie_url
+        self.base_url = base_url
+        self.ttl = ttl
+        self.cookie = None
+        self.crumb = None
+        self.expires = 0
+        self.lock = threading.Lock()
 
     def _get_yahoo_cookie(self):
-        cookie = None
-
-        headers = {self.user_agent_key: self.user_agent_value}
-        response = requests.get("https://fc.yahoo.com",
-                                headers=headers,
-                                allow_redirects=True)
+        response = self.session.get(self.cookie_url, allow_redirects=True, timeout=TIMEOUT)
 
         if not response.cookies:
             raise Exception("Failed to obtain Yahoo auth cookie.")
 
-        cookie = list(response.cookies)[0]
-
-        return cookie
+        return list(response.cookies)[0]
 
     def _get_yahoo_crumb(self, cookie):
-        crumb = None
-
-        headers = {self.user_agent_key: self.user_agent_value}
-
-        crumb_response = requests.get(
-            "https://query1.finance.yahoo.com/v1/test/getcrumb",
-            headers=headers,
+        crumb_response = self.session.get(
+            f"{self.base_url}/v1/test/getcrumb",
             cookies={cookie.name: cookie.value},
             allow_redirects=True,
+            timeout=TIMEOUT,
         )
         crumb = crumb_response.text
 
-        if crumb is None:
+        if not crumb_response.ok or not crumb:
             raise Exception("Failed to retrieve Yahoo crumb.")
 
         return crumb
 
-    @property
+    def get(self):
+        """
+        Returns the cookie and the crumb, fetching them if expired
+        """
+        with self.lock:
+            if self.crumb is None or time.time() >= self.expires:
+                cookie = self._get_yahoo_cookie()
+                self.crumb = self._get_yahoo_crumb(cookie)
+                self.cookie = cookie
+                self.expires = min(cookie.expires or float("inf"), time.time() + self.ttl)
+            return self.cookie, self.crumb
+
+    def invalidate(self, crumb):
+        """
+        Drops the crumb if it's still the given one, so it's fetched once for all the threads
+        """
+        with self.lock:
+            if self.crumb == crumb:
+                self.crumb = None
+
+
+class YFinance3:
+    user_agent_key = "User-Agent"
+    user_agent_value = ("Mozilla/5.0 (Windows NT 6.1; Win64; x64) "
+                        "AppleWebKit/537.36 (KHTML, like Gecko) "
+                        "Chrome/58.0.3029.110 Safari/537.36")
+
+    yahoo_modules = ("financialData,"
+                     "quoteType,"
+                     "defaultKeyStatistics,"
+                     "assetProfile,"
+                     "summaryDetail")
+
+    # Shared by the instances created without a session
+    _session = None
+    _auth = None
+    _lock = threading.Lock()
+
+    def __init__(self, ticker, session=None, auth=None):
+        self.yahoo_ticker = ticker
+        if auth is None:
+            session, auth = self._shared() if session is None else (session, YahooAuth(session))
+        self.session = session or auth.session
+        self.auth = auth
+
+    def __str__(self):
+        return self.yahoo_ticker
+
+    @classmethod
+    def _shared(cls):
+        with cls._lock:
+            if cls._auth is None:
+                cls._session = create_session()
+                cls._auth = YahooAuth(cls._session)
+            return cls._session, cls._auth
+
+    def _get(self, url):
+        """
+        Calls Yahoo with the crumb, retrying with backoff when throttled or failed and
+        fetching a new crumb when it's rejected
+        """
+        for attempt in range(RETRIES + 1):
+            cookie, crumb = self.auth.get()
+            try:
+                response = self.session.get(
+                    f"{url}&crumb={urllib.parse.quote_plus(crumb)}",
+                    cookies={cookie.name: cookie.value},
+                    allow_redirects=True,
+                    timeout=TIMEOUT,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == RETRIES:
+                    raise
+            else:
+                if response.status_code in (401, 403):
+                    self.auth.invalidate(crumb)
+                elif response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt == RETRIES:
+                    response.raise_for_status()
+            # Jitter, so the threads don't retry together
+            time.sleep(BACKOFF * 2 ** attempt * (1 + random.random()))
+
+    @cached_property
     def info(self):
         # Yahoo modules doc informations :
         # https://cryptocointracker.com/yahoo-finance/yahoo-finance-api
-        cookie = self._get_yahoo_cookie()
-        crumb = self._get_yahoo_crumb(cookie)
-        info = {}
         ret = {}
 
-        headers = {self.user_agent_key: self.user_agent_value}
-
-        yahoo_modules = ("financialData,"
-                         "quoteType,"
-                         "defaultKeyStatistics,"
-                         "assetProfile,"
-                         "summaryDetail")
-
-        url = ("https://query1.finance.yahoo.com/v10/finance/"
+        url = (f"{self.auth.base_url}/v10/finance/"
                f"quoteSummary/{self.yahoo_ticker}"
-               f"?modules={urllib.parse.quote_plus(yahoo_modules)}"
-               f"&ssl=true&crumb={urllib.parse.quote_plus(crumb)}")
-
-        info_response = requests.get(url,
-                                     headers=headers,
-                                     cookies={cookie.name: cookie.value},
-                                     allow_redirects=True)
+               f"?modules={urllib.parse.quote_plus(self.yahoo_modules)}"
+               f"&ssl=true")
 
-        info = info_response.json()
+        info = self._get(url)
         info = info['quoteSummary']['result'][0]
 
         for mainKeys in info.keys():
@@ -85,4 +177,26 @@ class YFinance3:
                 else:
                     ret[key] = info[mainKeys][key]
 
-        return ret
\ No newline at end of file
+        return ret
+
+
+def fetch_info(tickers, workers=WORKERS, session=None, auth=None):
+    """
+    Fetches the info of the tickers concurrently; the session and the cookie/crumb are shared
+    by all the requests
+    :param tickers: ticker symbols
+    :param workers: requests in progress at a time
+    :return: tuple of ticker -> info for the fetched tickers and ticker -> error for the failed ones
+    """
+    if auth is None:
+        auth = YahooAuth(session or create_session(workers))
+    results, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {ticker: executor.submit(lambda t: YFinance3(t, auth=auth).info, ticker)
+                   for ticker in tickers}
+        for ticker, future in futures.items():
+            try:
+                results[ticker] = future.result()
+            except Exception as e:
+                failed[ticker] = e
+    return results, failed
@@ -0,0 +1,387 @@
+"""
+Fundamentals of a ticker - the income statement, balance sheet and cash flow statement are read once with the
+info, and kept as one table of line items x fiscal periods (latest first). The statements are cached on disk
+by ticker and fiscal period, so the notebooks (Piotroski, Altman Z-Score, stock screener) don't download the same
+statements again for each ratio. The info (price, forward P/E, dividend yield, ...) changes daily, so it is cached
+separately for a shorter time and read again on its own.
+
+The ratios are plain functions of the fundamentals; a missing line item gives NaN rather than an error.
+
+from fundamentals import load, piotroski, z_score
+f = load('NVDA')
+criteria, raw = piotroski(f)
+"""
+
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import yfinance as yf
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+# Folder for the cached fundamentals; set FUNDAMENTALS_CACHE to use another folder
+CACHE_DIR = os.environ.get('FUNDAMENTALS_CACHE', 'out/fundamentals')
+# Seconds before the cached statements are read again, e.g. to pick up a new fiscal year
+CACHE_TTL = 7 * 24 * 3600
+# Seconds before the cached info is read again
+INFO_TTL = 3600
+
+# Altman Z-Score zones
+Z_DISTRESS = 1.8
+Z_SAFE = 2.99
+
+# End of Constants ---------------------------------------------------------
+
+class NoStatementsError(LookupError):
+    """
+    A ticker without any statements, e.g. an ETF; reading it again doesn't help
+    """
+
+class Fundamentals:
+    def __init__(self, symbol, items, info):
+        """
+        :param symbol: ticker symbol
+        :param items: DF of line items (index) x fiscal period end dates (columns), latest first
+        :param info: ticker info
+        """
+        self.symbol = symbol
+        self.items = items
+        self.info = info
+        # Row of each line item, so a value is a positional lookup
+        self._rows = {item: i for i, item in enumerate(items.index)}
+        self._values = items.to_numpy(dtype='float64', na_value=np.nan)
+
+    @classmethod
+    def from_ticker(cls, ticker):
+        """
+        Reads the statements and the info of a yfinance Ticker, once each
+        :param ticker: yf.Ticker
+        """
+        # Statements in this order, so a line item in more than one statement is taken from the first one
+        statements = [ticker.income_stmt, ticker.balance_sheet, ticker.cash_flow]
+        statements = [df for df in statements if df is not None and not df.empty]
+        if not statements:
+            raise NoStatementsError(f'No statements for {ticker.ticker}')
+        items = pd.concat(statements)
+        items = items[~items.index.duplicated()]
+        items = items.reindex(columns=sorted(items.columns, reverse=True)).apply(pd.to_numeric, errors='coerce')
+        items.columns = pd.DatetimeIndex(items.columns)
+        return cls(ticker.ticker, items.astype('float64'), ticker.info)
+
+    @classmethod
+    def from_info(cls, symbol, info):
+        """
+        Fundamentals without the statements, for the screeners that only use the info
+        """
+        return cls(symbol, pd.DataFrame(index=pd.Index([]), columns=pd.DatetimeIndex([]), dtype='float64'), info)
+
+    @property
+    def period(self):
+        """
+        Latest fiscal period end date, None if there are no statements
+        """
+        return self.items.columns[0] if len(self.items.columns) else None
+
+    def value(self, item, period=0):
+        """
+        Returns a line item
+        :param item: line item, e.g. 'Total Assets'
+        :param period: fiscal period, 0 for the latest, 1 for the previous, ...
+        :return the value or NaN if not found
+        """
+        row = self._rows.get(item)
+        if row is None or period >= self._values.shape[1]:
+            return np.nan
+        return self._values[row, period]
+
+    def has(self, item):
+        return item in self._rows
+
+    def save(self, cache_dir=CACHE_DIR):
+        """
+        Saves the statements as a Parquet file keyed by the ticker and the latest fiscal period, and the info
+        (see save_info)
+        :return file name of the statements; None if there are no statements
+        """
+        save_info(self.symbol, self.info, cache_dir)
+        if self.period is None:
+            return None
+        file_name = cache_file(self.symbol, self.period, cache_dir)
+        table = pa.Table.from_pandas(self.items.T.rename_axis('Period'))
+        # Written to a temporary file first, so the readers never see a partial file
+        pq.write_table(table, file_name + '.tmp', compression='zstd')
+        os.replace(file_name + '.tmp', file_name)
+        return file_name
+
+    @classmethod
+    def read(cls, file_name, info=None):
+        """
+        Reads the statements saved by save
+        :param file_name: statements file
+        :param info: ticker info, e.g. from read_info; empty if None
+        """
+        table = pq.read_table(file_name)
+        symbol = os.path.basename(file_name).rsplit('_', 1)[0]
+        items = table.to_pandas().T
+        items.columns = pd.DatetimeIndex(items.columns)
+        return cls(symbol, items.astype('float64'), {} if info is None else info)
+
+def cache_file(symbol, period, cache_dir=CACHE_DIR):
+    """
+    Returns the cache file of a ticker and fiscal period
+    """
+    period = 'none' if period is None else f'{pd.Timestamp(period):%Y-%m-%d}'
+    return os.path.join(cache_dir, f'{symbol}_{period}.parquet')
+
+def info_file(symbol, cache_dir=CACHE_DIR):
+    """
+    Returns the cache file of the info of a ticker; the info is not kept by fiscal period
+    """
+    return os.path.join(cache_dir, f'{symbol}_info.json')
+
+def save_info(symbol, info, cache_dir=CACHE_DIR):
+    """
+    Saves the info of a ticker
+    :return file name
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    file_name = info_file(symbol, cache_dir)
+    with open(file_name + '.tmp', 'w') as file:
+        json.dump(info, file, default=str)
+    os.replace(file_name + '.tmp', file_name)
+    return file_name
+
+def read_info(symbol, max_age=INFO_TTL, cache_dir=CACHE_DIR):
+    """
+    Returns the cached info of a ticker without reading Yahoo
+    :param symbol: ticker symbol
+    :param max_age: seconds the cached info is used for; None to always use the cache
+    :param cache_dir: cache folder
+    :return dictionary or None if not cached or too old
+    """
+    file_name = info_file(symbol, cache_dir)
+    if os.path.exists(file_name) and (max_age is None or time.time() - os.path.getmtime(file_name) < max_age):
+        with open(file_name) as file:
+            return json.load(file)
+    return None
+
+def _latest_file(symbol, cache_dir):
+    # The latest saved, which is the latest fiscal period unless an older period was read again
+    files = glob.glob(os.path.join(glob.escape(cache_dir), f'{glob.escape(symbol)}_*.parquet'))
+    files = [file for file in files if os.path.basename(file).rsplit('_', 1)[0] == symbol]
+    return max(files, key=os.path.getmtime) if files else None
+
+def _statements_file(symbol, period, max_age, cache_dir):
+    """
+    Returns the cached statements file of a ticker, None if not cached or too old
+    """
+    if period is not None:
+        file_name = cache_file(symbol, period, cache_dir)
+        return file_name if os.path.exists(file_name) else None
+    file_name = _latest_file(symbol, cache_dir)
+    if file_name and (max_age is None or time.time() - os.path.getmtime(file_name) < max_age):
+        return file_name
+    return None
+
+def read_cache(symbol, period=None, max_age=CACHE_TTL, cache_dir=CACHE_DIR, info_max_age=INFO_TTL):
+    """
+    Returns the cached fundamentals of a ticker without reading Yahoo
+    :param symbol: ticker symbol
+    :param period: fiscal period end date, e.g. '2023-12-31'; the latest if None
+    :param max_age: seconds the cached statements are used for; None to always use the cache
+    :param cache_dir: cache folder
+    :param info_max_age: seconds the cached info is used for; None to always use the cache
+    :return Fundamentals or None if the statements or the info are not cached or too old
+    """
+    file_name = _statements_file(symbol, period, max_age, cache_dir)
+    info = read_info(symbol, info_max_age, cache_dir)
+    if file_name is None or info is None:
+        return None
+    return Fundamentals.read(file_name, info)
+
+def load(symbol, period=None, max_age=CACHE_TTL, cache_dir=CACHE_DIR, ticker=None, info_max_age=INFO_TTL):
+    """
+    Returns the fundamentals of a ticker; the statements are taken from the cache if they were saved in the last
+    max_age seconds and the info if it was saved in the last info_max_age seconds, else only the info is read
+    :param symbol: ticker symbol
+    :param period: fiscal period end date to read from the cache, e.g. '2023-12-31'; the latest if None
+    :param max_age: seconds the cached statements are used for; None to always use the cache
+    :param cache_dir: cache folder; None to not use the cache
+    :param ticker: yf.Ticker to read from; a new Ticker if None
+    :param info_max_age: seconds the cached info is used for; None to always use the cache
+    :return Fundamentals
+    """
+    ticker = ticker or yf.Ticker(symbol)
+    file_name = None if cache_dir is None else _statements_file(symbol, period, max_age, cache_dir)
+    if file_name is None:
+        f = Fundamentals.from_ticker(ticker)
+        if cache_dir is not None:
+            f.save(cache_dir)
+        return f
+
+    info = read_info(symbol, info_max_age, cache_dir)
+    if info is None:
+        info = ticker.info
+        save_info(symbol, info, cache_dir)
+    return Fundamentals.read(file_name, info)
+
+# Ratios ---------------------------------------------------------
+
+def net_income(f, period=0):
+    return f.value('Net Income', period)
+
+def average_assets(f, period=0):
+    """
+    Average of the total assets at the start and the end of a fiscal period
+    """
+    return (f.value('Total Assets', period) + f.value('Total Assets', period + 1)) / 2
+
+def roa(f):
+    return np.round(net_income(f) / average_assets(f), 2)
+
+def ocf(f):
+    if f.has('Operating Cash Flow'):
+        return f.value('Operating Cash Flow')
+    # Calculate Operating Cash Flow using Free Cash Flow and Captial Expenditure
+    # Take the absolute value for Captial Expenditure as yf returns as a negative number
+    return f.value('Free Cash Flow') + abs(f.value('Capital Expenditure'))
+
+def ltdebt(f):
+    """
+    Decrease of the long term debt
+    """
+    return f.value('Long Term Debt', 1) - f.value('Long Term Debt')
+
+def current_ratio(f):
+    """
+    Change of total assets / total liabilities
+    """
+    def ratio(period):
+        return f.value('Total Assets', period) / f.value('Total Liabilities Net Minority Interest', period)
+    return np.round(ratio(0) - ratio(1), 2)
+
+def new_shares(f):
+    """
+    Decrease of the common stock
+    """
+    return f.value('Common Stock', 1) - f.value('Common Stock')
+
+def gross_margin(f):
+    """
+    Change of the gross margin
+    """
+    def margin(period):
+        return f.value('Gross Profit', period) / f.value('Total Revenue', period)
+    return margin(0) - margin(1)
+
+def asset_turnover(f, period=0):
+    """
+    Total revenue / average total assets
+    """
+    return f.value('Total Revenue', period) / average_assets(f, period)
+
+def asset_turnover_ratio(f):
+    """
+    Change of the asset turnover
+    """
+    return np.round(asset_turnover(f) - asset_turnover(f, 1), 2)
+
+def inventory_turnover(f):
+    avg_inventory = (f.value('Inventory') + f.value('Inventory', 1)) / 2
+    return f.value('Cost Of Revenue') / avg_inventory
+
+def roce(f):
+    """
+    Return on capital employed: EBIT / (total assets - current liabilities)
+    """
+    return f.value('EBIT') / (f.value('Total Assets') - f.value('Current Liabilities'))
+
+def operating_margin(f):
+    """
+    Operating income / total revenue; the operating margin from the info if there is no operating income
+    """
+    if f.has('Operating Income'):
+        return f.value('Operating Income') / f.value('Total Revenue')
+    return f.info.get('operatingMargins', np.nan)
+
+# Piotroski criteria that are computed from the statements; CR4 is computed from CR1 and CR3
+PIOTROSKI_CRITERIA = {
+    'CR1': net_income,
+    'CR2': roa,
+    'CR3': ocf,
+    'CR5': ltdebt,
+    'CR6': current_ratio,
+    'CR7': new_shares,
+    'CR8': gross_margin,
+    'CR9': asset_turnover_ratio
+}
+
+def piotroski(f):
+    """
+    Piotroski criteria of a ticker
+    :param f: Fundamentals
+    :return tuple of criteria -> 1 or 0 and criteria -> raw value; the raw value is NaN for missing data
+    """
+    raw = {key: criterion(f) for key, criterion in PIOTROSKI_CRITERIA.items()}
+    # No new shares, i.e. the difference between current and previous is 0, passes as well
+    scores = {key: int(value >= 0 if key == 'CR7' else value > 0) for key, value in raw.items()}
+    # Cash flow from operations being greater than net income (quality of earnings)
+    raw['CR4'] = scores['CR4'] = int(raw['CR3'] > raw['CR1'])
+    order = sorted(scores, key=lambda key: int(key[2:]))
+    return {key: scores[key] for key in order}, {key: raw[key] for key in order}
+
+# Altman Z-Score ratios
+
+def ratio_x_1(f):
+    """
+    working capital / total assets
+    """
+    return (f.value('Current Assets') - f.value('Current Liabilities')) / f.value('Total Assets')
+
+def ratio_x_2(f):
+    """
+    retained earnings / total assets
+    """
+    return f.value('Retained Earnings') / f.value('Total Assets')
+
+def ratio_x_3(f):
+    """
+    earnings before interest and tax / total assets
+    """
+    return f.value('EBIT') / f.value('Total Assets')
+
+def ratio_x_4(f):
+    """
+    market value of equity / total liabilities
+    """
+    equity_market_value = f.info.get('sharesOutstanding', np.nan) * f.info.get('currentPrice', np.nan)
+    return equity_market_value / f.value('Total Liabilities Net Minority Interest')
+
+def ratio_x_5(f):
+    """
+    sales / total assets
+    """
+    return f.value('Total Revenue') / f.value('Total Assets')
+
+def z_score(f):
+    # Z = 1.2X1 + 1.4X2 + 3.3X3 + 0.6X4 + 1.0X5.
+    return 1.2*ratio_x_1(f) + 1.4*ratio_x_2(f) + 3.3*ratio_x_3(f) + 0.6*ratio_x_4(f) + 1.0*ratio_x_5(f)
+
+def z_zone(zscore):
+    """
+    Returns the zone of a Z-Score: Distress, Grey or Safe; None for NaN
+    """
+    if np.isnan(zscore):
+        return None
+    if zscore <= Z_DISTRESS:
+        return 'Distress'
+    return 'Grey' if zscore <= Z_SAFE else 'Safe'
@@ -0,0 +1,198 @@
+"""
+Ranks the tickers on all the metrics at once for the stock picker (yf_stock_picker_p2.ipynb) - each metric is
+ranked higher or lower the better, the ranks are turned into scores out of 1 and the weighted scores are summed
+into a total score out of 10 with a matrix product.
+
+A ticker without a metric isn't ranked on it and scores 0. Tied values share the same rank by default (1, 2, 2, 4).
+
+Ranking keeps the ranks of all the tickers, so when the metrics of one ticker change only the ranks between its
+old and new values are moved rather than all the values sorted again.
+
+from ranking import Ranking
+ranking = Ranking(key_metrics_value_df, ASCENDING, WEIGHTS)
+ranking.update('NVDA', {'P/E ratio': 35.2})
+key_metrics_score_df = ranking.table()
+"""
+
+import numpy as np
+import pandas as pd
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+# Rank of tied values: min (1, 2, 2, 4), max (1, 3, 3, 4), average (1, 2.5, 2.5, 4), dense (1, 2, 2, 3)
+# or ordinal (1, 2, 3, 4 in the order of the tickers)
+METHODS = ('min', 'max', 'average', 'dense', 'ordinal')
+# Total score is out of
+TOTAL = 10
+
+# End of Constants ---------------------------------------------------------
+
+def _keys(values, ascending):
+    """
+    Returns the values as sort keys where a lower key is better
+    """
+    return np.where(ascending, values, -values)
+
+def rank(df, ascending, method='min'):
+    """
+    Ranks the tickers on each metric
+    :param df: DF of tickers x metrics; NaN for a missing metric
+    :param ascending: true if a lower value is better, for each metric or for all the metrics
+    :param method: rank of tied values, one of METHODS
+    :return DF of ranks, 1 for the best; NaN for a missing metric
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown method {method}, valid methods are {METHODS}')
+    values = df.to_numpy(dtype='float64', na_value=np.nan)
+    ascending = np.broadcast_to(np.asarray(ascending, dtype=bool), values.shape[1:])
+    keys = _keys(values, ascending)
+    n = len(keys)
+    # NaN sorts last; stable, so the ties are in the order of the tickers
+    order = np.argsort(keys, axis=0, kind='stable')
+    sorted_keys = np.take_along_axis(keys, order, axis=0)
+    positions = np.arange(n)[:, None]
+
+    if method == 'ordinal':
+        sorted_ranks = np.broadcast_to(positions + 1, keys.shape).astype('float64')
+    else:
+        # First row of each group of tied values
+        first = np.ones(keys.shape, dtype=bool)
+        first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        if method == 'dense':
+            sorted_ranks = np.cumsum(first, axis=0).astype('float64')
+        else:
+            low = np.maximum.accumulate(np.where(first, positions, 0), axis=0) + 1
+            last = np.ones(keys.shape, dtype=bool)
+            last[:-1] = first[1:]
+            high = n - np.maximum.accumulate(np.where(last, n - 1 - positions, 0)[::-1], axis=0)[::-1]
+            sorted_ranks = {'min': low, 'max': high, 'average': (low + high) / 2}[method].astype('float64')
+
+    ranks = np.empty(keys.shape)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=0)
+    ranks[np.isnan(values)] = np.nan
+    return pd.DataFrame(ranks, index=df.index, columns=df.columns)
+
+def rank_scores(ranks, counts, decimals=2):
+    """
+    Turns the ranks into scores out of 1: (count - rank + 1) / count, 0 for a missing metric
+    :param ranks: DF of ranks
+    :param counts: number of tickers ranked on each metric
+    :param decimals: decimals to round the scores to
+    :return DF of scores
+    """
+    counts = np.asarray(counts, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = ((counts - ranks.to_numpy()) + 1) / counts
+    return pd.DataFrame(np.nan_to_num(scores.round(decimals), nan=0.0), index=ranks.index, columns=ranks.columns)
+
+def total_scores(scores, weights, decimals=2):
+    """
+    Weighted sum of the scores, normalised out of TOTAL
+    :param scores: DF of scores out of 1
+    :param weights: weight of each metric
+    :param decimals: decimals to round the total scores to
+    :return Series of total scores
+    """
+    weights = np.asarray(weights, dtype='float64')
+    return pd.Series((scores.to_numpy() @ weights / weights.sum() * TOTAL).round(decimals), index=scores.index,
+                     name='Total Score')
+
+def score_table(df, ascending, weights, method='min'):
+    """
+    Scores of each metric, the total score and the ranking of the total score
+    :param df: DF of tickers x metrics; NaN for a missing metric
+    :param ascending: true if a lower value is better, for each metric
+    :param weights: weight of each metric
+    :param method: rank of tied values, one of METHODS
+    :return DF with '<metric> Score' columns, Total Score and Ranking
+    """
+    scores = rank_scores(rank(df, ascending, method), df.notna().sum().to_numpy())
+    return _table(scores, total_scores(scores, weights), method)
+
+def _table(scores, total, method):
+    table = scores.add_suffix(' Score')
+    table['Total Score'] = total
+    ranking = rank(total.to_frame(), False, method)['Total Score']
+    # The average of tied ranks can be fractional, e.g. 2.5
+    table['Ranking'] = ranking if method == 'average' else ranking.astype(int)
+    return table
+
+class Ranking:
+    def __init__(self, df, ascending, weights, method='min'):
+        """
+        Ranks that are updated when the metrics of a ticker change
+        :param df: DF of tickers x metrics; NaN for a missing metric
+        :param ascending: true if a lower value is better, for each metric
+        :param weights: weight of each metric
+        :param method: rank of tied values; min, max or average
+        """
+        if method not in ('min', 'max', 'average'):
+            raise ValueError(f'Unknown method {method}, valid methods are min, max or average')
+        self.columns = df.columns
+        self.symbols = list(df.index)
+        self.rows = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.ascending = np.broadcast_to(np.asarray(ascending, dtype=bool), len(self.columns))
+        self.weights = weights
+        self.method = method
+        self.keys = _keys(df.to_numpy(dtype='float64', na_value=np.nan), self.ascending)
+        # Sorted keys of each metric without the missing ones
+        self.sorted = [np.sort(column[~np.isnan(column)]) for column in self.keys.T]
+        # Lowest and highest rank of each key: number of better keys + 1, and number of better or equal keys
+        self.low = np.full(self.keys.shape, np.nan)
+        self.high = np.full(self.keys.shape, np.nan)
+        for j in range(len(self.columns)):
+            self._rank_rows(j, ~np.isnan(self.keys[:, j]))
+
+    def _rank_rows(self, j, rows):
+        keys = self.keys[rows, j]
+        self.low[rows, j] = np.searchsorted(self.sorted[j], keys, side='left') + 1
+        self.high[rows, j] = np.searchsorted(self.sorted[j], keys, side='right')
+
+    def update(self, symbol, values):
+        """
+        Updates the metrics of a ticker; a new ticker is added. Only the ranks of the keys between the old and
+        the new key move, by one, so the other keys are not ranked again.
+        :param symbol: ticker symbol
+        :param values: dictionary or Series of metric -> value; NaN if missing. The metrics not given are kept.
+        """
+        row = self.rows.get(symbol)
+        if row is None:
+            row = self.rows[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            missing = np.full((1, len(self.columns)), np.nan)
+            self.keys, self.low, self.high = (np.vstack([a, missing]) for a in (self.keys, self.low, self.high))
+        for j, column in enumerate(self.columns):
+            if column not in values:
+                continue
+            old = self.keys[row, j]
+            new = _keys(np.float64(values[column]), self.ascending[j])
+            keys = self.keys[:, j]
+            # NaN compares false, so the missing keys are not changed
+            if not np.isnan(old):
+                self.sorted[j] = np.delete(self.sorted[j], np.searchsorted(self.sorted[j], old))
+                self.low[:, j] -= keys > old
+                self.high[:, j] -= keys >= old
+            if not np.isnan(new):
+                self.sorted[j] = np.insert(self.sorted[j], np.searchsorted(self.sorted[j], new), new)
+                self.low[:, j] += keys > new
+                self.high[:, j] += keys >= new
+            self.keys[row, j] = new
+            self.low[row, j] = self.high[row, j] = np.nan
+            if not np.isnan(new):
+                self._rank_rows(j, [row])
+
+    def ranks(self):
+        """
+        :return DF of ranks, 1 for the best; NaN for a missing metric
+        """
+        ranks = {'min': self.low, 'max': self.high, 'average': (self.low + self.high) / 2}[self.method]
+        return pd.DataFrame(ranks, index=self.symbols, columns=self.columns)
+
+    def table(self):
+        """
+        :return DF with '<metric> Score' columns, Total Score and Ranking; see score_table
+        """
+        scores = rank_scores(self.ranks(), [len(sorted_keys) for sorted_keys in self.sorted])
+        return _table(scores, total_scores(scores, self.weights), self.method)
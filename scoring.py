@@ -0,0 +1,226 @@
+"""
+Cross-sectional scoring - the fundamentals of all the tickers are stacked into one panel of tickers x line items
+x fiscal periods, and the Piotroski criteria, Altman Z-Score components and screener ratios are computed for all
+the tickers at once as array operations. Missing data is NaN and propagates to the ratios; a NaN criterion
+fails, same as a missing line item in the notebooks.
+
+The panel has the same value/has interface as Fundamentals, so the ratio functions of fundamentals.py that are
+plain arithmetic work on it unchanged.
+
+from fundamentals import load
+from scoring import Panel, piotroski
+panel = Panel.from_fundamentals([load(symbol) for symbol in SYMBOLS])
+criteria, raw = piotroski(panel)
+"""
+
+import numpy as np
+import pandas as pd
+
+import fundamentals as fa
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+# Fiscal periods kept for each ticker, latest first
+PERIODS = 4
+
+# Screener ratios -> info field; the other screener ratios are computed from the statements
+INFO_RATIOS = {
+    'EPS fwd': 'forwardEps',
+    'PE fwd': 'forwardPE',
+    'PEG': 'pegRatio',
+    'PB': 'priceToBook',
+    'ROE': 'returnOnEquity',
+    'D2E': 'debtToEquity',
+    'CR': 'currentRatio',
+    'QR': 'quickRatio',
+    'Beta': 'beta',
+    'Price': 'currentPrice',
+    '52w Low': 'fiftyTwoWeekLow',
+    '52w High': 'fiftyTwoWeekHigh'
+}
+
+# Screener ratios in the order of the screener notebook
+SCREENER_RATIOS = ['EPS fwd', 'PE fwd', 'PEG', 'PB', 'ROE', 'ROCE', 'FCFY', 'D2E', 'CR', 'QR', 'Asset TR', 'DY',
+                   'Beta', 'Price', '52w Low', '52w High']
+
+# End of Constants ---------------------------------------------------------
+
+class Panel:
+    def __init__(self, symbols, items, values, present, info):
+        """
+        :param symbols: ticker symbols
+        :param items: line items
+        :param values: array of tickers x line items x fiscal periods (latest first)
+        :param present: boolean array of tickers x line items; true if the ticker has the line item
+        :param info: DF of the ticker info, indexed by symbol
+        """
+        self.symbols = pd.Index(symbols, name='Symbol')
+        self.items = list(items)
+        self.values = values
+        self.present = present
+        self.info = info
+        self._rows = {item: i for i, item in enumerate(self.items)}
+
+    @classmethod
+    def from_fundamentals(cls, fundamentals, items=None, periods=PERIODS):
+        """
+        Stacks the fundamentals of the tickers; the fiscal periods are aligned by position, latest first
+        :param fundamentals: list of Fundamentals
+        :param items: line items to keep; all the line items if None
+        :param periods: fiscal periods to keep
+        :return Panel
+        """
+        if items is None:
+            items = list(dict.fromkeys(item for f in fundamentals for item in f.items.index))
+        rows = {item: i for i, item in enumerate(items)}
+        values = np.full((len(fundamentals), len(items), periods), np.nan)
+        present = np.zeros((len(fundamentals), len(items)), dtype=bool)
+        for t, f in enumerate(fundamentals):
+            # Rows of the ticker's line items in the panel; -1 for the line items not kept
+            dest = np.array([rows.get(item, -1) for item in f.items.index], dtype=int)
+            keep = dest >= 0
+            src = f.items.to_numpy(dtype='float64', na_value=np.nan)[keep, :periods]
+            values[t, dest[keep], :src.shape[1]] = src
+            present[t, dest[keep]] = True
+        symbols = [f.symbol for f in fundamentals]
+        info = pd.DataFrame.from_records([f.info for f in fundamentals], index=pd.Index(symbols, name='Symbol'))
+        return cls(symbols, items, values, present, info)
+
+    def value(self, item, period=0):
+        """
+        Returns a line item of all the tickers
+        :param item: line item, e.g. 'Total Assets'
+        :param period: fiscal period, 0 for the latest, 1 for the previous, ...
+        :return array of the values; NaN where not found
+        """
+        row = self._rows.get(item)
+        if row is None or period >= self.values.shape[2]:
+            return np.full(len(self.symbols), np.nan)
+        return self.values[:, row, period]
+
+    def has(self, item):
+        """
+        :return boolean array; true for the tickers with the line item
+        """
+        row = self._rows.get(item)
+        return np.zeros(len(self.symbols), dtype=bool) if row is None else self.present[:, row]
+
+    def info_value(self, field):
+        """
+        Returns an info field of all the tickers as numbers
+        :return array of the values; NaN where not found or not a number
+        """
+        if field not in self.info.columns:
+            return np.full(len(self.symbols), np.nan)
+        return pd.to_numeric(self.info[field], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+def _frame(panel, columns):
+    return pd.DataFrame(columns, index=panel.symbols)
+
+# Functions of fundamentals.py that branch on a single ticker
+
+def ocf(panel):
+    # Operating Cash Flow from Free Cash Flow and Captial Expenditure if there is no Operating Cash Flow
+    return np.where(panel.has('Operating Cash Flow'), panel.value('Operating Cash Flow'),
+                    panel.value('Free Cash Flow') + np.abs(panel.value('Capital Expenditure')))
+
+def operating_margin(panel):
+    # The operating margin from the info if there is no operating income
+    return np.where(panel.has('Operating Income'),
+                    panel.value('Operating Income') / panel.value('Total Revenue'),
+                    panel.info_value('operatingMargins'))
+
+def ratio_x_4(panel):
+    # market value of equity / total liabilities
+    equity_market_value = panel.info_value('sharesOutstanding') * panel.info_value('currentPrice')
+    return equity_market_value / panel.value('Total Liabilities Net Minority Interest')
+
+def piotroski(panel):
+    """
+    Piotroski criteria of all the tickers
+    :param panel: Panel
+    :return tuple of DFs indexed by symbol: criteria CR1..CR9 (1 or 0) and their raw values (NaN for missing data)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw = {key: np.asarray(criterion(panel), dtype='float64')
+               for key, criterion in (fa.PIOTROSKI_CRITERIA | {'CR3': ocf}).items()}
+    # No new shares, i.e. the difference between current and previous is 0, passes as well; NaN fails
+    scores = {key: (value >= 0 if key == 'CR7' else value > 0).astype(int) for key, value in raw.items()}
+    # Cash flow from operations being greater than net income (quality of earnings)
+    raw['CR4'] = scores['CR4'] = (raw['CR3'] > raw['CR1']).astype(int)
+    order = sorted(scores, key=lambda key: int(key[2:]))
+    return _frame(panel, {key: scores[key] for key in order}), _frame(panel, {key: raw[key] for key in order})
+
+def z_components(panel):
+    """
+    Altman Z-Score and its components for all the tickers
+    :param panel: Panel
+    :return DF indexed by symbol with X1..X5, Z and Zone (Distress, Grey or Safe; NaN for a NaN Z)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df = _frame(panel, {'X1': fa.ratio_x_1(panel), 'X2': fa.ratio_x_2(panel), 'X3': fa.ratio_x_3(panel),
+                            'X4': ratio_x_4(panel), 'X5': fa.ratio_x_5(panel)})
+    # Z = 1.2X1 + 1.4X2 + 3.3X3 + 0.6X4 + 1.0X5.
+    df['Z'] = df[['X1', 'X2', 'X3', 'X4', 'X5']].to_numpy() @ np.array([1.2, 1.4, 3.3, 0.6, 1.0])
+    z = df['Z'].to_numpy()
+    df['Zone'] = np.select([np.isnan(z), z <= fa.Z_DISTRESS, z <= fa.Z_SAFE], [None, 'Distress', 'Grey'], 'Safe')
+    return df
+
+def screener_ratios(panel):
+    """
+    Ratios of the stock screener for all the tickers
+    :param panel: Panel
+    :return DF indexed by symbol with the SCREENER_RATIOS columns; NaN where not available
+    """
+    columns = {ratio: panel.info_value(field) for ratio, field in INFO_RATIOS.items()}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['ROCE'] = fa.roce(panel)
+        columns['Asset TR'] = fa.asset_turnover(panel)
+        columns['FCFY'] = np.round(panel.info_value('freeCashflow') / panel.info_value('marketCap') * 100, 2)
+    # No dividends if not available
+    columns['DY'] = np.nan_to_num(panel.info_value('dividendYield'), nan=0.0) * 100
+    return _frame(panel, columns)[SCREENER_RATIOS]
+
+def band_scores(values, lower_better):
+    """
+    Scores the values of a ratio by the standard deviation bands around the mean of all the tickers. A ratio such
+    as PE which prefers a lower value scores:
+    1 between -1 std and mean, 2 between -2 std and -1 std, 3 under -2 std,
+    -1 between mean and +1 std, -2 between +1 std and +2 std and -3 over +2 std.
+    A ratio such as ROE which prefers a higher value scores the other way round.
+    :param values: values of a ratio for all the tickers
+    :param lower_better: true if a lower value is better
+    :return array of scores; NaN for NaN values, which are not included in the mean and std
+    """
+    values = np.asarray(values, dtype='float64')
+    valid = values[~np.isnan(values)]
+    # Sample std, same as statistics.stdev
+    mean, std = (valid.mean(), valid.std(ddof=1)) if len(valid) > 1 else (np.nan, np.nan)
+    if lower_better:
+        conditions = [(mean - std < values) & (values <= mean), (mean - 2 * std < values) & (values <= mean - std),
+                      values <= mean - 2 * std, (mean < values) & (values <= mean + std),
+                      (mean + std < values) & (values <= mean + 2 * std)]
+    else:
+        conditions = [(mean <= values) & (values < mean + std), (mean + std <= values) & (values < mean + 2 * std),
+                      values >= mean + 2 * std, (mean - std <= values) & (values < mean),
+                      (mean - 2 * std <= values) & (values < mean - std)]
+    scores = np.select(conditions, [1, 2, 3, -1, -2], -3).astype('float64')
+    scores[np.isnan(values)] = np.nan
+    return scores
+
+def cross_section_scores(df, lower_better, higher_better):
+    """
+    Replaces the ratios with their band scores and adds the total Score
+    :param df: DF with a row for each ticker
+    :param lower_better: ratios where a lower value is better, e.g. PE
+    :param higher_better: ratios where a higher value is better, e.g. ROE
+    :return copy of the DF with the scores
+    """
+    scores = {ratio: band_scores(df[ratio], True) for ratio in lower_better}
+    scores |= {ratio: band_scores(df[ratio], False) for ratio in higher_better}
+    df_score = df.assign(**scores)
+    # NaN if any of the scores is NaN
+    df_score['Score'] = df_score[list(lower_better) + list(higher_better)].sum(axis=1, skipna=False)
+    return df_score
@@ -0,0 +1,472 @@
+'''
+Request and response helpers shared by the Flask (app.py) and the ASGI (asgi_app.py) services; these take
+the request arguments rather than the request, as the two frameworks have their own request objects.
+
+The argument validation, paging and response dictionaries of all the routes are here, so the two services
+only differ in how the backend is called (awaited or not) and give the same JSON responses. A validation
+error is raised as an ApiError, which both services return as {'error': message} with a 404 status.
+'''
+# To build the page links
+from urllib.parse import urlencode
+
+from constants import SubConstants as SubConst, AppConfig
+# JSON:API serialisation
+from serializers import epoch_to_datetime, sub_items, num_items
+
+# ---------------------------------------------------------------------------------------
+# Constants for Form 10-K and 10-Q
+F10K = SubConst.F10K.value
+F10Q = SubConst.F10Q.value
+
+# Valid quarters
+QTRS = SubConst.QTRS.value
+
+# API version
+API_VERSION = AppConfig.API_VERSION.value
+
+# Maximum number of tickers in a batch request
+MAX_BATCH_TICKERS = AppConfig.MAX_BATCH_TICKERS.value
+
+# Page sizes
+PAGE_SIZE = AppConfig.PAGE_SIZE.value
+MAX_PAGE_SIZE = AppConfig.MAX_PAGE_SIZE.value
+
+# Media type for the streaming responses
+NDJSON = 'application/x-ndjson'
+
+# --------------------------------------------------------------------------------------------------
+
+class ApiError(Exception):
+    '''
+    Invalid request or no records found; returned as {'error': message} with the status
+    '''
+    def __init__(self, message:str, status:int=404):
+        super().__init__(message)
+        self.status = status
+
+    def to_dict(self) -> dict:
+        return {'error': str(self)}
+
+def is_ndjson(args, accept_mimetypes) -> bool:
+    '''
+    Returns true if the client asked for a streaming NDJSON response (?format=ndjson or Accept header)
+
+    Parameters:
+    args (MultiDict): request arguments
+    accept_mimetypes (MIMEAccept): accepted media types of the request
+    '''
+    if args.get(key='format', default='').lower() == 'ndjson':
+        return True
+    return accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+def get_page(args) -> tuple:
+    '''
+    Returns the page size and the cursor passed as page[size] and page[after] request parameters
+
+    Parameters:
+    args (MultiDict): request arguments
+
+    Returns:
+    tuple: page size and cursor (or None); page size is None if it's invalid
+    '''
+    size = args.get(key='page[size]', default=PAGE_SIZE, type=int)
+    if size is None or size < 1:
+        return None, None
+    return min(size, MAX_PAGE_SIZE), args.get(key='page[after]')
+
+def page_links(args, path:str, after:str=None) -> dict:
+    '''
+    Returns the links block for a page; the next link is only added if there are more items
+
+    Parameters:
+    args (MultiDict): request arguments
+    path (str): path of the resource, e.g. /nums/
+    after (str): cursor for the next page or None if this is the last page
+
+    Returns:
+    dict: links for the page
+    '''
+    params = args.to_dict()
+    links = {'self': f'{path}?{urlencode(params)}'}
+    if after:
+        params['page[after]'] = after
+        links['next'] = f'{path}?{urlencode(params)}'
+    return links
+
+def get_list_arg(args, key:str, body:dict=None) -> list:
+    '''
+    Returns a list passed as a request parameter; accepts both comma separated values (?tickers=GOOG,MSFT) and
+    repeated keys (?tickers=GOOG&tickers=MSFT) or a list in the JSON body for a POST
+
+    Parameters:
+    args (MultiDict): request arguments
+    key (str): name of the request parameter
+    body (dict): JSON body of a POST or None
+
+    Returns:
+    list: unique values in the order they are passed
+    '''
+    values = []
+    if isinstance(body, dict) and body.get(key):
+        values = body[key] if isinstance(body[key], list) else str(body[key]).split(',')
+    else:
+        for arg in args.getlist(key):
+            values.extend(arg.split(','))
+    return list(dict.fromkeys(value.strip() for value in values if value and value.strip()))
+
+def get_ticker(ticker_cik, ticker:str) -> dict:
+    '''
+    Returns the CIK associate with the stock symbol
+
+    Parameter:
+    ticker_cik (TickerCIK): ticker and CIK lookups
+    ticker (str): the ticker symbol for a stock
+
+    Returns:
+    dict: a dictionary containing attributes for given ticket symbol; none if not found
+    '''
+    try:
+        cik, title = ticker_cik.get(ticker=ticker)
+    except KeyError:
+        return None
+
+    # Create a response dictionary
+    item = {'id' : cik, 'type' : 'cik'}
+    item['attributes'] = {'cik': cik, 'ticker': ticker, 'title': title}
+    return item
+
+# Responses of the routes ---------------------------------------------------------------------------
+
+def tickers_response(ticker_cik, args) -> dict:
+    '''
+    Returns the response for /sec/tickers/: the CIKs of the SYMBOLS
+
+    Parameters:
+    ticker_cik (TickerCIK): ticker and CIK lookups
+    args (MultiDict): request arguments; scope must be Y
+    '''
+    scope = args.get(key='scope')
+    if scope is None:
+        raise ApiError('Scope argument (?scope=Y) is missing')
+    if scope.upper() != 'Y':
+        raise ApiError('Only Y/y is supported for the scope argument')
+
+    # Create a response dictionary
+    res_dict = {'apiVersion': API_VERSION,
+                'data' : {'items': [], 'totalItems':2}}
+    for ticker in AppConfig.SYMBOLS.value:
+        item = get_ticker(ticker_cik, ticker=ticker)
+        if item:
+            # Add the self link
+            item['links'] = {'self': f'/tickers/{ticker}'}
+            res_dict['data']['items'].append(item)
+    return res_dict
+
+def ticker_response(ticker_cik, ticker:str) -> dict:
+    '''
+    Returns the response for /sec/tickers/<ticker>/: the CIK associated with the stock symbol; no data if
+    the ticker is not found
+    '''
+    res_dict = {'apiVersion': API_VERSION, 'method': 'ticker.get', 'params': {'ticker': ticker}, 'data': {}}
+    item = get_ticker(ticker_cik, ticker=ticker)
+    if item:
+        res_dict['data'] = item
+    return res_dict
+
+def cik_response(ticker_cik, cik:int) -> dict:
+    '''
+    Returns the response for /sec/ciks/<cik>/: the ticker symbols associated with a CIK
+    '''
+    try:
+        tickers = ticker_cik.get_tickers(cik=cik)
+    except KeyError:
+        raise ApiError(f'CIK {cik} not found')
+
+    res_dict = {'apiVersion': API_VERSION, 'method': 'ciks.get', 'params': {'cik': cik}, 'data': {}}
+    item = {'id' : cik, 'type' : 'cik'}
+    item['attributes'] = {'cik': cik, 'tickers': tickers, 'title': ticker_cik.get_title(ticker=tickers[0])}
+    item['links'] = {'self': f'/ciks/{cik}', 'tickers': [f'/tickers/{ticker}' for ticker in tickers]}
+    res_dict['data'] = item
+    return res_dict
+
+def sub_response(adsh:str, doc_dict:dict) -> dict:
+    '''
+    Returns the response for /sec/subs/<adsh>/
+
+    Parameters:
+    adsh (str): adsh number
+    doc_dict (dict): SUB document; empty if not found
+    '''
+    if len(doc_dict) == 0:
+        raise ApiError(f'Accession Number {adsh} not found')
+
+    res_dict = {'apiVersion': API_VERSION, 'method': 'subs.get', 'params': {'adsh': adsh}, 'data': {}}
+
+    doc_dict['filed'] = epoch_to_datetime(epoch=doc_dict['filed'])
+    doc_dict['period'] = epoch_to_datetime(epoch=doc_dict['period'])
+    # Accepted needs datetime format
+    doc_dict['accepted'] = epoch_to_datetime(epoch=doc_dict['accepted'], dt_fmt=True)
+
+    item = {'id' : doc_dict.pop('id'), 'type' : 'subs'}
+    item['attributes'] = doc_dict
+    res_dict['data'] = item
+
+    # Use the adsh for the self link
+    res_dict['links'] = {'self': f"/subs/{doc_dict['adsh']}"}
+    return res_dict
+
+def subs_params(args) -> dict:
+    '''
+    Returns the validated request parameters of /sec/subs/
+
+    Parameters:
+    args (MultiDict): request arguments; ticker, year, qtr (year must be specified with qtr) and the page
+
+    Returns:
+    dict: ticker, year, qtr, form, page_size and after
+    '''
+    ticker = args.get(key='ticker')
+    year = args.get(key='year', type=int)
+    qtr = args.get(key='qtr')
+
+    if qtr:
+        if not year:
+            # qtr specified but year missing
+            raise ApiError('Year missing with qtr')
+        # qtr and year specified
+        form = F10Q
+    else:
+        # qtr not specified, assume 10_k
+        form = F10K
+
+    page_size, after = get_page(args)
+    if page_size is None:
+        raise ApiError('Page size must be a positive number')
+    return {'ticker': ticker, 'year': year, 'qtr': qtr, 'form': form, 'page_size': page_size, 'after': after}
+
+def subs_after(params:dict, docs_list:list) -> list:
+    '''
+    Returns the SUBs after the cursor of the request
+
+    Parameters:
+    params (dict): request parameters from subs_params
+    docs_list (list): SUBs found for the ticker
+
+    Returns:
+    list: SUBs after the cursor, or all the SUBs if there is no cursor
+    '''
+    if len(docs_list) == 0:
+        # No SUBS found
+        raise ApiError(f"No SUB found for Ticker {params['ticker']} and for given inputs")
+
+    if params['after']:
+        # Start after the cursor; SUBs are a small list for a ticker
+        ids = [doc['id'] for doc in docs_list]
+        docs_list = docs_list[ids.index(params['after']) + 1:] if params['after'] in ids else []
+    return docs_list
+
+def subs_response(args, params:dict, docs_list:list) -> dict:
+    '''
+    Returns the response for a page of /sec/subs/
+
+    Parameters:
+    args (MultiDict): request arguments
+    params (dict): request parameters from subs_params
+    docs_list (list): SUBs after the cursor, see subs_after
+    '''
+    page_size = params['page_size']
+    # There is a next page if there are more SUBs than the page size
+    next_after = docs_list[page_size - 1]['id'] if len(docs_list) > page_size else None
+    # Create the items from a docs list
+    items = sub_items(docs_list=docs_list[:page_size])
+
+    res_dict = {'apiVersion': API_VERSION, 'method' : 'subs.get', 'params': {'ticker': params['ticker']},
+                'data' : {'items': items, 'totalItems':len(items), 'itemsPerPage': page_size}}
+
+    if params['year']:
+        res_dict['params']['year'] = params['year']
+
+    if params['qtr']:
+        res_dict['params']['qtr'] = params['qtr']
+
+    res_dict['links'] = page_links(args, path='/subs/', after=next_after)
+    return res_dict
+
+def num_response(id:str, doc_dict:dict) -> dict:
+    '''
+    Returns the response for /sec/nums/<id>
+
+    Parameters:
+    id (str): document id
+    doc_dict (dict): NUM document; None or empty if not found
+    '''
+    if not doc_dict:
+        raise ApiError(f'No NUM found for {id}')
+
+    res_dict = {'apiVersion': API_VERSION, 'method' : 'nums.get', 'params': {'id': id}, 'data' : {}}
+
+    doc_dict['ddate'] = epoch_to_datetime(epoch=doc_dict['ddate'])
+    item = {'id' : doc_dict.pop('id'), 'type' : 'nums'}
+    item['attributes'] = doc_dict
+    adsh = doc_dict.pop('adsh')
+    item['relationships'] = {'SUB':{'data': {'type': 'subs', 'id':adsh}, 'links':{'self':f'/subs/{adsh}'}}}
+    res_dict['data'] = item
+    return res_dict
+
+def nums_params(args) -> dict:
+    '''
+    Returns the validated request parameters of /sec/nums/
+
+    Parameters:
+    args (MultiDict): request arguments; ticker, year, tag, qtr (one of QTRS) and the page
+
+    Returns:
+    dict: ticker, year, qtr, tag, form, page_size and after
+    '''
+    ticker = args.get(key='ticker')
+    year = args.get(key='year', type=int)
+    qtr = args.get(key='qtr')
+    tag = args.get(key='tag')
+
+    if qtr:
+        qtr = qtr.upper()
+        if qtr not in QTRS:
+            raise ApiError(f'Invalid quarter, it must be one of {QTRS}')
+        form = F10Q
+    else:
+        form = F10K
+
+    page_size, after = get_page(args)
+    if page_size is None:
+        raise ApiError('Page size must be a positive number')
+    return {'ticker': ticker, 'year': year, 'qtr': qtr, 'tag': tag, 'form': form, 'page_size': page_size,
+            'after': after}
+
+def nums_adsh(params:dict, sub_list:list) -> list:
+    '''
+    Returns the adsh numbers of the SUBs found for /sec/nums/
+    '''
+    if len(sub_list) == 0:
+        # No Submissions found
+        raise ApiError(f"No SUBs found for Ticker {params['ticker']}")
+    return [item['adsh'] for item in sub_list]
+
+def check_nums(params:dict, docs_list:list):
+    '''
+    Raises an ApiError if no NUMs are found for /sec/nums/
+    '''
+    if len(docs_list) == 0:
+        # No Numbers found
+        raise ApiError(f"No tag values found for Ticker {params['ticker']} and {params['tag']} for given inputs")
+
+def nums_response(args, params:dict, docs_list:list) -> dict:
+    '''
+    Returns the response for a page of /sec/nums/
+
+    Parameters:
+    args (MultiDict): request arguments
+    params (dict): request parameters from nums_params
+    docs_list (list): NUMs read for the page; one more than the page size if there is a next page
+    '''
+    check_nums(params, docs_list)
+    page_size = params['page_size']
+
+    # The cursor is the last record read, as the year filter below may drop records
+    next_after = docs_list[page_size - 1]['id'] if len(docs_list) > page_size else None
+
+    # Create the items from a docs list; only the records within the year are selected
+    items = num_items(docs_list=docs_list[:page_size], year=params['year'])
+
+    res_dict = {'apiVersion': API_VERSION, 'method' : 'nums.get',
+                'params': {'ticker': params['ticker'], 'year': params['year'],'form':params['form']},
+                'data' : {'items': items, 'totalItems':len(items), 'itemsPerPage': page_size}}
+    if params['qtr']:
+        res_dict['params']['qtr'] = params['qtr']
+
+    if params['tag']:
+        res_dict['params']['tag'] = params['tag']
+
+    res_dict['links'] = page_links(args, path='/nums/', after=next_after)
+    return res_dict
+
+def batch_params(args, body:dict=None) -> dict:
+    '''
+    Returns the validated request parameters of /sec/batch/nums
+
+    Parameters:
+    args (MultiDict): request arguments
+    body (dict): JSON body of a POST or None
+
+    Returns:
+    dict: tickers, tags, year, qtr and form
+    '''
+    values = body if isinstance(body, dict) else args
+    tickers = [ticker.upper() for ticker in get_list_arg(args, key='tickers', body=body)]
+    tags = get_list_arg(args, key='tags', body=body)
+    year = values.get('year')
+    qtr = values.get('qtr')
+
+    if len(tickers) == 0:
+        raise ApiError('Tickers argument (?tickers=GOOG,MSFT) is missing')
+    if len(tickers) > MAX_BATCH_TICKERS:
+        raise ApiError(f'Too many tickers, the maximum is {MAX_BATCH_TICKERS}')
+    try:
+        year = int(year) if year else None
+    except (TypeError, ValueError):
+        raise ApiError(f'Invalid year {year}')
+
+    if qtr:
+        qtr = qtr.upper()
+        if qtr not in QTRS:
+            raise ApiError(f'Invalid quarter, it must be one of {QTRS}')
+        if not year:
+            raise ApiError('Year missing with qtr')
+        form = F10Q
+    else:
+        form = F10K
+    return {'tickers': tickers, 'tags': tags, 'year': year, 'qtr': qtr, 'form': form}
+
+def adsh_tickers(subs_dict:dict) -> dict:
+    '''
+    Returns adsh -> tickers for the SUBs of the tickers, to add the ticker to the NUM records
+
+    Parameters:
+    subs_dict (dict): ticker -> SUBs
+    '''
+    adsh_dict = {}
+    for ticker, sub_list in subs_dict.items():
+        for item in sub_list:
+            adsh_dict.setdefault(item['adsh'], []).append(ticker)
+    return adsh_dict
+
+def batch_response(params:dict, subs_dict:dict, adsh_dict:dict, nums_list:list) -> dict:
+    '''
+    Returns the response for /sec/batch/nums
+
+    Parameters:
+    params (dict): request parameters from batch_params
+    subs_dict (dict): ticker -> SUBs
+    adsh_dict (dict): adsh -> tickers, see adsh_tickers
+    nums_list (list): NUMs of the adsh numbers
+    '''
+    docs_list = []
+    for doc_dict in nums_list:
+        for ticker in adsh_dict[doc_dict['adsh']]:
+            docs_list.append({'ticker': ticker, **doc_dict})
+    items = num_items(docs_list=docs_list, year=params['year']) if docs_list else []
+
+    res_dict = {'apiVersion': API_VERSION, 'method' : 'batch.nums.get',
+                'params': {'tickers': params['tickers'], 'year': params['year'], 'form': params['form']},
+                'data' : {'items': items, 'totalItems': len(items)}}
+    if params['qtr']:
+        res_dict['params']['qtr'] = params['qtr']
+
+    if params['tags']:
+        res_dict['params']['tags'] = params['tags']
+
+    # Report the tickers without any SUBs rather than failing the batch
+    errors = [{'ticker': ticker, 'error': f'No SUBs found for Ticker {ticker}'}
+              for ticker in params['tickers'] if ticker not in subs_dict]
+    if errors:
+        res_dict['errors'] = errors
+    return res_dict
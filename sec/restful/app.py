@@ -1,120 +1,59 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import itertools
 
-# For DataFrame
-import pandas as pd
-
-import datetime
-
-# Import extensions and constanta
+# Import extensions
 from extensions import sub, num, ticker_cik
-from constants import SubConstants as SubConst, AppConfig
+# JSON:API serialisation
+from serializers import sub_items, num_items, dumps
+# Request validation and responses shared with the ASGI service
+from api_helpers import (NDJSON, ApiError, is_ndjson, tickers_response, ticker_response, cik_response,
+                         sub_response, subs_params, subs_after, subs_response, num_response, nums_params, nums_adsh,
+                         check_nums, nums_response, batch_params, adsh_tickers, batch_response)
 
 # ---------------------------------------------------------------------------------------
-# Constants for Form 10-K and 10-Q
-F10K = SubConst.F10K.value
-F10Q = SubConst.F10Q.value
-
-# Valid quarters
-QTRS = SubConst.QTRS.value
-
-# API version
-API_VERSION = AppConfig.API_VERSION.value
-
 # Initialize Flask App
 app = Flask(__name__)
 app.json.sort_keys = False
 
 # --------------------------------------------------------------------------------------------------
 
-def epoch_to_datetime(epoch:int, dt_fmt:bool=False) -> str:
-    '''
-    Return the formatted datetime string
-
-    Parameters:
-    epoch (int): epoch time
-    dt_fmt (boolean): true if we need the epoch time in datetime format else only in date format
-    '''
-    if dt_fmt:
-        return datetime.datetime.fromtimestamp(epoch/1000, tz=datetime.timezone.utc).strftime(
-            '%Y-%m-%d %H:%M:%S')
-    return datetime.datetime.fromtimestamp(epoch/1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d')
-# --------------------------------------------------------------------------------------------------
-
-def create_df_from_docs(docs_list:list, year:int) -> pd.DataFrame:
+def json_response(res_dict:dict) -> Response:
     '''
-    Returns a DF constructed from the a list of documents
+    Returns a JSON response for a response dictionary; used for the (potentially large) lists of items
     
     Parameters:
-    docs_list (list): a list of documents to construct the DF
-    year (int): the year to filter records
+    res_dict (dict): response dictionary
     
     Returns:
-    pd.DataFrame: a DF created from a list of documents
-
+    Response: a JSON response
     '''
-    # Create a DF using the document list
-    df = pd.DataFrame.from_records(docs_list)
-
-    # We will filter all the records outside the year
-    dt = datetime.datetime(year, 1, 1)
-    # Start of the year - min
-    start_ts = dt.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000
-    dt = datetime.datetime(year, 12, 31)
-    # End of the year - max
-    end_ts = dt.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000
-
-    # Only select records within start_ts and end_ts (inclusive)
-    df_copy = df.query('(ddate >= @start_ts) and (ddate <= @end_ts)').copy()
-    # Convert the date from epoch time
-    df_copy['ddate'] = df_copy['ddate'].apply(epoch_to_datetime)
-    return df_copy
+    return Response(dumps(res_dict), mimetype='application/json')
 
-def get_ticker(ticker:str) -> dict:
+def ndjson_response(items) -> Response:
     '''
-    Returns the CIK associate with the stock symbol
+    Returns a streaming response with one JSON item per line
     
-    Parameter:
-    ticker (str): the ticker symbol for a stock
+    Parameters:
+    items (Iterator): an iterator for the items
     
     Returns:
-    dict: a dictionary containing attributes for given ticket symbol; none if not found
+    Response: a streaming NDJSON response
     '''
-    cik = None
-    try:
-        cik = ticker_cik.get_cik(ticker=ticker)
-    except KeyError:
-        return None
+    return Response(stream_with_context(dumps(item) + b'\n' for item in items), mimetype=NDJSON)
 
-    title = ticker_cik.get_title(ticker=ticker)    
-    # Create a response dictionary
-    item = {'id' : cik, 'type' : 'cik'}
-    item['attributes'] = {'cik': cik, 'ticker': ticker, 'title': title}
-    return item
+@app.errorhandler(ApiError)
+def api_error(error:ApiError):
+    '''
+    Returns the error of an invalid request or no records found
+    '''
+    return jsonify(error.to_dict()), error.status
 
 # End of Helper (Local) Methods --------------------------------------------------------------------
 
 # Start of Web Service Methods ---------------------------------------------------------------------
 @app.route('/sec/tickers/', methods=['GET'])
 def supported_tickers() -> str:
-    args = request.args
-    scope = args.get(key='scope')
-    if scope is None:
-        return jsonify({'error': f'Scope argument (?scope=Y) is missing'}), 404
-    scope = scope.upper()
-
-    if scope != 'Y':
-        return jsonify({'error': f'Only Y/y is supported for the scope argument'}), 404
-
-    # Create a response dictionary
-    res_dict = {'apiVersion': API_VERSION,
-                'data' : {'items': [], 'totalItems':2}}
-    for ticker in AppConfig.SYMBOLS.value:
-        item = get_ticker(ticker=ticker)
-        # Add the self link
-        item['links'] = {'self': f'/tickers/{ticker}'}
-        if item:
-            res_dict['data']['items'].append(item)
-    return jsonify(res_dict)
+    return jsonify(tickers_response(ticker_cik, request.args))
 
 @app.route('/sec/tickers/<string:ticker>/', methods=['GET'])
 def ticker_by_symbol(ticker:str) -> str:
@@ -127,12 +66,20 @@ def ticker_by_symbol(ticker:str) -> str:
     Returns:
     str: CIK associated with given ticket symbol; error if ticker is not found
     '''
-    # Create a response dictionary
-    res_dict = {'apiVersion': API_VERSION, 'method': 'ticker.get', 'params': {'ticker': ticker}, 'data': {}}
-    item = get_ticker(ticker=ticker)
-    if item:
-        res_dict['data'] = item
-    return jsonify(res_dict)
+    return jsonify(ticker_response(ticker_cik, ticker=ticker))
+
+@app.route('/sec/ciks/<int:cik>/', methods=['GET'])
+def tickers_by_cik(cik:int) -> str:
+    '''
+    Returns the ticker symbols associated with a CIK
+    
+    Parameter:
+    cik (int): CIK of the company
+    
+    Returns:
+    str: tickers associated with given CIK; error if CIK is not found
+    '''
+    return jsonify(cik_response(ticker_cik, cik=cik))
 # --------------------------------------------------------------------------------------------------
 
 @app.route('/sec/subs/<string:adsh>/', methods=['GET'])
@@ -147,26 +94,7 @@ def subs_by_adsh(adsh:str) -> str:
     str: SUB associated with given adsh or error if not found
 
     '''
-    doc_dict = sub.get(adsh=adsh)
-    if len(doc_dict) == 0:
-        # Return error if symbol is not found
-        return jsonify({'error': f'Accession Number {adsh} not found'}), 404
-    
-    # Create a response dictionary
-    res_dict = {'apiVersion': API_VERSION, 'method': 'subs.get', 'params': {'adsh': adsh}, 'data': {}}
-    
-    doc_dict['filed'] = epoch_to_datetime(epoch=doc_dict['filed'])
-    doc_dict['period'] = epoch_to_datetime(epoch=doc_dict['period'])
-    # Accepted needs datetime format
-    doc_dict['accepted'] = epoch_to_datetime(epoch=doc_dict['accepted'], dt_fmt=True)
-
-    item = {'id' : doc_dict.pop('id'), 'type' : 'subs'}
-    item['attributes'] = doc_dict
-    res_dict['data'] = item
-
-    # Use the adsh for the self link
-    res_dict['links'] = {'self': f"/subs/{doc_dict['adsh']}"}
-    return jsonify(res_dict)
+    return jsonify(sub_response(adsh, sub.get(adsh=adsh)))
 # --------------------------------------------------------------------------------------------------
 
 @app.route('/sec/subs/', methods=['GET'])
@@ -183,56 +111,15 @@ def subs() -> str:
     str: json response for given parameters; error is returned for (a) if no SUB(s) found for the ticker (b) missing
     year with qtr
     '''
-    args = request.args
-    ticker = args.get(key='ticker')
-    year = args.get(key='year', type=int)
-    qtr = args.get(key='qtr')
-
-    if qtr:
-        if year:
-            # qtr and year specified
-            form = F10Q
-        else:
-            # qtr specified but year missing
-            return jsonify({'error': f'Year missing with qtr'}), 404        
-    else:
-        # qtr not specified, assume 10_k
-        form = F10K
-    
+    params = subs_params(request.args)
     # Use the helper method to get an iterator for submissions
-    docs_list = sub.find(ticker=ticker, year=year, form=form, qtr=qtr)
-
-    if len(docs_list) == 0:
-        # No SUBS found
-        return jsonify({'error': f'No SUB found for Ticker {ticker} and for given inputs'}), 404
-
-    # Create DF from a docs list
-    df = pd.DataFrame.from_records(docs_list)
-    df['filed'] = df['filed'].apply(epoch_to_datetime)
-    df['period'] = df['period'].apply(epoch_to_datetime)
-    # Accepted needs datetime format
-    df['accepted'] = df['accepted'].apply(epoch_to_datetime, dt_fmt=True)
-
-    # Create a response dictionary
-    res_dict = {'apiVersion': API_VERSION, 'method' : 'subs.get', 'params': {'ticker': ticker},
-                'data' : {'items': [], 'totalItems':len(df)}}
-    
-    if year:
-        res_dict['params']['year'] = year
-
-    if qtr:
-        res_dict['params']['qtr'] = qtr
-    
-    for index, row in df.iterrows():
-        row_dict = row.to_dict()
-        item = {'id' : row_dict.pop('id'), 'type' : 'subs'}
-        item['attributes'] = row_dict
+    docs_list = sub.find(ticker=params['ticker'], year=params['year'], form=params['form'], qtr=params['qtr'])
+    docs_list = subs_after(params, docs_list)
 
-        # Use the adsh for the self link
-        item['links'] = {'self': f"/subs/{row_dict['adsh']}"}
-        res_dict['data']['items'].append(item)
-
-    return jsonify(res_dict)
+    if is_ndjson(request.args, request.accept_mimetypes):
+        # No need to page the stream
+        return ndjson_response(sub_items(docs_list=docs_list))
+    return json_response(subs_response(request.args, params, docs_list))
 # --------------------------------------------------------------------------------------------------
 
 @app.route('/sec/nums/<string:id>')
@@ -247,20 +134,7 @@ def nums_by_id(id:str) -> str:
     str: NUM for given document id or error if not found
     
     '''
-    doc_dict = num.get(id=id)
-    if not doc_dict:
-        return jsonify({'error': f'No NUM found for {id}'}), 404
-
-    # Create a response dictionary
-    res_dict = {'apiVersion': API_VERSION, 'method' : 'nums.get', 'params': {'id': id}, 'data' : {}}
-
-    doc_dict['ddate'] = epoch_to_datetime(epoch=doc_dict['ddate'])
-    item = {'id' : doc_dict.pop('id'), 'type' : 'nums'}
-    item['attributes'] = doc_dict
-    adsh = doc_dict.pop('adsh')
-    item['relationships'] = {'SUB':{'data': {'type': 'subs', 'id':adsh}, 'links':{'self':f'/subs/{adsh}'}}}
-    res_dict['data'] = item
-    return jsonify(res_dict)
+    return jsonify(num_response(id, num.get(id=id)))
 
 # --------------------------------------------------------------------------------------------------
 
@@ -279,63 +153,56 @@ def nums() -> str:
     str: json response for given parameters; error is returned for (a) if no sumbmissions found for ticker,
     (b) no tags found, and (c) invalid quarter passed
     '''
-    args = request.args
-    ticker = args.get(key='ticker')
-    year = args.get(key='year', type=int)
-    qtr = args.get(key='qtr')
-    tag = args.get(key='tag')
-
-    if qtr:
-        qtr = qtr.upper()
-        if qtr not in QTRS:
-            return jsonify({'error': f'Invalid quarter, it must be one of {QTRS}'}), 404
-        form = F10Q
-    else:
-        form = F10K
-
-    # Get an iterator to submissions
-    sub_list = sub.find(ticker=ticker, year=year, form=form, qtr=qtr)
-
-    if len(sub_list) == 0:
-        # No Submissions found
-        return jsonify({'error': f'No SUBs found for Ticker {ticker}'}), 404
-    
+    params = nums_params(request.args)
     # Get a list of submission adsh numbers
-    sub_adsh = [item['adsh'] for item in sub_list]
-    docs_list = num.find(adsh_list=sub_adsh, tag=tag)
-    if len(docs_list) == 0:
-        # No Numbers found
-        return jsonify({'error': f'No tag values found for Ticker {ticker} and {tag} for given inputs'}), 404
+    sub_list = sub.find(ticker=params['ticker'], year=params['year'], form=params['form'], qtr=params['qtr'])
+    sub_adsh = nums_adsh(params, sub_list)
+
+    if is_ndjson(request.args, request.accept_mimetypes):
+        # Stream the records page by page, so the memory stays flat for any number of records
+        pages = num.stream(adsh_list=sub_adsh, tag=params['tag'], after=params['after'],
+                           page_size=params['page_size'])
+        first_page = next(pages, [])
+        check_nums(params, first_page)
+
+        def items():
+            for docs_list in itertools.chain([first_page], pages):
+                yield from num_items(docs_list=docs_list, year=params['year'])
+        return ndjson_response(items())
+
+    # Read one extra to find out if there is a next page
+    docs_list = num.find(adsh_list=sub_adsh, tag=params['tag'], after=params['after'],
+                         limit=params['page_size'] + 1)
+    return json_response(nums_response(request.args, params, docs_list))
 
-    # Create DF from a docs list
-    if year:
-        df = create_df_from_docs(docs_list=docs_list, year=year)
-    else:
-        df = pd.DataFrame.from_records(docs_list)
-        df['ddate'] = df['ddate'].apply(epoch_to_datetime)
+# --------------------------------------------------------------------------------------------------
+
+@app.route('/sec/batch/nums', methods=['GET', 'POST'])
+def batch_nums() -> str:
+    '''
+    Returns NUM details for a list of tickers and tags; the SUB lookups for all the tickers and the NUM
+    queries are batched, so a request costs a handful of backend calls rather than two per ticker
     
-    # Create a response dictionary
-    res_dict = {'apiVersion': API_VERSION, 'method' : 'nums.get',
-                'params': {'ticker': ticker, 'year': year,'form':form},
-                'data' : {'items': [], 'totalItems':len(df)}}
-    if qtr:
-        res_dict['params']['qtr'] = qtr
+    Request Parameters (or a JSON body for a POST):
+    tickers (str): comma separated list of ticker symbols
+    tags (str): optional comma separated list of tag names; these must be the exact names, e.g. Assets
+    year (str): optional year for the SUBs
+    qtr (str): optional qtr must be in the form QTRS constant
     
-    if tag:
-        res_dict['params']['tag'] = tag
+    Returns:
+    str: json response for given parameters; tickers without any SUBs are listed in the errors block
+    '''
+    body = request.get_json(silent=True) if request.method == 'POST' else None
+    params = batch_params(request.args, body=body)
 
-    for index, row in df.iterrows():
-        row_dict = row.to_dict()
-        doc_id = row_dict.pop('id')
-        item = {'id' : doc_id, 'type' : 'nums'}
-        item['attributes'] = row_dict
-        item['links'] = {'self': f'/nums/{doc_id}'}
-        adsh = row_dict.pop('adsh')
-        item['relationships'] = {'SUB':{'data': {'type': 'subs', 'id':adsh}, 'links':{'self':f'/subs/{adsh}'}}}
-        res_dict['data']['items'].append(item)
-    return jsonify(res_dict)
+    # One fan-out for the submissions of all the tickers
+    subs_dict = sub.find_many(tickers=params['tickers'], year=params['year'], form=params['form'],
+                              qtr=params['qtr'])
+    adsh_dict = adsh_tickers(subs_dict)
+    nums_list = num.find_many(adsh_list=list(adsh_dict), tags=params['tags']) if adsh_dict else []
+    return json_response(batch_response(params, subs_dict, adsh_dict, nums_list))
 
 # --------------------------------------------------------------------------------------------------
 
 if __name__ == '__main__':
-   app.run(port=5000, debug=True)
\ No newline at end of file
+   app.run(port=5000, debug=True)
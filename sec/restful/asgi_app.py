@@ -0,0 +1,147 @@
+'''
+ASGI variant of the service (see app.py) built with Quart; the routes and the JSON responses are the same.
+The argument validation and the responses are shared with app.py (see api_helpers.py), only the backend calls
+are awaited here, so a worker serves other requests while the queries are in flight and the independent
+queries of a request (CIK chunks, adsh and tag chunks) run together.
+
+hypercorn asgi_app:app --bind 0.0.0.0:5000
+'''
+from quart import Quart, Response, jsonify, request
+
+# Import extensions
+from async_extensions import sub, num, ticker_cik
+# JSON:API serialisation
+from serializers import sub_items, num_items, dumps
+# Request validation and responses shared with the Flask service
+from api_helpers import (NDJSON, ApiError, is_ndjson, tickers_response, ticker_response, cik_response,
+                         sub_response, subs_params, subs_after, subs_response, num_response, nums_params, nums_adsh,
+                         check_nums, nums_response, batch_params, adsh_tickers, batch_response)
+
+# ---------------------------------------------------------------------------------------
+# Initialize Quart App
+app = Quart(__name__)
+app.json.sort_keys = False
+
+# --------------------------------------------------------------------------------------------------
+
+def json_response(res_dict:dict) -> Response:
+    '''
+    Returns a JSON response for a response dictionary; used for the (potentially large) lists of items
+    '''
+    return Response(dumps(res_dict), mimetype='application/json')
+
+def ndjson_response(items) -> Response:
+    '''
+    Returns a streaming response with one JSON item per line
+
+    Parameters:
+    items (AsyncIterator): an async iterator for the items
+
+    Returns:
+    Response: a streaming NDJSON response
+    '''
+    async def lines():
+        async for item in items:
+            yield dumps(item) + b'\n'
+    return Response(lines(), mimetype=NDJSON)
+
+async def iterate(items):
+    '''
+    Returns an async iterator for a list of items
+    '''
+    for item in items:
+        yield item
+
+@app.errorhandler(ApiError)
+async def api_error(error:ApiError):
+    '''
+    Returns the error of an invalid request or no records found
+    '''
+    return jsonify(error.to_dict()), error.status
+
+# End of Helper (Local) Methods --------------------------------------------------------------------
+
+# Start of Web Service Methods; see app.py for the request parameters ------------------------------
+@app.route('/sec/tickers/', methods=['GET'])
+async def supported_tickers() -> str:
+    return jsonify(tickers_response(ticker_cik, request.args))
+
+@app.route('/sec/tickers/<string:ticker>/', methods=['GET'])
+async def ticker_by_symbol(ticker:str) -> str:
+    return jsonify(ticker_response(ticker_cik, ticker=ticker))
+
+@app.route('/sec/ciks/<int:cik>/', methods=['GET'])
+async def tickers_by_cik(cik:int) -> str:
+    return jsonify(cik_response(ticker_cik, cik=cik))
+# --------------------------------------------------------------------------------------------------
+
+@app.route('/sec/subs/<string:adsh>/', methods=['GET'])
+async def subs_by_adsh(adsh:str) -> str:
+    return jsonify(sub_response(adsh, await sub.get(adsh=adsh)))
+# --------------------------------------------------------------------------------------------------
+
+@app.route('/sec/subs/', methods=['GET'])
+async def subs() -> str:
+    params = subs_params(request.args)
+    docs_list = await sub.find(ticker=params['ticker'], year=params['year'], form=params['form'],
+                               qtr=params['qtr'])
+    docs_list = subs_after(params, docs_list)
+
+    if is_ndjson(request.args, request.accept_mimetypes):
+        # No need to page the stream
+        return ndjson_response(iterate(sub_items(docs_list=docs_list)))
+    return json_response(subs_response(request.args, params, docs_list))
+# --------------------------------------------------------------------------------------------------
+
+@app.route('/sec/nums/<string:id>')
+async def nums_by_id(id:str) -> str:
+    return jsonify(num_response(id, await num.get(id=id)))
+
+# --------------------------------------------------------------------------------------------------
+
+@app.route('/sec/nums/')
+async def nums() -> str:
+    params = nums_params(request.args)
+    sub_list = await sub.find(ticker=params['ticker'], year=params['year'], form=params['form'],
+                              qtr=params['qtr'])
+    sub_adsh = nums_adsh(params, sub_list)
+
+    if is_ndjson(request.args, request.accept_mimetypes):
+        # Stream the records page by page, so the memory stays flat for any number of records
+        pages = num.stream(adsh_list=sub_adsh, tag=params['tag'], after=params['after'],
+                           page_size=params['page_size'])
+        first_page = await anext(pages, [])
+        check_nums(params, first_page)
+
+        async def items():
+            for item in num_items(docs_list=first_page, year=params['year']):
+                yield item
+            async for docs_list in pages:
+                for item in num_items(docs_list=docs_list, year=params['year']):
+                    yield item
+        return ndjson_response(items())
+
+    # Read one extra to find out if there is a next page
+    docs_list = await num.find(adsh_list=sub_adsh, tag=params['tag'], after=params['after'],
+                               limit=params['page_size'] + 1)
+    return json_response(nums_response(request.args, params, docs_list))
+
+# --------------------------------------------------------------------------------------------------
+
+@app.route('/sec/batch/nums', methods=['GET', 'POST'])
+async def batch_nums() -> str:
+    body = await request.get_json(silent=True) if request.method == 'POST' else None
+    params = batch_params(request.args, body=body)
+
+    # The CIK chunks are queried together
+    subs_dict = await sub.find_many(tickers=params['tickers'], year=params['year'], form=params['form'],
+                                    qtr=params['qtr'])
+    adsh_dict = adsh_tickers(subs_dict)
+    # The adsh and tag chunks are queried together
+    nums_list = await num.find_many(adsh_list=list(adsh_dict), tags=params['tags']) if adsh_dict else []
+    return json_response(batch_response(params, subs_dict, adsh_dict, nums_list))
+
+# --------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    app.run(port=5000, debug=True)
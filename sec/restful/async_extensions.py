@@ -0,0 +1,38 @@
+'''
+Backends for the ASGI service (asgi_app.py); same as extensions.py (see settings.py), with the Firestore async
+client or the local store run in threads
+'''
+from models import TickerCIK
+from constants import StoreConstants
+from cache import ResponseCache, AsyncCachedSubmission, AsyncCachedNumber
+from settings import CONFIG_PATH, BACKEND, STORE_PATH, CACHE, CACHE_PATH, CACHE_SIZE, CACHE_TTL
+
+ticker_cik = TickerCIK(config_path=CONFIG_PATH)
+
+if BACKEND == StoreConstants.LOCAL.value:
+    from local_store import LocalStore
+    from models import LocalSubmission, LocalNumber
+    from async_models import ThreadedSubmission, ThreadedNumber
+
+    db = LocalStore(store_path=STORE_PATH)
+    sub = ThreadedSubmission(sub=LocalSubmission(db=db, ticker_cik=ticker_cik))
+    num = ThreadedNumber(num=LocalNumber(db=db))
+else:
+    from firestore_db import AsyncFirestore
+    from async_models import AsyncSubmission, AsyncNumber
+
+    db = AsyncFirestore(config_path=CONFIG_PATH)
+    sub = AsyncSubmission(db=db, ticker_cik=ticker_cik)
+    num = AsyncNumber(db=db)
+
+if CACHE:
+    cache = ResponseCache(max_size=CACHE_SIZE, ttl=CACHE_TTL, cache_path=CACHE_PATH)
+    if BACKEND == StoreConstants.LOCAL.value:
+        # Reopen the store in the background when a new dataset is loaded; the responses cached from the
+        # previous snapshot meanwhile are cleared once the new snapshot is published
+        cache.add_listener(db.reload)
+        db.add_listener(cache.clear)
+    sub = AsyncCachedSubmission(sub=sub, cache=cache)
+    num = AsyncCachedNumber(num=num, cache=cache)
+else:
+    cache = None
@@ -0,0 +1,233 @@
+'''
+Async versions of Submission and Number for the ASGI service (asgi_app.py). The queries are the same as
+models.py, but the independent queries (CIK chunks, adsh and tag chunks) are awaited together, so a request
+waits for the slowest query rather than the sum of them and a worker serves other requests meanwhile.
+'''
+# For firebase access
+from google.cloud.firestore_v1.base_query import FieldFilter
+# To run the queries concurrently
+import asyncio
+# To flatten the query results
+import itertools
+# For type hints
+from typing import AsyncIterator, List
+
+from models import Submission, Number, batch_data, F10K, F10Q, READ_LIMIT, IN_LIMIT
+from constants import FirestoreConstants
+
+# ---------------------------------------------------------------------------------------
+# Number of queries in flight for a request
+MAX_ASYNC_QUERIES = FirestoreConstants.MAX_ASYNC_QUERIES.value
+
+# --------------------------------------------------------------------------------------------------
+
+async def to_docs_list(docs) -> list:
+    '''
+    Returns a list of dictionaries for the documents streamed by a query; the doc id is added as id
+    '''
+    docs_list = []
+    async for doc in docs:
+        doc_dict = doc.to_dict()
+        # Add the doc id to the dictionary
+        doc_dict['id'] = doc.id
+        docs_list.append(doc_dict)
+    return docs_list
+
+async def gather_queries(func, args_list:list) -> list:
+    '''
+    Returns the combined results of awaiting func for each item in args_list; at most MAX_ASYNC_QUERIES
+    queries are in flight at a time
+
+    Parameters:
+    func: coroutine function returning a list
+    args_list (list): arguments for each call (a tuple per call)
+
+    Returns:
+    list: results of all the calls in the order of args_list
+    '''
+    semaphore = asyncio.Semaphore(MAX_ASYNC_QUERIES)
+
+    async def run(args:tuple) -> list:
+        async with semaphore:
+            return await func(*args)
+
+    results = await asyncio.gather(*(run(args) for args in args_list))
+    return list(itertools.chain.from_iterable(results))
+
+class AsyncSubmission(Submission):
+    '''
+    Submissions read with the Firestore async client
+    '''
+    async def get(self, adsh:str) -> dict:
+        '''
+        Returns the submissions for acession number
+
+        Parameters:
+        adsh (str): accession number
+
+        Returns:
+        dict: a dictiory for adsh or empty dict if adsh not found
+        '''
+        docs = await self.db.get_sub_collection().where(
+            filter=FieldFilter('adsh', '==', adsh)).get()
+
+        for doc in docs:
+            # Only one item; safe to return
+            doc_dict = doc.to_dict()
+            doc_dict['id'] = doc.id
+            return doc_dict
+        # Return an empty dictionary if symbol is not found
+        return {}
+
+    async def find(self, ticker:str, form:str=F10K, year:int=None, qtr:str=None) -> list:
+        '''
+        Returns the submission(s) for a symbol and given parameters; see Submission.find
+        '''
+        # Check for null value for the ticker
+        assert ticker is not None, 'Ticker must not be null'
+        # The ticker resolution is an in-memory lookup, no need to await
+        try:
+            cik = self.ticker_cik.get_cik(ticker=ticker)
+        except KeyError:
+            return {}
+        self._check_form(form=form, year=year, qtr=qtr)
+        return await self._query_many(ciks=[cik], form=form, year=year, qtr=qtr)
+
+    async def find_many(self, tickers:List[str], form:str=F10K, year:int=None, qtr:str=None) -> dict:
+        '''
+        Returns the submission(s) for a list of symbols and given parameters; see Submission.find_many
+        '''
+        self._check_form(form=form, year=year, qtr=qtr)
+        cik_tickers = self._cik_tickers(tickers=tickers)
+        docs_list = await self._query_many(ciks=list(cik_tickers), form=form, year=year, qtr=qtr)
+        return self._group_by_ticker(cik_tickers=cik_tickers, docs_list=docs_list)
+
+    async def _query_many(self, ciks:List[int], form:str, year:int=None, qtr:str=None) -> list:
+        '''
+        Returns the submission(s) for a list of CIKs; one query is run for each chunk of IN_LIMIT CIKs
+        and the chunks are awaited together
+        '''
+        async def query_chunk(chunk:list) -> list:
+            if len(chunk) == 1:
+                query = self.db.get_sub_collection().where(filter=FieldFilter('cik', '==', chunk[0]))
+            else:
+                query = self.db.get_sub_collection().where(filter=FieldFilter('cik', 'in', chunk))
+            query = query.where(filter=FieldFilter('form', '==', form))
+            if year:
+                query = query.where(filter=FieldFilter('fy', '==', year))
+            if form == F10Q:
+                query = query.where(filter=FieldFilter('fp', '==', qtr))
+            return await to_docs_list(query.stream())
+
+        return await gather_queries(query_chunk, [(chunk,) for chunk in batch_data(ciks, IN_LIMIT)])
+
+class AsyncNumber(Number):
+    '''
+    Numbers read with the Firestore async client
+    '''
+    async def get(self, id:str) -> dict:
+        '''
+        Returns the number as a dictionary for a document id
+
+        Parameters:
+        id (str): document id
+
+        Returns:
+        dict: a dictionary for id or none if no number found for id
+        '''
+        doc = await self.db.get_num_collection().document(id).get()
+        doc_dict = doc.to_dict()
+        if doc_dict:
+            doc_dict['id'] = doc.id
+        return doc_dict
+
+    async def find(self, adsh_list:list, tag:str=None, after:str=None, limit:int=READ_LIMIT) -> list:
+        '''
+        Returns NUM details for a list of adsh numbers and tag (if specified); one query is run for each chunk of
+        IN_LIMIT adsh numbers and the chunks are awaited together, then merged into the first limit records in
+        the order of a single query; see Number.find
+        '''
+        # The cursor is read once for all the chunks
+        cursor = await self.db.get_num_collection().document(after).get() if after else None
+
+        async def query_chunk(adsh_chunk:list) -> list:
+            # Numbers filter on submission adsh
+            query = self.db.get_num_collection().where(filter=FieldFilter('adsh', 'in', adsh_chunk))
+            # Search for the tag if specified
+            if tag:
+                query = query.order_by('tag').start_at({'tag': tag}).end_at({'tag': f'{tag}\uf8ff'})
+            if cursor:
+                # Replaces the start_at; records are ordered by the tag (if specified) and the document id
+                query = query.start_after(cursor)
+            # A chunk can't have more than limit of the first limit records
+            return await to_docs_list(query.limit(limit).stream())
+
+        docs_list = await gather_queries(query_chunk, [(chunk,) for chunk in batch_data(adsh_list, IN_LIMIT)])
+        return self._merge(docs_list, tag=tag, limit=limit)
+
+    async def stream(self, adsh_list:list, tag:str=None, after:str=None,
+                     page_size:int=READ_LIMIT) -> AsyncIterator[list]:
+        '''
+        Returns an async iterator for the pages of NUM details; see Number.stream
+        '''
+        while True:
+            docs_list = await self.find(adsh_list=adsh_list, tag=tag, after=after, limit=page_size)
+            if docs_list:
+                yield docs_list
+            if len(docs_list) < page_size:
+                return
+            after = docs_list[-1]['id']
+
+    async def find_many(self, adsh_list:list, tags:List[str]=None) -> list:
+        '''
+        Returns NUM details for a list of adsh numbers and tags (if specified); the adsh and tag chunks are
+        awaited together, see Number.find_many
+        '''
+        async def query_chunk(adsh_chunk:list, tag_chunk:list) -> list:
+            query = self.db.get_num_collection().where(filter=FieldFilter('adsh', 'in', adsh_chunk))
+            if tag_chunk:
+                query = query.where(filter=FieldFilter('tag', 'in', tag_chunk))
+            return await to_docs_list(query.stream())
+
+        return await gather_queries(query_chunk, self._chunks(adsh_list=adsh_list, tags=tags))
+
+class ThreadedSubmission:
+    '''
+    Runs the methods of a (sync) Submission in a thread, e.g. to serve the local store from the ASGI service
+    '''
+    def __init__(self, sub):
+        self.sub = sub
+
+    async def get(self, adsh:str) -> dict:
+        return await asyncio.to_thread(self.sub.get, adsh=adsh)
+
+    async def find(self, ticker:str, form:str=F10K, year:int=None, qtr:str=None) -> list:
+        return await asyncio.to_thread(self.sub.find, ticker=ticker, form=form, year=year, qtr=qtr)
+
+    async def find_many(self, tickers:List[str], form:str=F10K, year:int=None, qtr:str=None) -> dict:
+        return await asyncio.to_thread(self.sub.find_many, tickers=tickers, form=form, year=year, qtr=qtr)
+
+class ThreadedNumber:
+    '''
+    Runs the methods of a (sync) Number in a thread, e.g. to serve the local store from the ASGI service
+    '''
+    def __init__(self, num):
+        self.num = num
+
+    async def get(self, id:str) -> dict:
+        return await asyncio.to_thread(self.num.get, id=id)
+
+    async def find(self, adsh_list:list, tag:str=None, after:str=None, limit:int=None) -> list:
+        return await asyncio.to_thread(self.num.find, adsh_list=adsh_list, tag=tag, after=after, limit=limit)
+
+    async def find_many(self, adsh_list:list, tags:List[str]=None) -> list:
+        return await asyncio.to_thread(self.num.find_many, adsh_list=adsh_list, tags=tags)
+
+    async def stream(self, adsh_list:list, tag:str=None, after:str=None,
+                     page_size:int=READ_LIMIT) -> AsyncIterator[list]:
+        pages = self.num.stream(adsh_list=adsh_list, tag=tag, after=after, page_size=page_size)
+        while True:
+            docs_list = await asyncio.to_thread(next, pages, None)
+            if docs_list is None:
+                return
+            yield docs_list
@@ -0,0 +1,83 @@
+'''
+Benchmark for the NUM response serialisation; compares the per-row cost of the DataFrame/iterrows
+path (used before serializers.py) with the column-wise path.
+
+python bench_serializers.py --rows 100000
+'''
+import argparse
+import random
+import time
+
+# For DataFrame; only needed for the legacy path
+import pandas as pd
+
+from serializers import epoch_to_datetime, num_items, dumps
+
+# --------------------------------------------------------------------------------------------------
+
+def legacy_num_items(docs_list:list, year:int=None) -> list:
+    '''
+    Returns the JSON:API items for a list of NUM documents, the way app.py used to build them
+    '''
+    df = pd.DataFrame.from_records(docs_list)
+    if year:
+        start_ts = pd.Timestamp(year=year, month=1, day=1).timestamp() * 1000
+        end_ts = pd.Timestamp(year=year, month=12, day=31).timestamp() * 1000
+        df = df.query('(ddate >= @start_ts) and (ddate <= @end_ts)').copy()
+    df['ddate'] = df['ddate'].apply(epoch_to_datetime)
+
+    items = []
+    for index, row in df.iterrows():
+        row_dict = row.to_dict()
+        doc_id = row_dict.pop('id')
+        item = {'id' : doc_id, 'type' : 'nums'}
+        item['attributes'] = row_dict
+        item['links'] = {'self': f'/nums/{doc_id}'}
+        adsh = row_dict.pop('adsh')
+        item['relationships'] = {'SUB':{'data': {'type': 'subs', 'id':adsh}, 'links':{'self':f'/subs/{adsh}'}}}
+        items.append(item)
+    return items
+
+def create_docs(rows:int) -> list:
+    '''
+    Returns a list of synthetic NUM documents
+    '''
+    tags = ['Assets', 'AssetsCurrent', 'Liabilities', 'Revenues', 'NetIncomeLoss', 'EarningsPerShareBasic']
+    docs_list = []
+    for i in range(rows):
+        adsh = f'0001652044-2{i % 4}-{i // 1000:06d}'
+        tag = tags[i % len(tags)]
+        docs_list.append({'adsh': adsh, 'tag': tag, 'version': 'us-gaap/2023',
+                          'ddate': random.randint(1577836800, 1703980800) * 1000, 'qtrs': random.choice([0, 1, 4]),
+                          'uom': 'USD', 'value': random.random() * 1e9, 'dataset': '2023q4',
+                          'id': f'{adsh}_{tag}_{i}'})
+    return docs_list
+
+def run(name:str, func, docs_list:list, year:int=None, repeat:int=3) -> float:
+    '''
+    Returns the best time (seconds) to build and encode the items
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = func(docs_list, year)
+        dumps({'data': {'items': items, 'totalItems': len(items)}})
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:<10} {best * 1000:10.1f} ms {best / len(docs_list) * 1e6:8.2f} us/row')
+    return best
+
+if __name__ == '__main__':
+    # Initialize parser
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--rows', '-r', type=int, default=100_000, help='Number of NUM documents')
+    parser.add_argument('--year', '-y', type=int, default=None, help='Year to filter the documents')
+
+    # Read arguments from command line
+    args = parser.parse_args()
+    docs_list = create_docs(args.rows)
+
+    legacy = run('legacy', legacy_num_items, docs_list, args.year)
+    columns = run('columns', num_items, docs_list, args.year)
+    print(f'Speed up: {legacy / columns:.1f}x')
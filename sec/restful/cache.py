@@ -0,0 +1,341 @@
+'''
+Read-through cache for the SUB and NUM queries. The FSDS data only changes when a new dataset is
+loaded, so the results are cached in-process (LRU with a TTL) and optionally in a shared on-disk tier
+(a sqlite file) so that all the workers share the warm entries. Loading a dataset must call
+invalidate(), which clears both tiers for every worker.
+'''
+# For the in-process LRU
+from collections import OrderedDict
+# To read the on-disk tier off the event loop
+import asyncio
+import threading
+import time
+# For the on-disk tier
+import sqlite3
+import pickle
+# For type hints
+from typing import Callable, Iterator, List
+
+from constants import CacheConstants
+
+# ---------------------------------------------------------------------------------------
+MAX_SIZE = CacheConstants.MAX_SIZE.value
+TTL = CacheConstants.TTL.value
+# How often (seconds) a worker checks whether the cache was invalidated by another process
+GENERATION_CHECK = CacheConstants.GENERATION_CHECK.value
+
+# --------------------------------------------------------------------------------------------------
+
+def copy_value(value):
+    '''
+    Returns a copy of a cached value, so callers can change the documents (e.g. pop the id)
+    '''
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    return value
+
+class DiskCache:
+    def __init__(self, cache_path:str):
+        '''
+        Shared on-disk tier; a sqlite file that can be used by many processes
+
+        Parameters:
+        cache_path (str): path to the sqlite file
+        '''
+        self.cache_path = cache_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.cache_path, timeout=5)
+
+    def get(self, key:str):
+        '''
+        Returns the value for a key or None if not found or expired
+        '''
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key:str, value, ttl:float) -> None:
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                         (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl))
+
+    def generation(self) -> int:
+        '''
+        Returns the generation of the cache; it's incremented each time the cache is invalidated
+        '''
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def clear(self) -> int:
+        '''
+        Removes all the entries and returns the new generation
+        '''
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache')
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            return conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+class ResponseCache:
+    def __init__(self, max_size:int=MAX_SIZE, ttl:float=TTL, cache_path:str=None):
+        '''
+        In-process LRU cache with a TTL and an optional shared on-disk tier
+
+        Parameters:
+        max_size (int): maximum number of entries kept in-process
+        ttl (float): time to live in seconds
+        cache_path (str): path to the sqlite file for the shared tier or None for in-process only
+        '''
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = DiskCache(cache_path) if cache_path else None
+        self.generation = self.disk.generation() if self.disk else 0
+        self.checked = time.monotonic()
+        # Functions to call when the cache is invalidated, e.g. to reopen the local store
+        self.listeners = []
+
+    @staticmethod
+    def make_key(name:str, **params) -> str:
+        '''
+        Returns a normalised key for a query, e.g. subs.find|form=10-K|qtr=|ticker=GOOG|year=2023
+
+        Parameters:
+        name (str): name of the query
+        params: query parameters; the tickers are case insensitive and lists are sorted
+
+        Returns:
+        str: the cache key
+        '''
+        parts = [name]
+        for key in sorted(params):
+            value = params[key]
+            if key in ('ticker', 'tickers'):
+                value = [item.upper() for item in value] if isinstance(value, list) else str(value).upper()
+            if isinstance(value, (list, tuple, set)):
+                value = ','.join(sorted(str(item) for item in value))
+            parts.append(f"{key}={'' if value is None else value}")
+        return '|'.join(parts)
+
+    def add_listener(self, listener:Callable) -> None:
+        self.listeners.append(listener)
+
+    def _check_generation(self) -> None:
+        '''
+        Clears the in-process entries if another process has invalidated the shared tier
+        '''
+        if not self.disk or time.monotonic() - self.checked < GENERATION_CHECK:
+            return
+        self.checked = time.monotonic()
+        generation = self.disk.generation()
+        if generation != self.generation:
+            self.generation = generation
+            self._clear_entries()
+
+    def _clear_entries(self) -> None:
+        self.clear()
+        for listener in self.listeners:
+            listener()
+
+    def clear(self) -> None:
+        '''
+        Removes the in-process entries only, e.g. the ones cached from the local store while it was reopened
+        '''
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, key:str, loader:Callable):
+        '''
+        Returns the cached value for a key; the value is loaded with the loader and cached if not found
+
+        Parameters:
+        key (str): the cache key
+        loader (Callable): function without arguments that returns the value
+
+        Returns:
+        a copy of the cached value
+        '''
+        found, value = self.lookup(key)
+        if not found:
+            value = self.store(key, loader())
+        return copy_value(value)
+
+    async def aget(self, key:str, loader:Callable):
+        '''
+        Same as get for an async loader, i.e. a function without arguments that returns a coroutine; the
+        on-disk tier is read and written in a thread, see run
+        '''
+        found, value = await self.run(self.lookup, key)
+        if not found:
+            value = await self.run(self.store, key, await loader())
+        return copy_value(value)
+
+    async def run(self, func:Callable, *args, **kwargs):
+        '''
+        Runs a function of the cache from a coroutine; in a thread if there is an on-disk tier, as the sqlite
+        queries would block the event loop, else in the event loop as the in-process tier is only a dict lookup
+        '''
+        if self.disk:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def lookup(self, key:str) -> tuple:
+        '''
+        Returns (True, value) if the key is found in either tier else (False, None)
+        '''
+        self._check_generation()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                return True, entry[0]
+
+        value = self.disk.get(key) if self.disk else None
+        if value is None:
+            return False, None
+        self.store(key, value, disk=False)
+        return True, value
+
+    def store(self, key:str, value, disk:bool=True):
+        '''
+        Adds a value to the in-process tier (and the on-disk tier) and returns the value
+        '''
+        if disk and self.disk and value:
+            self.disk.set(key, value, self.ttl)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                # Evict the least recently used
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self) -> None:
+        '''
+        Removes all the entries, e.g. after a new dataset is loaded; other workers sharing the on-disk tier
+        clear their in-process entries within GENERATION_CHECK seconds
+        '''
+        if self.disk:
+            self.generation = self.disk.clear()
+        self._clear_entries()
+
+class CachedSubmission:
+    '''
+    Read-through cache in front of a Submission (or LocalSubmission)
+    '''
+    def __init__(self, sub, cache:ResponseCache):
+        self.sub = sub
+        self.cache = cache
+
+    def get(self, adsh:str) -> dict:
+        key = self.cache.make_key('subs.get', adsh=adsh)
+        return self.cache.get(key, lambda: self.sub.get(adsh=adsh))
+
+    def find(self, ticker:str, form:str, year:int=None, qtr:str=None) -> list:
+        key = self.cache.make_key('subs.find', ticker=ticker, form=form, year=year, qtr=qtr)
+        return self.cache.get(key, lambda: self.sub.find(ticker=ticker, form=form, year=year, qtr=qtr))
+
+    def find_many(self, tickers:List[str], form:str, year:int=None, qtr:str=None) -> dict:
+        # Each ticker is cached on its own, so overlapping batches share the entries; the missing tickers
+        # are looked up together
+        subs_dict, missing = self._cached_many(tickers=tickers, form=form, year=year, qtr=qtr)
+        if missing:
+            found_dict = self.sub.find_many(tickers=missing, form=form, year=year, qtr=qtr)
+            self._store_many(subs_dict, found_dict, missing=missing, form=form, year=year, qtr=qtr)
+        return subs_dict
+
+    def _cached_many(self, tickers:List[str], form:str, year:int=None, qtr:str=None) -> tuple:
+        '''
+        Returns the cached SUB(s) (ticker -> a list of SUB) and a list of tickers not found in the cache
+        '''
+        subs_dict, missing = {}, []
+        for ticker in tickers:
+            key = self.cache.make_key('subs.find', ticker=ticker, form=form, year=year, qtr=qtr)
+            found, docs_list = self.cache.lookup(key)
+            if not found:
+                missing.append(ticker)
+            elif docs_list:
+                subs_dict[ticker] = copy_value(docs_list)
+        return subs_dict, missing
+
+    def _store_many(self, subs_dict:dict, found_dict:dict, missing:List[str], form:str, year:int=None,
+                    qtr:str=None) -> None:
+        '''
+        Caches the SUB(s) found for the missing tickers and adds them to subs_dict
+        '''
+        for ticker in missing:
+            docs_list = found_dict.get(ticker, [])
+            key = self.cache.make_key('subs.find', ticker=ticker, form=form, year=year, qtr=qtr)
+            self.cache.store(key, docs_list)
+            if docs_list:
+                subs_dict[ticker] = copy_value(docs_list)
+
+class CachedNumber:
+    '''
+    Read-through cache in front of a Number (or LocalNumber)
+    '''
+    def __init__(self, num, cache:ResponseCache):
+        self.num = num
+        self.cache = cache
+
+    def get(self, id:str) -> dict:
+        key = self.cache.make_key('nums.get', id=id)
+        return self.cache.get(key, lambda: self.num.get(id=id))
+
+    def find(self, adsh_list:list, tag:str=None, after:str=None, limit:int=None) -> list:
+        key = self.cache.make_key('nums.find', adsh=adsh_list, tag=tag, after=after, limit=limit)
+        return self.cache.get(key, lambda: self.num.find(adsh_list=adsh_list, tag=tag, after=after, limit=limit))
+
+    def find_many(self, adsh_list:list, tags:List[str]=None) -> list:
+        key = self.cache.make_key('nums.find_many', adsh=adsh_list, tags=tags)
+        return self.cache.get(key, lambda: self.num.find_many(adsh_list=adsh_list, tags=tags))
+
+    def stream(self, adsh_list:list, tag:str=None, after:str=None, page_size:int=None) -> Iterator[list]:
+        # Streams are for large results; they are not cached
+        return self.num.stream(adsh_list=adsh_list, tag=tag, after=after, page_size=page_size)
+
+class AsyncCachedSubmission(CachedSubmission):
+    '''
+    Read-through cache in front of an async Submission (see async_models.py)
+    '''
+    async def get(self, adsh:str) -> dict:
+        key = self.cache.make_key('subs.get', adsh=adsh)
+        return await self.cache.aget(key, lambda: self.sub.get(adsh=adsh))
+
+    async def find(self, ticker:str, form:str, year:int=None, qtr:str=None) -> list:
+        key = self.cache.make_key('subs.find', ticker=ticker, form=form, year=year, qtr=qtr)
+        return await self.cache.aget(key, lambda: self.sub.find(ticker=ticker, form=form, year=year, qtr=qtr))
+
+    async def find_many(self, tickers:List[str], form:str, year:int=None, qtr:str=None) -> dict:
+        subs_dict, missing = await self.cache.run(self._cached_many, tickers=tickers, form=form, year=year, qtr=qtr)
+        if missing:
+            found_dict = await self.sub.find_many(tickers=missing, form=form, year=year, qtr=qtr)
+            await self.cache.run(self._store_many, subs_dict, found_dict, missing=missing, form=form, year=year,
+                                 qtr=qtr)
+        return subs_dict
+
+class AsyncCachedNumber(CachedNumber):
+    '''
+    Read-through cache in front of an async Number (see async_models.py)
+    '''
+    async def get(self, id:str) -> dict:
+        key = self.cache.make_key('nums.get', id=id)
+        return await self.cache.aget(key, lambda: self.num.get(id=id))
+
+    async def find(self, adsh_list:list, tag:str=None, after:str=None, limit:int=None) -> list:
+        key = self.cache.make_key('nums.find', adsh=adsh_list, tag=tag, after=after, limit=limit)
+        return await self.cache.aget(key, lambda: self.num.find(adsh_list=adsh_list, tag=tag, after=after, limit=limit))
+
+    async def find_many(self, adsh_list:list, tags:List[str]=None) -> list:
+        key = self.cache.make_key('nums.find_many', adsh=adsh_list, tags=tags)
+        return await self.cache.aget(key, lambda: self.num.find_many(adsh_list=adsh_list, tags=tags))
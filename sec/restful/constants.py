@@ -12,6 +12,62 @@ class AppConfig(Enum):
     API_VERSION = '0.1'
     # Symbols we are interested
     SYMBOLS = ['GOOG','NVDA','ADBE', 'MSFT','AMZN','TSLA','WMT']
+    # Default and maximum number of items in a page (page[size])
+    PAGE_SIZE = 1000
+    MAX_PAGE_SIZE = 10000
+    # Maximum number of tickers in a batch request
+    MAX_BATCH_TICKERS = 1000
 
 class FirestoreConstants(Enum):
     READ_LIMIT = 100
+    # Maximum number of values (disjunctions) for an in filter
+    IN_LIMIT = 30
+    # Number of queries to run concurrently
+    MAX_WORKERS = 8
+    # Number of queries in flight for a request with the async client (see async_models.py)
+    MAX_ASYNC_QUERIES = 32
+    # Maximum number of writes in a batch
+    BATCH_SIZE = 500
+    # Number of batches committed concurrently by the loader (see firestore_load.py)
+    WRITE_WORKERS = 16
+    # Number of attempts to commit a batch
+    WRITE_ATTEMPTS = 5
+    # Collection with a document for each dataset loaded, e.g. 2023q1
+    MANIFEST_COLLECTION = 'datasets'
+
+# Constants for the storage backends
+class StoreConstants(Enum):
+    # Supported backends, selected with the SEC_BACKEND environment variable
+    FIRESTORE = 'firestore'
+    LOCAL = 'local'
+    # Folder with the FSDS downloads, e.g. data/2023q1/sub.txt
+    DATA_PATH = 'data'
+    # Folder with the local columnar store, e.g. store/num/2023q1.arrow
+    STORE_PATH = 'store'
+
+# Constants for the response cache (see cache.py)
+class CacheConstants(Enum):
+    # Maximum number of cached queries per process
+    MAX_SIZE = 1024
+    # Time to live in seconds; the data only changes when a new dataset is loaded
+    TTL = 24 * 60 * 60
+    # Seconds between checks for an invalidation by another process
+    GENERATION_CHECK = 1
+
+# Constants for the SEC Financial Statement Data Sets (FSDS)
+class FSDSConstants(Enum):
+    # List of Submissions fields we are interersted
+    SUB_DTYPES = {'adsh':str,'cik':'int32','name':str,'sic':str,'countryba':str,'fye':str,
+                  'form':str,'period':str,'fy':'str','fp':str,'filed':str,'accepted':str}
+    # List of Numbers fields we are interested
+    # segments and coreg are only read to keep the consolidated records; segments is not in the older datasets
+    NUM_DTYPES = {'adsh':str,'tag':str,'version':str,'ddate':str,'qtrs':'int8','uom':str,'value':str,
+                  'segments':str,'coreg':str}
+    # Forms in scope
+    FORMS_SCOPE = ['10-K', '10-Q']
+    # Taxonomies we are considering
+    TAXONOMIES = ['dei', 'us-gaap']
+    # Qtrs we are interested in
+    QTRS_SCOPE = [0, 1, 4]
+    # Bytes of a num.txt file read (and filtered) at a time
+    BLOCK_SIZE = 64 << 20
@@ -1,11 +1,33 @@
-from firestore_db import Firestore
-from models import Submission, Number, TickerCIK
+from models import TickerCIK
+from constants import StoreConstants
+from cache import ResponseCache, CachedSubmission, CachedNumber
+from settings import CONFIG_PATH, BACKEND, STORE_PATH, CACHE, CACHE_PATH, CACHE_SIZE, CACHE_TTL
 
-# Config path
-CONFIG_PATH = 'config'
+ticker_cik = TickerCIK(config_path=CONFIG_PATH)
 
-db = Firestore(config_path=CONFIG_PATH)
+if BACKEND == StoreConstants.LOCAL.value:
+    from local_store import LocalStore
+    from models import LocalSubmission, LocalNumber
 
-ticker_cik = TickerCIK(config_path=CONFIG_PATH)
-sub = Submission(db=db, ticker_cik=ticker_cik)
-num = Number(db=db)
+    db = LocalStore(store_path=STORE_PATH)
+    sub = LocalSubmission(db=db, ticker_cik=ticker_cik)
+    num = LocalNumber(db=db)
+else:
+    from firestore_db import Firestore
+    from models import Submission, Number
+
+    db = Firestore(config_path=CONFIG_PATH)
+    sub = Submission(db=db, ticker_cik=ticker_cik)
+    num = Number(db=db)
+
+if CACHE:
+    cache = ResponseCache(max_size=CACHE_SIZE, ttl=CACHE_TTL, cache_path=CACHE_PATH)
+    if BACKEND == StoreConstants.LOCAL.value:
+        # Reopen the store in the background when a new dataset is loaded; the responses cached from the
+        # previous snapshot meanwhile are cleared once the new snapshot is published
+        cache.add_listener(db.reload)
+        db.add_listener(cache.clear)
+    sub = CachedSubmission(sub=sub, cache=cache)
+    num = CachedNumber(num=num, cache=cache)
+else:
+    cache = None
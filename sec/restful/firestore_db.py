@@ -2,7 +2,13 @@ import os
 
 # For firebase access
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
+# For the Firestore emulator
+from google.cloud import firestore as gc_firestore
+
+# Set FIRESTORE_EMULATOR_HOST (e.g. localhost:8080) to use the Firestore emulator; no keys are needed
+EMULATOR_HOST = os.environ.get('FIRESTORE_EMULATOR_HOST')
+EMULATOR_PROJECT = os.environ.get('GCLOUD_PROJECT', 'demo-sec')
 
 class Firestore:
     def __init__(self, config_path):
@@ -10,6 +16,10 @@ class Firestore:
         self.connect()
 
     def connect(self):
+        if EMULATOR_HOST:
+            # The client connects to the emulator when FIRESTORE_EMULATOR_HOST is set
+            self.db = gc_firestore.Client(project=EMULATOR_PROJECT)
+            return
         cred = credentials.Certificate(f"{os.path.join(self.config_path,'keys.json')}")
         default_app = firebase_admin.initialize_app(cred)
         self.db = firestore.client()
@@ -23,4 +33,16 @@ class Firestore:
         return self.db.collection('sub')
         
     def get_num_collection(self):
-        return self.db.collection('num')
\ No newline at end of file
+        return self.db.collection('num')
+
+class AsyncFirestore(Firestore):
+    '''
+    Firestore with the async client; used by the ASGI service (asgi_app.py)
+    '''
+    def connect(self):
+        if EMULATOR_HOST:
+            self.db = gc_firestore.AsyncClient(project=EMULATOR_PROJECT)
+            return
+        cred = credentials.Certificate(f"{os.path.join(self.config_path,'keys.json')}")
+        default_app = firebase_admin.initialize_app(cred)
+        self.db = firestore_async.client()
\ No newline at end of file
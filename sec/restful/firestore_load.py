@@ -0,0 +1,283 @@
+'''
+Loads the SEC FSDS datasets (data/2023q1/sub.txt etc) into the Firestore sub and num collections. The load is
+incremental and idempotent:
+- a manifest (the datasets collection) has a document for each dataset loaded with the CIKs loaded (or None for
+  all the CIKs); a dataset is skipped if it has the CIKs requested, else only the missing CIKs are loaded
+- the document ids are deterministic, the adsh for a SUB and adsh_tag_ddate_qtrs_uom for a NUM (see
+  fsds.num_doc_ids), so re-loading a dataset overwrites the same documents rather than adding copies
+- the batches are committed concurrently (WRITE_WORKERS) and a failed batch is retried with a backoff
+
+python firestore_load.py --data data --pattern 2023q*
+
+Set FIRESTORE_EMULATOR_HOST to load into the Firestore emulator.
+'''
+import argparse
+import datetime
+import os
+import random
+import time
+from pathlib import Path
+# To commit the batches concurrently
+from concurrent.futures import ThreadPoolExecutor
+# To read the datasets in the background
+from concurrent.futures import ProcessPoolExecutor
+# To keep a window of datasets read ahead
+from collections import deque
+# For type hints
+from typing import Iterator, List
+
+import pandas as pd
+
+import fsds
+from models import TickerCIK, batch_data
+from constants import AppConfig, FirestoreConstants, StoreConstants
+
+# ---------------------------------------------------------------------------------------
+BATCH_SIZE = FirestoreConstants.BATCH_SIZE.value
+WRITE_WORKERS = FirestoreConstants.WRITE_WORKERS.value
+WRITE_ATTEMPTS = FirestoreConstants.WRITE_ATTEMPTS.value
+MANIFEST_COLLECTION = FirestoreConstants.MANIFEST_COLLECTION.value
+
+# Collection names
+SUB_COLLECTION = 'sub'
+NUM_COLLECTION = 'num'
+
+# --------------------------------------------------------------------------------------------------
+
+def to_records(df:pd.DataFrame) -> List[dict]:
+    '''
+    Returns the records of a DF with Python types, i.e. int, float, str and None for any missing values;
+    no JSON round trip is needed
+
+    Parameters:
+    df (pd.DataFrame): records to convert
+
+    Returns:
+    List[dict]: a dictionary for each record
+    '''
+    df = df.astype(object)
+    return df.where(df.notna(), None).to_dict(orient='records')
+
+def to_documents(df:pd.DataFrame, name:str) -> Iterator[tuple]:
+    '''
+    Returns the (document id, document) pairs for the records of a collection; the ids are deterministic
+
+    Parameters:
+    df (pd.DataFrame): SUB or NUM records read by fsds
+    name (str): collection name
+
+    Returns:
+    Iterator[tuple]: document id and document
+    '''
+    if name == SUB_COLLECTION:
+        ids = df['adsh'].tolist()
+    else:
+        # The id is not a field of the documents
+        ids = df['id'].tolist()
+        df = df.drop(columns=['id'])
+    return zip(ids, to_records(df))
+
+class BulkLoader:
+    def __init__(self, db, max_workers:int=WRITE_WORKERS, batch_size:int=BATCH_SIZE,
+                 attempts:int=WRITE_ATTEMPTS):
+        '''
+        Writes documents in batches; the batches are committed concurrently and retried on failures
+
+        Parameters:
+        db: a Firestore client (or a stand-in with the collection and batch methods)
+        max_workers (int): number of batches committed at a time
+        batch_size (int): number of writes in a batch; at most 500 for Firestore
+        attempts (int): number of attempts to commit a batch
+        '''
+        self.db = db
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.attempts = attempts
+
+    def commit(self, name:str, docs:list) -> int:
+        '''
+        Commits a batch of documents, retrying with an exponential backoff (and jitter) on failures
+
+        Parameters:
+        name (str): collection name
+        docs (list): (document id, document) pairs
+
+        Returns:
+        int: number of documents written
+        '''
+        collection = self.db.collection(name)
+        for attempt in range(1, self.attempts + 1):
+            batch = self.db.batch()
+            for doc_id, doc_dict in docs:
+                batch.set(collection.document(doc_id), doc_dict)
+            try:
+                batch.commit()
+                return len(docs)
+            except Exception as error:
+                if attempt == self.attempts:
+                    raise
+                delay = min(2 ** attempt, 30) * (0.5 + random.random())
+                print(f'Retrying a batch for {name} in {delay:.1f}s: {error}')
+                time.sleep(delay)
+
+    def write(self, name:str, docs:Iterator[tuple]) -> int:
+        '''
+        Writes the documents to a collection; the documents are set, i.e. replaced if they exist
+
+        Parameters:
+        name (str): collection name
+        docs (Iterator[tuple]): (document id, document) pairs
+
+        Returns:
+        int: number of documents written
+        '''
+        batches = list(batch_data(list(docs), self.batch_size))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return sum(executor.map(lambda batch: self.commit(name, batch), batches))
+
+class FirestoreLoader:
+    def __init__(self, db, max_workers:int=WRITE_WORKERS):
+        '''
+        Loads the FSDS datasets to Firestore; see the module docstring
+
+        Parameters:
+        db: a Firestore client (or a stand-in)
+        max_workers (int): number of batches committed at a time
+        '''
+        self.db = db
+        self.writer = BulkLoader(db, max_workers=max_workers)
+
+    def loaded(self) -> dict:
+        '''
+        Returns the datasets in the manifest and their CIKs, e.g. {'2023q1': [320193, 789019], '2023q2': None};
+        None for a dataset loaded for all the CIKs. A dataset added to the manifest without the CIKs has none.
+        '''
+        return {doc.id: doc.to_dict().get('ciks', []) for doc in self.db.collection(MANIFEST_COLLECTION).stream()}
+
+    @staticmethod
+    def missing_ciks(loaded_ciks:List, ciks:List=None) -> List:
+        '''
+        Returns the CIKs of a dataset that are not loaded yet
+
+        Parameters:
+        loaded_ciks (List): CIKs of the dataset in the manifest or None for all the CIKs
+        ciks (List): CIKs we are interested or None for all the CIKs
+
+        Returns:
+        List: CIKs to load, None for all the CIKs or an empty list if the dataset has all the CIKs
+        '''
+        if loaded_ciks is None:
+            return []
+        if ciks is None:
+            return None
+        return sorted(set(ciks) - set(loaded_ciks))
+
+    def load_dataset(self, dataset:str, sub_df:pd.DataFrame, num_df:pd.DataFrame, ciks:List=None) -> None:
+        '''
+        Writes the records of a dataset and adds the dataset to the manifest with the CIKs loaded; the manifest
+        is only updated after all the records are written, so a failed load is simply run again
+
+        Parameters:
+        dataset (str): dataset name, e.g. 2023q1
+        sub_df (pd.DataFrame): submissions of the dataset
+        num_df (pd.DataFrame): numbers of the dataset
+        ciks (List): CIKs the dataset now has, i.e. with any CIKs loaded before, or None for all the CIKs
+        '''
+        start = time.perf_counter()
+        subs = self.writer.write(SUB_COLLECTION, to_documents(sub_df, SUB_COLLECTION))
+        nums = self.writer.write(NUM_COLLECTION, to_documents(num_df, NUM_COLLECTION))
+        self.db.collection(MANIFEST_COLLECTION).document(dataset).set(
+            {'subs': subs, 'nums': nums, 'ciks': None if ciks is None else sorted(ciks),
+             'loaded': datetime.datetime.now(tz=datetime.timezone.utc)})
+        print(f'Loaded {dataset} - {subs} SUBs and {nums} NUMs in {time.perf_counter() - start:.1f}s')
+
+    def load(self, data_path:str, ciks:List=None, pattern:str='20*q*', force:bool=False,
+             processes:int=None) -> List[str]:
+        '''
+        Loads the datasets that are not in the manifest for the CIKs; the next datasets are read in the
+        background while a dataset is written
+
+        Parameters:
+        data_path (str): folder with the FSDS downloads
+        ciks (List): CIKs we are interested or None for all the CIKs
+        pattern (str): glob pattern for the dataset folders, e.g. 2023q*
+        force (bool): true to load the datasets even if they have the CIKs in the manifest
+        processes (int): number of datasets read at a time; at most as many are read ahead of the one written
+
+        Returns:
+        List[str]: datasets loaded
+        '''
+        manifest = self.loaded()
+        # (sub file, CIKs to read, CIKs of the dataset after the load) for each dataset to load
+        jobs = []
+        for file in fsds.dataset_files(data_path, 'sub', pattern):
+            loaded_ciks = manifest.get(file.parent.name, [])
+            read_ciks = ciks if force else self.missing_ciks(loaded_ciks, ciks)
+            if read_ciks is not None and not read_ciks:
+                continue
+            # None if the dataset has all the CIKs after the load
+            dataset_ciks = None if read_ciks is None or loaded_ciks is None else set(loaded_ciks) | set(read_ciks)
+            jobs.append((str(file), read_ciks, dataset_ciks))
+        if not jobs:
+            print('Nothing to load')
+            return []
+
+        processes = processes or os.cpu_count()
+        datasets = []
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Only a window of datasets is read ahead, so the memory is bounded for any number of datasets
+            pending = deque()
+            for sub_file, read_ciks, dataset_ciks in jobs:
+                pending.append((sub_file, dataset_ciks, executor.submit(fsds.read_dataset, sub_file, read_ciks)))
+                if len(pending) <= processes:
+                    continue
+                datasets.append(self._load_next(pending))
+            while pending:
+                datasets.append(self._load_next(pending))
+        return datasets
+
+    def _load_next(self, pending:deque) -> str:
+        '''
+        Writes the first dataset read in the window and returns the dataset name
+        '''
+        sub_file, dataset_ciks, future = pending.popleft()
+        sub_df, num_df = future.result()
+        dataset = Path(sub_file).parent.name
+        self.load_dataset(dataset, sub_df, num_df, ciks=dataset_ciks)
+        return dataset
+
+if __name__ == '__main__':
+    # Initialize parser
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--data', '-d', type=str, default=StoreConstants.DATA_PATH.value,
+                        help='Folder with the FSDS downloads')
+    parser.add_argument('--pattern', '-p', type=str, default='20*q*',
+                        help='Datasets to load, e.g. 2023q*')
+    parser.add_argument('--cik', '-c', type=int, nargs='*',
+                        help='CIKs to load; defaults to the CIKs of the SYMBOLS in constants.py')
+    parser.add_argument('--force', '-f', action='store_true',
+                        help='Load the datasets even if they are in the manifest')
+    parser.add_argument('--workers', '-w', type=int, default=WRITE_WORKERS,
+                        help='Number of batches committed at a time')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of datasets read at a time; defaults to the number of CPUs')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='On-disk response cache (SEC_CACHE_PATH) to invalidate after the load')
+
+    # Read arguments from command line
+    args = parser.parse_args()
+
+    ciks = args.cik
+    if not ciks:
+        ticker_cik = TickerCIK(config_path=AppConfig.CONFIG_PATH.value)
+        ciks = [ticker_cik.get_cik(ticker=ticker) for ticker in AppConfig.SYMBOLS.value]
+
+    from firestore_db import Firestore
+    loader = FirestoreLoader(Firestore(config_path=AppConfig.CONFIG_PATH.value).get_db(), max_workers=args.workers)
+    datasets = loader.load(data_path=args.data, ciks=ciks, pattern=args.pattern, force=args.force,
+                           processes=args.processes)
+    if datasets and args.cache:
+        # The running workers clear their cached responses
+        from cache import ResponseCache
+        ResponseCache(cache_path=args.cache).invalidate()
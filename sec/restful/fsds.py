@@ -0,0 +1,246 @@
+'''
+Helpers to read the SEC Financial Statement Data Sets (FSDS), i.e. the sub.txt and num.txt files
+in the quarterly downloads (data/2023q1/sub.txt etc). The records are shaped the same way as the
+documents stored in Firestore: dates are epoch time in milliseconds and each record carries the
+dataset name, e.g. 2023q1.
+
+load() reads the datasets in parallel, one process per dataset; only the NUM_DTYPES columns of a num.txt
+are parsed and the records are filtered with vectorised membership tests as the file is read.
+'''
+# To access local files
+import os
+from pathlib import Path
+# For DataFrame
+import pandas as pd
+import io
+# To read and filter the num.txt files
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+# For type hints
+from typing import List
+# For regular expression matching
+import re
+# To read the files in parallel
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import FSDSConstants
+
+# ---------------------------------------------------------------------------------------
+SUB_DTYPES = FSDSConstants.SUB_DTYPES.value
+NUM_DTYPES = FSDSConstants.NUM_DTYPES.value
+FORMS_SCOPE = FSDSConstants.FORMS_SCOPE.value
+QTRS_SCOPE = FSDSConstants.QTRS_SCOPE.value
+TAXONOMIES = FSDSConstants.TAXONOMIES.value
+BLOCK_SIZE = FSDSConstants.BLOCK_SIZE.value
+
+# Regular expression to pass taxonomies
+TAX_RE = re.compile(f"({'|'.join(element for element in TAXONOMIES)})/*")
+
+# Options to read the NUM_DTYPES columns of a num.txt file; the strings are kept as is for pandas
+NUM_SCHEMA = pa.schema([(key, pa.int8() if dtype == 'int8' else pa.string()) for key, dtype in NUM_DTYPES.items()])
+NUM_PARSE = pa_csv.ParseOptions(delimiter='\t')
+NUM_CONVERT = pa_csv.ConvertOptions(include_columns=NUM_SCHEMA.names, column_types=NUM_SCHEMA,
+                                    strings_can_be_null=True, include_missing_columns=True)
+# Columns only used to filter the records
+NUM_FILTER_COLUMNS = ['segments', 'coreg']
+
+# Start of the epoch time
+EPOCH = pd.Timestamp(0)
+
+# --------------------------------------------------------------------------------------------------
+
+def to_epoch_ms(series:pd.Series) -> pd.Series:
+    '''
+    Returns the epoch time in milliseconds for a series of date strings
+
+    Parameters:
+    series (pd.Series): date strings, e.g. 20231231 or 2023-12-31 16:05:00.0
+
+    Returns:
+    pd.Series: epoch time in milliseconds; missing dates are set to NA
+    '''
+    return ((pd.to_datetime(series) - EPOCH) // pd.Timedelta(milliseconds=1)).astype('Int64')
+
+def num_doc_ids(df:pd.DataFrame) -> pd.Series:
+    '''
+    Returns the deterministic document ids for NUM records, i.e. adsh_tag_ddate_qtrs_uom. The / in
+    units such as USD/shares is replaced as it is not allowed in a document id.
+
+    Parameters:
+    df (pd.DataFrame): NUM records with the raw (YYYYMMDD) ddate
+
+    Returns:
+    pd.Series: document ids for the records
+    '''
+    return (df['adsh'] + '_' + df['tag'] + '_' + df['ddate'].astype(str) + '_' +
+            df['qtrs'].astype(str) + '_' + df['uom'].str.replace('/', '-', regex=False))
+
+def dataset_files(data_path:str, name:str, pattern:str='20*q*') -> List[Path]:
+    '''
+    Returns the FSDS files in the data path sorted by the dataset
+
+    Parameters:
+    data_path (str): folder with the FSDS downloads
+    name (str): either sub or num
+    pattern (str): glob pattern for the dataset folders, e.g. 2023q*
+
+    Returns:
+    List[Path]: files found for the datasets
+    '''
+    return sorted(Path(data_path).glob(os.path.join(pattern, f'{name}.*')))
+
+def read_subs(filename:str, ciks:List=None) -> pd.DataFrame:
+    '''
+    Returns the submissions in a sub.txt file
+
+    Parameters:
+    filename (str): path to a sub.txt file, the parent folder is the dataset
+    ciks (List): CIKs we are interested or None for all the CIKs
+
+    Returns:
+    pd.DataFrame: submissions for the forms in scope
+    '''
+    # Derive the dataset based on the filename
+    dataset = Path(filename).parent.name
+    try:
+        # Read data with pandas
+        df = pd.read_csv(filename, sep='\t', dtype=SUB_DTYPES, usecols=SUB_DTYPES.keys())
+    except Exception as error:
+        print("An error occurred:", error, filename)
+        # if this fails create an empty pandas dataframe with the same SUB_DTYPES as the good data
+        df = pd.read_csv(io.StringIO(','.join(SUB_DTYPES.keys())), dtype=SUB_DTYPES)
+
+    # Custom field - adds the dataset name
+    df['dataset'] = dataset
+
+    # Filter out any forms we are not interested for SUB
+    df = df[df['form'].isin(FORMS_SCOPE)]
+    if ciks is not None:
+        df = df[df['cik'].isin(ciks)]
+
+    df = df.copy()
+    # Set columns as per SUBs specification
+    for key in ['period','filed','accepted']:
+        df[key] = to_epoch_ms(df[key])
+    df['sic'] = pd.to_numeric(df['sic'], errors='coerce').astype('Int16')
+    df['fy'] = pd.to_numeric(df['fy'], errors='coerce').astype('Int16')
+    return df.reset_index(drop=True)
+
+def taxonomy_mask(versions:pa.Array) -> pa.Array:
+    '''
+    Returns true for the records with taxonomies in scope; the regular expression is only matched
+    against the unique versions (the dictionary), not every record
+
+    Parameters:
+    versions (pa.Array): version column, e.g. us-gaap/2023
+
+    Returns:
+    pa.Array: a boolean for each record; null for missing versions
+    '''
+    versions = pc.dictionary_encode(versions)
+    # Same as TAX_RE.match, i.e. anchored at the start
+    in_scope = pc.match_substring_regex(versions.dictionary, pattern=f'^{TAX_RE.pattern}')
+    return pc.take(in_scope, versions.indices)
+
+def filter_nums(batch:pa.RecordBatch, sub_adsh:pa.Array) -> pa.RecordBatch:
+    '''
+    Returns the consolidated records (no segments or co-registrant) for the submissions, quarters and
+    taxonomies in scope; the cheap tests run first, so the adsh lookup is only done for the remaining records
+    '''
+    consolidated = pc.and_(pc.is_null(batch['segments']), pc.is_null(batch['coreg']))
+    batch = batch.filter(pc.and_(pc.and_(consolidated,
+                                         pc.is_in(batch['qtrs'], value_set=pa.array(QTRS_SCOPE, pa.int8()))),
+                                 taxonomy_mask(batch['version'])))
+    return batch.filter(pc.is_in(batch['adsh'], value_set=sub_adsh))
+
+def read_nums(filename:str, sub_adsh:List, block_size:int=BLOCK_SIZE) -> pd.DataFrame:
+    '''
+    Returns the consolidated numbers in a num.txt file; only the NUM_DTYPES columns are parsed and the file
+    is read block_size bytes at a time with each block filtered as it's read, so only the records in scope
+    are held in memory and turned into a DataFrame
+
+    Parameters:
+    filename (str): path to a num.txt file, the parent folder is the dataset
+    sub_adsh (List): adsh of the submissions we are interested
+    block_size (int): number of bytes to read at a time
+
+    Returns:
+    pd.DataFrame: numbers for the submissions, quarters and taxonomies in scope
+    '''
+    # Derive the dataset based on the filename
+    dataset = Path(filename).parent.name
+    sub_adsh = pa.array(list(sub_adsh), type=pa.string())
+    batches = []
+    try:
+        # Read data with pyarrow
+        with pa_csv.open_csv(filename, read_options=pa_csv.ReadOptions(block_size=block_size),
+                             parse_options=NUM_PARSE, convert_options=NUM_CONVERT) as reader:
+            for batch in reader:
+                batches.append(filter_nums(batch, sub_adsh))
+    except Exception as error:
+        print("An error occurred:", error, filename)
+        # if this fails create an empty dataframe with the same NUM_DTYPES as the good data
+        batches = []
+    df = pa.Table.from_batches(batches, schema=NUM_SCHEMA).drop_columns(NUM_FILTER_COLUMNS).to_pandas()
+
+    # Custom field - adds the dataset name
+    df['dataset'] = dataset
+    # Document id is derived from the raw values; it is unique for the consolidated records, the records
+    # with segments or a co-registrant would share the id and are filtered out
+    df['id'] = num_doc_ids(df)
+    # Convert value to float
+    df['value'] = pd.to_numeric(df['value'], errors='coerce')
+    # Convert to epoch time
+    df['ddate'] = to_epoch_ms(df['ddate'])
+    return df.reset_index(drop=True)
+
+def add_fy(num_df:pd.DataFrame, sub_df:pd.DataFrame) -> pd.DataFrame:
+    '''
+    Returns the numbers with the fiscal year (fy) of their submission; joined by a merge on adsh
+    '''
+    return num_df.merge(sub_df[['adsh', 'fy']].drop_duplicates(subset='adsh'), on='adsh', how='left')
+
+def read_dataset(sub_file:str, ciks:List=None) -> tuple:
+    '''
+    Returns the submissions and numbers of a dataset; the num.txt is only filtered with the adsh of
+    the submissions in the same dataset
+
+    Parameters:
+    sub_file (str): path to a sub.txt file, e.g. data/2023q1/sub.txt
+    ciks (List): CIKs we are interested or None for all the CIKs
+
+    Returns:
+    tuple: DataFrames for the submissions and the numbers
+    '''
+    sub_df = read_subs(str(sub_file), ciks)
+    num_df = read_nums(str(Path(sub_file).with_name('num.txt')), sub_df['adsh'])
+    return sub_df, num_df
+
+def load(data_path:str, ciks:List=None, pattern:str='20*q*', processes:int=None,
+         with_fy:bool=False) -> tuple:
+    '''
+    Returns the submissions and numbers of the datasets in the data path; each dataset is read in its own process
+
+    Parameters:
+    data_path (str): folder with the FSDS downloads
+    ciks (List): CIKs we are interested or None for all the CIKs
+    pattern (str): glob pattern for the dataset folders, e.g. 2023q*
+    processes (int): number of processes or None for the number of CPUs
+    with_fy (bool): true to add the fiscal year of the submission to the numbers
+
+    Returns:
+    tuple: DataFrames for the submissions and the numbers
+    '''
+    sub_files = [str(file) for file in dataset_files(data_path, 'sub', pattern)]
+    if not sub_files:
+        return pd.DataFrame(columns=[*SUB_DTYPES, 'dataset']), pd.DataFrame(columns=[*NUM_DTYPES, 'dataset', 'id'])
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        frames = list(executor.map(read_dataset, sub_files, [ciks] * len(sub_files)))
+
+    sub_df = pd.concat([sub_df for sub_df, _ in frames], ignore_index=True)
+    num_df = pd.concat([num_df for _, num_df in frames], ignore_index=True)
+    if with_fy:
+        num_df = add_fy(num_df, sub_df)
+    return sub_df, num_df
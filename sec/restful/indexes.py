@@ -0,0 +1,165 @@
+'''
+In-process indexes over the local store tables, built once at startup:
+- SubIndex - a hash index keyed on (cik, form, fy, fp) for submissions
+- NumIndex - the numbers sorted by (adsh, tag) so that a tag prefix query for an adsh is a binary search
+'''
+# To binary search the tag names
+import bisect
+# For type hints
+from typing import List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ---------------------------------------------------------------------------------------
+# Upper bound for a prefix search, same as the one used with Firestore
+PREFIX_END = '\uf8ff'
+
+# --------------------------------------------------------------------------------------------------
+
+def encode(column:pa.ChunkedArray) -> tuple:
+    '''
+    Returns the sorted unique values of a column and the codes of the column values; the order of
+    codes is the same as the order of values
+
+    Parameters:
+    column (pa.ChunkedArray): a string column
+
+    Returns:
+    tuple: a list of sorted unique values and a numpy array of codes
+    '''
+    values = pc.unique(column)
+    values = values.take(pc.sort_indices(values))
+    # Every value is found, so there are no nulls and the codes can be read without a copy
+    codes = pc.index_in(column, value_set=values).combine_chunks().to_numpy()
+    return values.to_pylist(), codes.astype(np.int32)
+
+class SubIndex:
+    def __init__(self, table:pa.Table):
+        '''
+        Builds the hash indexes for the submissions
+
+        Parameters:
+        table (pa.Table): the SUB table
+        '''
+        # (cik, form, fy, fp) -> row positions
+        self.rows = {}
+        # (cik, form) -> (cik, form, fy, fp) keys of the company
+        self.keys = {}
+        # adsh -> row position
+        self.adsh = {}
+        if table.num_rows == 0:
+            return
+
+        columns = [table[name].to_pylist() for name in ['cik', 'form', 'fy', 'fp', 'adsh']]
+        for row, (cik, form, fy, fp, adsh) in enumerate(zip(*columns)):
+            key = (cik, form, fy, fp)
+            if key not in self.rows:
+                self.rows[key] = []
+                self.keys.setdefault((cik, form), []).append(key)
+            self.rows[key].append(row)
+            self.adsh.setdefault(adsh, row)
+
+    def find(self, cik:int, form:str, year:int=None, qtr:str=None) -> List[int]:
+        '''
+        Returns the row positions of the submissions for given parameters
+
+        Parameters:
+        cik (int): CIK of the company
+        form (str): either F10K or F10Q
+        year (int): SUB year or none for all the years
+        qtr (str): fp of the SUB or none for all the periods
+
+        Returns:
+        List[int]: row positions in the SUB table
+        '''
+        rows = []
+        for key in self.keys.get((cik, form), []):
+            _, _, fy, fp = key
+            if (year and fy != year) or (qtr and fp != qtr):
+                continue
+            rows.extend(self.rows[key])
+        return rows
+
+    def get(self, adsh:str) -> int:
+        '''
+        Returns the row position of a submission or None if adsh is not found
+        '''
+        return self.adsh.get(adsh)
+
+class NumIndex:
+    def __init__(self, table:pa.Table):
+        '''
+        Builds the sorted (adsh, tag) index for the numbers
+
+        Parameters:
+        table (pa.Table): the NUM table
+        '''
+        # adsh -> (start, end) range in the sorted order
+        self.ranges = {}
+        self.tags = []
+        self.order = np.empty(0, dtype=np.int64)
+        self.tag_codes = np.empty(0, dtype=np.int32)
+        if table.num_rows == 0:
+            return
+
+        # Sorted tag names; a tag code is the position of the tag in this list
+        self.tags, tag_codes = encode(table['tag'])
+        adsh_values, adsh_codes = encode(table['adsh'])
+
+        # Row positions sorted by adsh and then by tag
+        self.order = np.lexsort((tag_codes, adsh_codes))
+        self.tag_codes = tag_codes[self.order]
+
+        sorted_adsh = adsh_codes[self.order]
+        codes = np.arange(len(adsh_values))
+        starts = np.searchsorted(sorted_adsh, codes, side='left')
+        ends = np.searchsorted(sorted_adsh, codes, side='right')
+        self.ranges = dict(zip(adsh_values, zip(starts.tolist(), ends.tolist())))
+
+    def find(self, adsh_list:list, tag:str=None, exact:bool=False) -> np.ndarray:
+        '''
+        Returns the row positions of the numbers for a list of adsh numbers and tag prefix (if specified)
+
+        Parameters:
+        adsh_list (list): list of adsh numbers to search
+        tag (str): optional tag name; can pass a partial identifier, e.g. Assets
+        exact (bool): true to match the tag name rather than the prefix
+
+        Returns:
+        np.ndarray: row positions in the NUM table, ordered by tag if the tag is specified
+        '''
+        if tag:
+            # Range of tag codes starting with (or equal to) the tag
+            lo = bisect.bisect_left(self.tags, tag)
+            hi = bisect.bisect_right(self.tags, tag) if exact else bisect.bisect_left(self.tags, f'{tag}{PREFIX_END}')
+            if lo == hi:
+                return np.empty(0, dtype=np.int64)
+
+        # Positions in the sorted order for each adsh
+        positions = []
+        # Ignore any duplicates in the list
+        for adsh in dict.fromkeys(adsh_list):
+            if adsh not in self.ranges:
+                continue
+            start, end = self.ranges[adsh]
+            if tag:
+                codes = self.tag_codes[start:end]
+                start, end = start + np.searchsorted(codes, lo), start + np.searchsorted(codes, hi)
+            positions.append(np.arange(start, end))
+
+        if not positions:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate(positions)
+        if tag and len(positions) > 1:
+            # Same order as Firestore, i.e. by tag
+            positions = positions[np.argsort(self.tag_codes[positions], kind='stable')]
+        return self.order[positions]
+
+    def get(self, adsh:str) -> np.ndarray:
+        '''
+        Returns the row positions of the numbers for an adsh
+        '''
+        start, end = self.ranges.get(adsh, (0, 0))
+        return self.order[start:end]
@@ -0,0 +1,249 @@
+'''
+Local columnar store for the SEC FSDS SUB and NUM data. Each dataset (e.g. 2023q1) is saved as an
+Arrow IPC file (store/sub/2023q1.arrow, store/num/2023q1.arrow) which is memory-mapped on open, so
+queries run in-process without any round trips to Firestore. The indexes (see indexes.py) are built
+when the store is opened.
+
+The tables and the indexes are published together as one immutable snapshot; a query takes the snapshot once,
+so a reload (see LocalStore.reload) never pairs a new table with an old index.
+
+To build the store from the FSDS downloads:
+python local_store.py --data data --store store
+'''
+# To access local files
+import os
+from pathlib import Path
+import argparse
+# To reload the store in the background
+import threading
+# To build the datasets in parallel
+from concurrent.futures import ProcessPoolExecutor
+# For type hints
+from typing import Callable, List, NamedTuple
+
+# For Arrow tables
+import pyarrow as pa
+
+from indexes import SubIndex, NumIndex
+from constants import StoreConstants
+
+# ---------------------------------------------------------------------------------------
+# Collection (folder) names
+SUB_COLLECTION = 'sub'
+NUM_COLLECTION = 'num'
+
+# --------------------------------------------------------------------------------------------------
+
+class Snapshot(NamedTuple):
+    '''
+    Tables and indexes of the store at a point in time; never changed once built
+    '''
+    sub: pa.Table
+    num: pa.Table
+    sub_index: SubIndex
+    num_index: NumIndex
+
+    def get_sub_collection(self) -> pa.Table:
+        return self.sub
+
+    def get_num_collection(self) -> pa.Table:
+        return self.num
+
+    def get_sub_index(self) -> SubIndex:
+        return self.sub_index
+
+    def get_num_index(self) -> NumIndex:
+        return self.num_index
+
+class LocalStore:
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.lock = threading.Lock()
+        # A reload is running, and another reload was requested meanwhile
+        self.reloading = False
+        self.pending = False
+        # Functions to call when a new snapshot is published, e.g. to clear the cached responses
+        self.listeners = []
+        self.connect()
+
+    def connect(self):
+        '''
+        Memory-maps the dataset files for the SUB and NUM collections and builds the indexes into a new
+        snapshot, then publishes it; the queries running meanwhile keep the previous snapshot
+        '''
+        sub = self._open(SUB_COLLECTION)
+        num = self._open(NUM_COLLECTION)
+        snapshot = Snapshot(sub=sub, num=num, sub_index=SubIndex(sub), num_index=NumIndex(num))
+        with self.lock:
+            self._snapshot = snapshot
+
+    def snapshot(self) -> Snapshot:
+        '''
+        Returns the current snapshot; take it once for all the lookups of a query
+        '''
+        with self.lock:
+            return self._snapshot
+
+    def add_listener(self, listener:Callable) -> None:
+        self.listeners.append(listener)
+
+    def reload(self) -> None:
+        '''
+        Reopens the store in a background thread, e.g. when a new dataset is loaded, so the request that
+        notices it isn't held up by the index builds; a reload requested while one is running runs after it
+        '''
+        with self.lock:
+            self.pending = True
+            if self.reloading:
+                return
+            self.reloading = True
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self) -> None:
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.reloading = False
+                    return
+                self.pending = False
+            try:
+                self.connect()
+            except Exception as error:
+                print("An error occurred reopening the store:", error, self.store_path)
+                continue
+            for listener in self.listeners:
+                listener()
+
+    def _open(self, name:str) -> pa.Table:
+        '''
+        Returns a table made of the memory-mapped dataset files of a collection
+
+        Parameters:
+        name (str): collection name
+
+        Returns:
+        pa.Table: a table with all the datasets; empty table if no datasets are found
+        '''
+        tables = []
+        for file in sorted(Path(self.store_path, name).glob('*.arrow')):
+            # Zero-copy read; the data stays in the page cache rather than the heap
+            tables.append(pa.ipc.open_file(pa.memory_map(str(file), 'r')).read_all())
+        if not tables:
+            return pa.table({})
+        # Promote the types, e.g. a column with nulls only in one of the datasets
+        return pa.concat_tables(tables, promote_options='default')
+
+    def datasets(self) -> List[str]:
+        '''
+        Returns the datasets in the store, e.g. ['2023q1', '2023q2']
+        '''
+        return sorted(file.stem for file in Path(self.store_path, SUB_COLLECTION).glob('*.arrow'))
+
+    def get_sub_collection(self) -> pa.Table:
+        return self.snapshot().sub
+
+    def get_num_collection(self) -> pa.Table:
+        return self.snapshot().num
+
+    def get_sub_index(self) -> SubIndex:
+        return self.snapshot().sub_index
+
+    def get_num_index(self) -> NumIndex:
+        return self.snapshot().num_index
+
+def write_dataset(df, store_path:str, name:str, dataset:str) -> str:
+    '''
+    Saves a DF as an Arrow IPC file for a dataset; the file is replaced if exists
+
+    Parameters:
+    df (pd.DataFrame): records to save
+    store_path (str): folder for the local store
+    name (str): collection name
+    dataset (str): dataset name, e.g. 2023q1
+
+    Returns:
+    str: file name
+    '''
+    folder = Path(store_path, name)
+    folder.mkdir(parents=True, exist_ok=True)
+    file_name = str(folder / f'{dataset}.arrow')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Write to a temp file and rename so that readers never see a partial file
+    tmp_name = f'{file_name}.tmp'
+    # Uncompressed, as compressed buffers can't be memory-mapped
+    with pa.OSFile(tmp_name, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_name, file_name)
+    return file_name
+
+def build_dataset(sub_file:str, store_path:str, ciks:List=None) -> str:
+    '''
+    Builds the local store files for a dataset; runs in a worker process
+
+    Parameters:
+    sub_file (str): path to a sub.txt file, e.g. data/2023q1/sub.txt
+    store_path (str): folder for the local store
+    ciks (List): CIKs we are interested or None for all the CIKs
+
+    Returns:
+    str: the dataset added to the store
+    '''
+    # Only needed to build the store; keeps pandas out of the service startup
+    import fsds
+
+    dataset = Path(sub_file).parent.name
+    sub_df, num_df = fsds.read_dataset(sub_file, ciks)
+    write_dataset(sub_df, store_path, SUB_COLLECTION, dataset)
+    write_dataset(num_df, store_path, NUM_COLLECTION, dataset)
+    print(f'Saved {dataset} - {len(sub_df)} SUBs and {len(num_df)} NUMs')
+    return dataset
+
+def build(data_path:str, store_path:str, ciks:List=None, pattern:str='20*q*', processes:int=None) -> List[str]:
+    '''
+    Builds the local store from the FSDS sub.txt and num.txt files; the datasets are built in parallel,
+    one process per dataset
+
+    Parameters:
+    data_path (str): folder with the FSDS downloads
+    store_path (str): folder for the local store
+    ciks (List): CIKs we are interested or None for all the CIKs
+    pattern (str): glob pattern for the dataset folders, e.g. 2023q*
+    processes (int): number of processes or None for the number of CPUs
+
+    Returns:
+    List[str]: datasets added to the store
+    '''
+    import fsds
+
+    sub_files = [str(file) for file in fsds.dataset_files(data_path, 'sub', pattern)]
+    if not sub_files:
+        return []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(build_dataset, sub_files, [store_path] * len(sub_files),
+                                 [ciks] * len(sub_files)))
+
+if __name__ == '__main__':
+    # Initialize parser
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--data', '-d', type=str, default=StoreConstants.DATA_PATH.value,
+                        help='Folder with the FSDS downloads')
+    parser.add_argument('--store', '-s', type=str, default=StoreConstants.STORE_PATH.value,
+                        help='Folder for the local store')
+    parser.add_argument('--pattern', '-p', type=str, default='20*q*',
+                        help='Datasets to load, e.g. 2023q*')
+    parser.add_argument('--cik', '-c', type=int, nargs='*', help='CIKs to load; defaults to all')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of datasets to build in parallel; defaults to the number of CPUs')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='On-disk response cache (SEC_CACHE_PATH) to invalidate after the load')
+
+    # Read arguments from command line
+    args = parser.parse_args()
+    datasets = build(data_path=args.data, store_path=args.store, ciks=args.cik, pattern=args.pattern,
+                     processes=args.processes)
+    if datasets and args.cache:
+        # The running workers clear their cached responses and reopen the store
+        from cache import ResponseCache
+        ResponseCache(cache_path=args.cache).invalidate()
@@ -1,19 +1,31 @@
 # For firebase access
 from google.cloud.firestore_v1.base_query import FieldFilter
-# For DataFrame
-import pandas as pd
+# For the local columnar store
+import numpy as np
+import pyarrow.compute as pc
 # To read company tickers file json files
 import json
+# For the company tickers snapshot
+import pickle
 # To access datetime
 import datetime
 # To access local files
 import os
+# For type hints
+from typing import Iterator, List
+# To run the queries concurrently
+from concurrent.futures import ThreadPoolExecutor
+# To flatten the query results
+import itertools
 
 from constants import SubConstants as SubConst, FirestoreConstants
 
 # ---------------------------------------------------------------------------------------
 # Read Limit
 READ_LIMIT = FirestoreConstants.READ_LIMIT.value
+# Limits for the batch queries
+IN_LIMIT = FirestoreConstants.IN_LIMIT.value
+MAX_WORKERS = FirestoreConstants.MAX_WORKERS.value
 
 # Constants for Form 10-K and 10-Q
 F10K = SubConst.F10K.value
@@ -24,25 +36,68 @@ QTRS = SubConst.QTRS.value
 
 # --------------------------------------------------------------------------------------------------
 
+def batch_data(iterable, n=1):
+    '''
+    Returns an iterator for the chunks of n items of a list
+    '''
+    l = len(iterable)
+    for ndx in range(0, l, n):
+        yield iterable[ndx:min(ndx + n, l)]
+
+def to_docs_list(docs) -> list:
+    '''
+    Returns a list of dictionaries for the documents returned by a query; the doc id is added as id
+    '''
+    docs_list = []
+    for doc in docs:
+        doc_dict = doc.to_dict()
+        # Add the doc id to the dictionary
+        doc_dict['id'] = doc.id
+        docs_list.append(doc_dict)
+    return docs_list
+
+def run_concurrently(func, args_list:list) -> list:
+    '''
+    Returns the combined results of calling func for each item in args_list, using a thread pool
+
+    Parameters:
+    func: function returning a list
+    args_list (list): arguments for each call (a tuple per call)
+
+    Returns:
+    list: results of all the calls in the order of args_list
+    '''
+    if len(args_list) <= 1:
+        return list(itertools.chain.from_iterable(func(*args) for args in args_list))
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return list(itertools.chain.from_iterable(executor.map(lambda args: func(*args), args_list)))
+
 class TickerCIK:
     def __init__(self, config_path) -> None:
         '''
-        Returns a DataFrame consists of CIK, ticker symbols
-        
-        Returns:
-        pd.DataFrame: a DataFrame consists of CIK, ticker symbols or None for any errors
+        Loads the CIK, ticker symbols mapping from company_tickers.json; a binary snapshot of the mapping
+        (company_tickers.pickle) is saved next to it and used while it's newer than the JSON file
         '''    
         # Specify the full path to load JSON data
         file_name = f"{os.path.join(config_path, 'company_tickers.json')}"
+        snapshot_name = f"{os.path.join(config_path, 'company_tickers.pickle')}"
 
-        # DF to return
-        self.df = pd.DataFrame()    
+        # ticker -> (cik, title)
+        self.tickers = {}
+        # cik -> tickers
+        self.ciks = {}
         try:
+            if self._load_snapshot(file_name, snapshot_name):
+                return
             # Open the file in read mode
             with open(file_name, 'r') as file:
                 # Use json.load() to parse the JSON data from the file
-                self.df = pd.json_normalize(pd.json_normalize(json.load(file), max_level=0).to_numpy()[0])
-                self.df.set_index('ticker',inplace=True)
+                for item in json.load(file).values():
+                    cik = int(item['cik_str'])
+                    ticker = item['ticker'].upper()
+                    self.tickers[ticker] = (cik, item['title'])
+                    self.ciks.setdefault(cik, []).append(ticker)
+            self._save_snapshot(snapshot_name)
         except FileNotFoundError:
             print(f"File '{file_name}' not found.")
         except json.JSONDecodeError as e:
@@ -50,6 +105,43 @@ class TickerCIK:
         except Exception as e:
             print(f"An error occurred: {e}")
 
+    def _load_snapshot(self, file_name:str, snapshot_name:str) -> bool:
+        '''
+        Returns true if the mapping is loaded from the snapshot; the snapshot is ignored if it's older than the JSON file
+        '''
+        try:
+            if os.path.getmtime(snapshot_name) < os.path.getmtime(file_name):
+                return False
+            with open(snapshot_name, 'rb') as file:
+                self.tickers, self.ciks = pickle.load(file)
+            return True
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError):
+            return False
+
+    def _save_snapshot(self, snapshot_name:str) -> None:
+        '''
+        Saves the mapping as a binary snapshot; the service still works if the config folder is read only
+        '''
+        try:
+            tmp_name = f'{snapshot_name}.{os.getpid()}.tmp'
+            with open(tmp_name, 'wb') as file:
+                pickle.dump((self.tickers, self.ciks), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, snapshot_name)
+        except OSError as e:
+            print(f"Unable to save the snapshot: {e}")
+
+    def get(self, ticker:str) -> tuple:
+        '''
+        Returns the CIK and title associated with given ticker or KeyError is thrown if not found
+
+        Parameter:
+        ticker(str): ticker symbol
+
+        Returns:
+        tuple: CIK and title associated with given ticker or KeyError if not found
+        '''
+        return self.tickers[ticker.upper()]
+
     def get_cik(self, ticker:str) -> int:
         '''
         Returns the CIK associated with given ticker or KeyError is thrown if not found
@@ -60,7 +152,7 @@ class TickerCIK:
         Returns:
         CIK associated with given ticker or KeyError if not found
         '''
-        return int(self.df.loc[ticker.upper()]['cik_str'])
+        return self.tickers[ticker.upper()][0]
 
     def get_title(self, ticker:str) -> str:
         '''
@@ -72,7 +164,19 @@ class TickerCIK:
         Returns:
         Ttitle associated with given ticker or KeyError if not found
         '''
-        return self.df.loc[ticker.upper()]['title']
+        return self.tickers[ticker.upper()][1]
+
+    def get_tickers(self, cik:int) -> list:
+        '''
+        Returns the tickers associated with given CIK or KeyError is thrown if not found
+
+        Parameter:
+        cik(int): CIK of the company
+
+        Returns:
+        list: tickers associated with given CIK, e.g. GOOGL and GOOG, or KeyError if not found
+        '''
+        return self.ciks[int(cik)]
 
 class Submission:
     def __init__(self, db, ticker_cik):
@@ -126,9 +230,75 @@ class Submission:
 
         # Set the form depends on the passed period; defaults to 10-K
         assert cik is not None, 'cik must not be null'
+        self._check_form(form=form, year=year, qtr=qtr)
+
+        return self._query(cik=cik, form=form, year=year, qtr=qtr)
+
+    def find_many(self, tickers:List[str], form:str=F10K, year:int=None, qtr:str=None) -> dict:
+        '''
+        Returns the submission(s) for a list of symbols and given parameters; the lookups are batched
+        
+        Parameters:
+        tickers (List[str]): ticket symbols
+        form (str): either F10K or F10Q
+        year (str): SUB year or none to return all SUB(s)
+        qtr (str): SUB for a quarter; qtr must be in the form QTRS constant; if specified, year must be specified
+        
+        Returns:
+        dict: ticker -> a list of SUB for the ticker; tickers without any SUB(s) are not included
+        '''
+        self._check_form(form=form, year=year, qtr=qtr)
+        cik_tickers = self._cik_tickers(tickers=tickers)
+        docs_list = self._query_many(ciks=list(cik_tickers), form=form, year=year, qtr=qtr)
+        return self._group_by_ticker(cik_tickers=cik_tickers, docs_list=docs_list)
+
+    @staticmethod
+    def _check_form(form:str, year:int=None, qtr:str=None) -> None:
+        '''
+        Checks the form, year and quarter of a query
+        '''
         # Must be form 10-K or 10-Q
         assert form in [F10K, F10Q], f'form must be either {F10K} or {F10Q}'
+        if form == F10Q:
+            assert year is not None, f'year is a must for for {F10Q}'
+            assert qtr in QTRS, f'qtr is must be one of {QTRS}'
+
+    def _cik_tickers(self, tickers:List[str]) -> dict:
+        '''
+        Returns CIK -> tickers, more than one ticker can share a CIK, e.g. GOOG and GOOGL; unknown tickers are skipped
+        '''
+        cik_tickers = {}
+        for ticker in tickers:
+            try:
+                cik_tickers.setdefault(self.ticker_cik.get_cik(ticker=ticker), []).append(ticker)
+            except KeyError:
+                continue
+        return cik_tickers
+
+    @staticmethod
+    def _group_by_ticker(cik_tickers:dict, docs_list:list) -> dict:
+        '''
+        Returns ticker -> a list of SUB for the ticker
+        '''
+        subs_dict = {}
+        for doc_dict in docs_list:
+            for ticker in cik_tickers[doc_dict['cik']]:
+                subs_dict.setdefault(ticker, []).append(doc_dict)
+        return subs_dict
 
+    def _query(self, cik:int, form:str, year:int=None, qtr:str=None) -> list:
+        '''
+        Returns the submission(s) for a CIK and given parameters
+        
+        Parameters:
+        cik (int): CIK of the company
+        form (str): either F10K or F10Q
+        year (str): SUB year or none to return all SUB(s)
+        qtr (str): SUB for a quarter; must be specified for F10Q
+        
+        Returns:
+        list: a list of SUB for given parameters
+        '''
         if form == F10K:
             if year:
                 docs = (
@@ -145,9 +315,6 @@ class Submission:
                 )
         else:
             # Form 10_Q
-            assert year is not None, f'year is a must for for {F10Q}'
-            assert qtr in QTRS, f'qtr is must be one of {QTRS}'
-
             docs = (
                 self.db.get_sub_collection().where(
                     filter=FieldFilter('cik', '==', cik)).where(
@@ -165,6 +332,23 @@ class Submission:
 
         return docs_list
 
+    def _query_many(self, ciks:List[int], form:str, year:int=None, qtr:str=None) -> list:
+        '''
+        Returns the submission(s) for a list of CIKs; one query is run for each chunk of IN_LIMIT CIKs
+        and the chunks are run concurrently
+        '''
+        def query_chunk(chunk:list) -> list:
+            query = self.db.get_sub_collection().where(
+                filter=FieldFilter('cik', 'in', chunk)).where(
+                    filter=FieldFilter('form', '==', form))
+            if year:
+                query = query.where(filter=FieldFilter('fy', '==', year))
+            if form == F10Q:
+                query = query.where(filter=FieldFilter('fp', '==', qtr))
+            return to_docs_list(query.stream())
+
+        return run_concurrently(query_chunk, [(chunk,) for chunk in batch_data(ciks, IN_LIMIT)])
+
 class Number:
     def __init__(self, db):
         self.db = db
@@ -185,28 +369,29 @@ class Number:
             doc_dict['id'] = doc.id
         return doc_dict
     
-    def find(self, adsh_list:list, tag:str=None) -> list:
+    def find(self, adsh_list:list, tag:str=None, after:str=None, limit:int=READ_LIMIT) -> list:
         '''
         Returns NUM details for a list of adsh numbers and tag (if specified)
         
         Request Parameters:
         adsh_list (list): list of adsh numbers to search
         tag (str): optional tag name for a tag in a specific taxonomy release; can pass a partial identifier, e.g. Assets.
+        after (str): optional cursor, i.e. the document id of the last record of the previous page
+        limit (int): maximum number of records to return
         
         Returns:
         list: a list of NUM records matching adsh numbers and tag (if specified); an empty list is returned if not found
         '''
+        # Numbers filter on submission adsh
+        query = self.db.get_num_collection().where(filter=FieldFilter('adsh', 'in', adsh_list))
         # Search for the tag if specified
         if tag:
-            docs = (self.db.get_num_collection().where(
-                filter=FieldFilter('adsh', 'in', adsh_list)).order_by('tag').start_at(
-                    {'tag': tag}).end_at({'tag': f'{tag}\uf8ff'}).limit(READ_LIMIT).stream()
-            )
-        else:
-            # Numbers filter on submission adsh
-            docs = (self.db.get_num_collection().where(
-                filter=FieldFilter('adsh', 'in', adsh_list)).limit(READ_LIMIT).stream()
-            )
+            query = query.order_by('tag').start_at({'tag': tag}).end_at({'tag': f'{tag}\uf8ff'})
+        if after:
+            # Replaces the start_at; records are ordered by the tag (if specified) and the document id
+            query = query.start_after(self.db.get_num_collection().document(after).get())
+        docs = query.limit(limit).stream()
+
         # List of documents to process
         docs_list = []
         for doc in docs:
@@ -214,4 +399,230 @@ class Number:
             # Add the doc id to the dictionary
             doc_dict['id'] = doc.id
             docs_list.append(doc_dict)
-        return docs_list
\ No newline at end of file
+        return docs_list
+
+    def stream(self, adsh_list:list, tag:str=None, after:str=None, page_size:int=READ_LIMIT) -> Iterator[list]:
+        '''
+        Returns an iterator for the pages of NUM details for a list of adsh numbers and tag (if specified); only one
+        page is held in memory at a time
+        
+        Request Parameters:
+        adsh_list (list): list of adsh numbers to search
+        tag (str): optional tag name; can pass a partial identifier, e.g. Assets.
+        after (str): optional cursor to start after
+        page_size (int): number of records to read at a time
+        
+        Returns:
+        Iterator[list]: lists of NUM records
+        '''
+        while True:
+            docs_list = self.find(adsh_list=adsh_list, tag=tag, after=after, limit=page_size)
+            if docs_list:
+                yield docs_list
+            if len(docs_list) < page_size:
+                return
+            after = docs_list[-1]['id']
+
+    def find_many(self, adsh_list:list, tags:List[str]=None) -> list:
+        '''
+        Returns NUM details for a list of adsh numbers and tags (if specified); the adsh numbers are chunked so
+        that each query has at most IN_LIMIT disjunctions and the chunks are run concurrently
+        
+        Request Parameters:
+        adsh_list (list): list of adsh numbers to search
+        tags (List[str]): optional list of tag names; unlike find, these are exact names
+        
+        Returns:
+        list: a list of NUM records matching adsh numbers and tags (if specified)
+        '''
+        def query_chunk(adsh_chunk:list, tag_chunk:list) -> list:
+            query = self.db.get_num_collection().where(filter=FieldFilter('adsh', 'in', adsh_chunk))
+            if tag_chunk:
+                query = query.where(filter=FieldFilter('tag', 'in', tag_chunk))
+            return to_docs_list(query.stream())
+
+        return run_concurrently(query_chunk, self._chunks(adsh_list=adsh_list, tags=tags))
+
+    @staticmethod
+    def _chunks(adsh_list:list, tags:List[str]=None) -> list:
+        '''
+        Returns the (adsh chunk, tag chunk) arguments for the find_many queries
+        '''
+        args_list = []
+        for tag_chunk in (batch_data(tags, IN_LIMIT) if tags else [None]):
+            # The number of disjunctions is the product of the in filter sizes
+            size = max(IN_LIMIT // len(tag_chunk), 1) if tag_chunk else IN_LIMIT
+            args_list.extend((adsh_chunk, tag_chunk) for adsh_chunk in batch_data(adsh_list, size))
+        return args_list
+
+    @staticmethod
+    def _merge(docs_list:list, tag:str=None, limit:int=READ_LIMIT) -> list:
+        '''
+        Returns the first limit records of the chunked find queries in the order of a single query, i.e. ordered by
+        the tag (if specified) and the document id
+        '''
+        key = (lambda doc: (doc['tag'], doc['id'])) if tag else (lambda doc: doc['id'])
+        return sorted(docs_list, key=key)[:limit]
+
+class LocalSubmission(Submission):
+    '''
+    Submissions served from the memory-mapped local store (see local_store.py) using the in-process
+    indexes (see indexes.py)
+    '''
+    def get(self, adsh:str) -> dict:
+        '''
+        Returns the submissions for acession number
+        
+        Parameters:
+        adsh (str): accession number
+        
+        Returns:
+        dict: a dictiory for adsh or empty dict if adsh not found
+        '''
+        # One snapshot for the index and the table
+        db = self.db.snapshot()
+        row = db.get_sub_index().get(adsh)
+        if row is None:
+            return {}
+        doc_dict = db.get_sub_collection().slice(row, 1).to_pylist()[0]
+        # The adsh is the document id for a SUB in the local store
+        doc_dict['id'] = doc_dict['adsh']
+        return doc_dict
+
+    def _query(self, cik:int, form:str, year:int=None, qtr:str=None, db=None) -> list:
+        '''
+        Returns the submission(s) for a CIK and given parameters
+        
+        Parameters:
+        cik (int): CIK of the company
+        form (str): either F10K or F10Q
+        year (str): SUB year or none to return all SUB(s)
+        qtr (str): SUB for a quarter; must be specified for F10Q
+        db (Snapshot): snapshot of the store; the current snapshot if None
+        
+        Returns:
+        list: a list of SUB for given parameters
+        '''
+        db = db or self.db.snapshot()
+        rows = db.get_sub_index().find(cik=cik, form=form, year=year, qtr=qtr if form == F10Q else None)
+        if not rows:
+            return []
+        docs_list = db.get_sub_collection().take(rows).to_pylist()
+        for doc_dict in docs_list:
+            doc_dict['id'] = doc_dict['adsh']
+        return docs_list
+
+    def _query_many(self, ciks:List[int], form:str, year:int=None, qtr:str=None) -> list:
+        '''
+        Returns the submission(s) for a list of CIKs; these are index lookups, no need to chunk
+        '''
+        db = self.db.snapshot()
+        return list(itertools.chain.from_iterable(
+            self._query(cik=cik, form=form, year=year, qtr=qtr, db=db) for cik in ciks))
+
+class LocalNumber(Number):
+    '''
+    Numbers served from the memory-mapped local store (see local_store.py) using the in-process
+    indexes (see indexes.py); unlike Firestore, the results are not capped by READ_LIMIT
+    '''
+    def get(self, id:str) -> dict:
+        '''
+        Returns the number as a dictionary for a document id
+        
+        Parameters:
+        id (str): document id
+        
+        Returns:
+        dict: a dictionary for id or none if no number found for id
+        '''
+        db = self.db.snapshot()
+        rows = self._find_rows(db, id)
+        if len(rows) == 0:
+            return None
+        return db.get_num_collection().slice(rows[0], 1).to_pylist()[0]
+
+    @staticmethod
+    def _find_rows(db, id:str) -> np.ndarray:
+        '''
+        Returns the row positions for a document id in a snapshot of the store
+        '''
+        # Document id starts with the adsh, i.e. adsh_tag_ddate_qtrs_uom
+        rows = db.get_num_index().get(id.split('_', 1)[0])
+        if len(rows) == 0:
+            return rows
+        ids = db.get_num_collection()['id'].take(rows)
+        return rows[pc.indices_nonzero(pc.equal(ids, id).combine_chunks()).to_numpy()]
+
+    def find(self, adsh_list:list, tag:str=None, after:str=None, limit:int=None) -> list:
+        '''
+        Returns NUM details for a list of adsh numbers and tag (if specified)
+        
+        Request Parameters:
+        adsh_list (list): list of adsh numbers to search
+        tag (str): optional tag name for a tag in a specific taxonomy release; can pass a partial identifier, e.g. Assets.
+        after (str): optional cursor, i.e. the document id of the last record of the previous page
+        limit (int): maximum number of records to return or None for all the records
+        
+        Returns:
+        list: a list of NUM records matching adsh numbers and tag (if specified); an empty list is returned if not found
+        '''
+        db = self.db.snapshot()
+        rows = self._query(db, adsh_list=adsh_list, tag=tag, after=after)
+        if limit:
+            rows = rows[:limit]
+        if len(rows) == 0:
+            return []
+        return db.get_num_collection().take(rows).to_pylist()
+
+    def stream(self, adsh_list:list, tag:str=None, after:str=None, page_size:int=READ_LIMIT) -> Iterator[list]:
+        '''
+        Returns an iterator for the pages of NUM details for a list of adsh numbers and tag (if specified); only the
+        row positions and one page of records are held in memory at a time
+        
+        Request Parameters:
+        adsh_list (list): list of adsh numbers to search
+        tag (str): optional tag name; can pass a partial identifier, e.g. Assets.
+        after (str): optional cursor to start after
+        page_size (int): number of records to read at a time
+        
+        Returns:
+        Iterator[list]: lists of NUM records
+        '''
+        # The pages are read from the same snapshot as the row positions
+        db = self.db.snapshot()
+        rows = self._query(db, adsh_list=adsh_list, tag=tag, after=after)
+        for start in range(0, len(rows), page_size):
+            yield db.get_num_collection().take(rows[start:start + page_size]).to_pylist()
+
+    def find_many(self, adsh_list:list, tags:List[str]=None) -> list:
+        '''
+        Returns NUM details for a list of adsh numbers and tags (if specified)
+        
+        Request Parameters:
+        adsh_list (list): list of adsh numbers to search
+        tags (List[str]): optional list of tag names; unlike find, these are exact names
+        
+        Returns:
+        list: a list of NUM records matching adsh numbers and tags (if specified)
+        '''
+        db = self.db.snapshot()
+        index = db.get_num_index()
+        if tags:
+            rows = [index.find(adsh_list=adsh_list, tag=tag, exact=True) for tag in dict.fromkeys(tags)]
+            rows = np.concatenate(rows)
+        else:
+            rows = index.find(adsh_list=adsh_list)
+        if len(rows) == 0:
+            return []
+        return db.get_num_collection().take(rows).to_pylist()
+
+    def _query(self, db, adsh_list:list, tag:str=None, after:str=None) -> np.ndarray:
+        '''
+        Returns the row positions of the NUM records for given parameters in a snapshot of the store
+        '''
+        rows = db.get_num_index().find(adsh_list=adsh_list, tag=tag)
+        if after:
+            # Start after the position of the cursor in the results
+            positions = np.flatnonzero(np.isin(rows, self._find_rows(db, after)))
+            rows = rows[positions[-1] + 1:] if len(positions) else rows[:0]
+        return rows
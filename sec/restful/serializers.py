@@ -0,0 +1,151 @@
+'''
+Serialisation of SUB and NUM documents to JSON:API items. The documents are turned into columns
+first, so the epoch time columns are formatted and filtered with vectorised numpy operations and the
+items are built in a single pass without a DataFrame.
+'''
+import datetime
+# For type hints
+from typing import List
+
+import numpy as np
+
+# orjson is optional; falls back to the standard json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import json
+
+# --------------------------------------------------------------------------------------------------
+
+def epoch_to_datetime(epoch:int, dt_fmt:bool=False) -> str:
+    '''
+    Return the formatted datetime string
+
+    Parameters:
+    epoch (int): epoch time
+    dt_fmt (boolean): true if we need the epoch time in datetime format else only in date format
+    '''
+    if dt_fmt:
+        return datetime.datetime.fromtimestamp(epoch/1000, tz=datetime.timezone.utc).strftime(
+            '%Y-%m-%d %H:%M:%S')
+    return datetime.datetime.fromtimestamp(epoch/1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d')
+
+def to_columns(docs_list:list) -> dict:
+    '''
+    Returns the documents as columns
+
+    Parameters:
+    docs_list (list): a list of documents
+
+    Returns:
+    dict: column name -> list of values; None is set for any missing values
+    '''
+    # Union of the keys, in the order they are found
+    keys = dict.fromkeys(key for doc in docs_list for key in doc)
+    return {key: [doc.get(key) for doc in docs_list] for key in keys}
+
+def to_epoch_array(epochs:list) -> np.ndarray:
+    '''
+    Returns the epoch times (milliseconds) as a datetime64 array; missing values are set to NaT
+    '''
+    values = np.asarray(epochs, dtype='float64')
+    dates = np.where(np.isnan(values), 0, values).astype('int64').astype('datetime64[ms]')
+    dates[np.isnan(values)] = np.datetime64('NaT')
+    return dates
+
+def format_epochs(epochs:list, dt_fmt:bool=False) -> List[str]:
+    '''
+    Returns the formatted datetime strings for a list of epoch times
+
+    Parameters:
+    epochs (list): epoch times in milliseconds
+    dt_fmt (boolean): true if we need the epoch time in datetime format else only in date format
+
+    Returns:
+    List[str]: formatted strings; None for any missing values
+    '''
+    if len(epochs) == 0:
+        return []
+    dates = to_epoch_array(epochs)
+    values = np.datetime_as_string(dates, unit='s' if dt_fmt else 'D')
+    if dt_fmt:
+        values = np.char.replace(values, 'T', ' ')
+    values = values.astype(object)
+    values[np.isnat(dates)] = None
+    return values.tolist()
+
+def filter_year(columns:dict, year:int, key:str='ddate') -> dict:
+    '''
+    Returns the columns for the records within a year
+
+    Parameters:
+    columns (dict): column name -> list of values
+    year (int): the year to filter records
+    key (str): the epoch time column to filter
+
+    Returns:
+    dict: columns for the records with key within the start and end of the year (inclusive)
+    '''
+    dates = to_epoch_array(columns[key])
+    # Start and end of the year
+    keep = (dates >= np.datetime64(f'{year}-01-01')) & (dates <= np.datetime64(f'{year}-12-31'))
+    return {name: np.asarray(values, dtype=object)[keep].tolist() for name, values in columns.items()}
+
+def sub_items(docs_list:list) -> list:
+    '''
+    Returns the JSON:API items for a list of SUB documents
+
+    Parameters:
+    docs_list (list): a list of SUB documents
+
+    Returns:
+    list: items for the response
+    '''
+    columns = to_columns(docs_list)
+    for key in ['filed', 'period']:
+        columns[key] = format_epochs(columns[key])
+    # Accepted needs datetime format
+    columns['accepted'] = format_epochs(columns['accepted'], dt_fmt=True)
+
+    ids = columns.pop('id')
+    keys = list(columns)
+    return [
+        {'id': doc_id, 'type': 'subs', 'attributes': dict(zip(keys, values)),
+         'links': {'self': f'/subs/{adsh}'}}
+        for doc_id, adsh, values in zip(ids, columns['adsh'], zip(*columns.values()))
+    ]
+
+def num_items(docs_list:list, year:int=None) -> list:
+    '''
+    Returns the JSON:API items for a list of NUM documents
+
+    Parameters:
+    docs_list (list): a list of NUM documents
+    year (int): the year to filter records or None for all the records
+
+    Returns:
+    list: items for the response
+    '''
+    columns = to_columns(docs_list)
+    if year:
+        columns = filter_year(columns, year)
+    columns['ddate'] = format_epochs(columns['ddate'])
+
+    ids = columns.pop('id')
+    adsh_list = columns.pop('adsh')
+    keys = list(columns)
+    return [
+        {'id': doc_id, 'type': 'nums', 'attributes': dict(zip(keys, values)),
+         'links': {'self': f'/nums/{doc_id}'},
+         'relationships': {'SUB': {'data': {'type': 'subs', 'id': adsh}, 'links': {'self': f'/subs/{adsh}'}}}}
+        for doc_id, adsh, values in zip(ids, adsh_list, zip(*columns.values()))
+    ]
+
+def dumps(res_dict:dict) -> bytes:
+    '''
+    Returns the response dictionary encoded as JSON, using orjson if it's installed
+    '''
+    if orjson:
+        return orjson.dumps(res_dict)
+    return json.dumps(res_dict, separators=(',', ':')).encode('utf-8')
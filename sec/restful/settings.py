@@ -0,0 +1,19 @@
+'''
+Settings of the services (app.py and asgi_app.py), read from the environment
+'''
+import os
+
+from constants import StoreConstants, CacheConstants
+
+# Config path
+CONFIG_PATH = 'config'
+
+# Storage backend; set SEC_BACKEND=local to serve from the local columnar store (see local_store.py)
+BACKEND = os.environ.get('SEC_BACKEND', StoreConstants.FIRESTORE.value)
+# Folder for the local columnar store
+STORE_PATH = os.environ.get('SEC_STORE_PATH', StoreConstants.STORE_PATH.value)
+# Response cache; SEC_CACHE_PATH enables the on-disk tier shared by the workers, SEC_CACHE=off disables it
+CACHE = os.environ.get('SEC_CACHE', 'on') != 'off'
+CACHE_PATH = os.environ.get('SEC_CACHE_PATH')
+CACHE_SIZE = int(os.environ.get('SEC_CACHE_SIZE', CacheConstants.MAX_SIZE.value))
+CACHE_TTL = float(os.environ.get('SEC_CACHE_TTL', CacheConstants.TTL.value))
@@ -0,0 +1,239 @@
+"""
+Fetches the fundamentals of a universe of tickers concurrently for the screeners - a pool of threads with a rate
+limiter shared by all the requests to the same host, retries with jitter, and the symbols that couldn't be fetched
+reported as exclusions (see exclusions.py), same as the key metrics exclusions of the notebooks.
+
+The provider is pluggable; set UNIVERSE_FIXTURES to a folder of saved fundamentals (see FixtureProvider) to run
+the screeners offline.
+
+from universe import fetch_universe
+fundamentals, fetch_ex_df = fetch_universe(SYMBOLS)
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yfinance as yf
+
+import fundamentals as fa
+from exclusions import Exclusions, Reason
+
+# End of imports ----------------------------------------------------
+
+# Constants ---------------------------------------------------------
+
+# Fetches in progress at a time
+WORKERS = 8
+# Requests per second for each host; a fetch makes a request for each statement (3) and for the info, and only
+# for the info if the statements are cached or not needed (see LimitedTicker)
+RATES = {'query2.finance.yahoo.com': 2}
+# Retries for a failed fetch, with exponential backoff (full jitter) from BACKOFF seconds
+RETRIES = 3
+BACKOFF = 1.0
+# Errors that are not retried, e.g. a missing fixture or a ticker without statements
+NOT_RETRIED = (FileNotFoundError, KeyError, fa.NoStatementsError)
+
+# Folder of the saved fundamentals to use instead of Yahoo
+FIXTURES = os.environ.get('UNIVERSE_FIXTURES')
+
+# Metric of the exclusions for the symbols that couldn't be fetched
+FETCH_METRIC = 'Fetch'
+
+# End of Constants ---------------------------------------------------------
+
+class TokenBucket:
+    def __init__(self, rate, period=1):
+        """
+        Token bucket rate limiter shared by the threads
+        :param rate: number of requests per period
+        :param period: period in seconds
+        """
+        self.capacity = rate
+        self.tokens = rate
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits for a token
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+# One limiter for each host, shared by all the requests in the process
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def host_limiter(host, rate=None):
+    """
+    Returns the rate limiter of a host
+    :param host: host name; None for no limit
+    :param rate: requests per second; RATES of the host if None. Only used when the limiter is created
+    :return TokenBucket or None if the host is not limited
+    """
+    rate = rate or RATES.get(host)
+    if host is None or rate is None:
+        return None
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = TokenBucket(rate)
+        return _limiters[host]
+
+class LimitedTicker:
+    # Properties of a yf.Ticker that are read from Yahoo
+    requests = ('income_stmt', 'balance_sheet', 'cash_flow', 'info')
+
+    def __init__(self, symbol, limiter=None):
+        """
+        yf.Ticker that waits for a token of the rate limiter before each request, i.e. the first read of a
+        statement or the info; yfinance keeps what it has read
+        :param symbol: ticker symbol
+        :param limiter: TokenBucket; None for no limit
+        """
+        self._ticker = yf.Ticker(symbol)
+        self._limiter = limiter
+        self._read = set()
+
+    def __getattr__(self, name):
+        if self._limiter is not None and name in self.requests and name not in self._read:
+            self._limiter.acquire()
+            self._read.add(name)
+        return getattr(self._ticker, name)
+
+class YFProvider:
+    host = 'query2.finance.yahoo.com'
+
+    def __init__(self, cache_dir=fa.CACHE_DIR, max_age=fa.CACHE_TTL, info_max_age=fa.INFO_TTL):
+        """
+        Fundamentals from Yahoo, cached on disk; see fundamentals.load
+        :param cache_dir: cache folder
+        :param max_age: seconds the cached statements are used for
+        :param info_max_age: seconds the cached info is used for
+        """
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.info_max_age = info_max_age
+
+    def cached(self, symbol, statements=True):
+        """
+        Returns the cached fundamentals, None if not cached or too old
+        :param symbol: ticker symbol
+        :param statements: false for the info only
+        """
+        if statements:
+            return fa.read_cache(symbol, max_age=self.max_age, cache_dir=self.cache_dir,
+                                 info_max_age=self.info_max_age)
+        info = fa.read_info(symbol, max_age=self.info_max_age, cache_dir=self.cache_dir)
+        return None if info is None else fa.Fundamentals.from_info(symbol, info)
+
+    def fetch(self, symbol, statements=True, limiter=None):
+        """
+        Reads the fundamentals from Yahoo; the statements that are still cached are not read again
+        :param symbol: ticker symbol
+        :param statements: false to read the info only
+        :param limiter: rate limiter taken for each request; None for no limit
+        :return Fundamentals
+        """
+        ticker = LimitedTicker(symbol, limiter)
+        if statements:
+            return fa.load(symbol, max_age=self.max_age, cache_dir=self.cache_dir, ticker=ticker,
+                           info_max_age=self.info_max_age)
+        info = ticker.info
+        fa.save_info(symbol, info, self.cache_dir)
+        return fa.Fundamentals.from_info(symbol, info)
+
+class FixtureProvider:
+    # Not rate limited
+    host = None
+
+    def __init__(self, path):
+        """
+        Fundamentals saved in a folder, e.g. a copy of the fundamentals cache; for running offline
+        :param path: fixtures folder
+        """
+        self.path = path
+
+    def cached(self, symbol, statements=True):
+        if statements:
+            return fa.read_cache(symbol, max_age=None, cache_dir=self.path, info_max_age=None)
+        info = fa.read_info(symbol, max_age=None, cache_dir=self.path)
+        return None if info is None else fa.Fundamentals.from_info(symbol, info)
+
+    def fetch(self, symbol, statements=True, limiter=None):
+        f = self.cached(symbol, statements)
+        if f is None:
+            raise FileNotFoundError(f'No fixture for {symbol} in {self.path}')
+        return f
+
+    @staticmethod
+    def save(fundamentals, path):
+        """
+        Saves the fundamentals as fixtures
+        :param fundamentals: dictionary of symbol -> Fundamentals, e.g. from fetch_universe
+        :param path: fixtures folder
+        """
+        for f in fundamentals.values():
+            f.save(path)
+
+def get_provider():
+    """
+    Returns the fixtures provider if UNIVERSE_FIXTURES is set, or else Yahoo
+    """
+    return FixtureProvider(FIXTURES) if FIXTURES else YFProvider()
+
+def fetch_universe(symbols, provider=None, statements=True, workers=WORKERS, rate=None, retries=RETRIES,
+                   backoff=BACKOFF):
+    """
+    Fetches the fundamentals of the symbols concurrently; the cached fundamentals are not rate limited
+    :param symbols: ticker symbols
+    :param provider: fundamentals provider; see get_provider if None
+    :param statements: false to fetch the info only, e.g. for the dividend scanner
+    :param workers: fetches in progress at a time
+    :param rate: requests per second for the provider's host; RATES if None
+    :param retries: retries for a failed fetch
+    :param backoff: seconds to wait before the first retry; doubled for each retry
+    :return tuple of symbol -> Fundamentals in the order of the symbols, and the exclusions DF for the symbols
+        that couldn't be fetched
+    """
+    provider = provider or get_provider()
+    limiter = host_limiter(provider.host, rate)
+
+    def fetch(symbol):
+        f = provider.cached(symbol, statements)
+        if f is not None:
+            return f
+        for attempt in range(retries + 1):
+            try:
+                # The limiter is taken for each request of the fetch
+                return provider.fetch(symbol, statements, limiter)
+            except NOT_RETRIED:
+                raise
+            except Exception:
+                if attempt == retries:
+                    raise
+            # Full jitter, so the threads don't retry together
+            time.sleep(backoff * 2 ** attempt * random.random())
+
+    fundamentals, exclusions = {}, Exclusions()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {symbol: executor.submit(fetch, symbol) for symbol in dict.fromkeys(symbols)}
+        for symbol, future in futures.items():
+            try:
+                fundamentals[symbol] = future.result()
+            except Exception as e:
+                exclusions.add(symbol, FETCH_METRIC, Reason.FETCH, f'{type(e).__name__}: {e}')
+
+    print(f'Fetched {len(fundamentals)} of {len(futures)} symbols; {len(exclusions)} failed')
+    return fundamentals, exclusions.to_frame()